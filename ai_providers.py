@@ -0,0 +1,193 @@
+"""
+AI providers behind one interface: `await provider.generate(prompt)`
+returns the answer text. HedgedDispatcher calls its providers in order,
+starting the next one when the current ones exceed the latency budget
+(hedge) or fail (fallback), and returns the first answer. Per-provider
+latency and error counts are kept in a ProviderStats.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+import httpx
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_TIMEOUT = 90 # seconds per request
+HEDGE_AFTER = 25 # seconds before the next provider is started alongside
+LATENCY_WINDOW = 200 # recent calls kept per provider for percentiles
+
+DEEPSEEK_URL = "https://api.deepseek.com/chat/completions"
+DEEPSEEK_MODEL = "deepseek-chat"
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_MODEL = "gpt-4o-mini"
+
+
+class ProviderError(Exception):
+    pass
+
+
+class GeminiProvider:
+    """Wraps a google.generativeai GenerativeModel; its blocking call runs in a worker thread."""
+    def __init__(self, model, name="gemini", timeout=PROVIDER_TIMEOUT):
+        self.model = model
+        self.name = name
+        self.timeout = timeout
+
+    async def generate(self, prompt):
+        # A timed-out call can't be interrupted; its thread finishes in the background
+        resp = await asyncio.to_thread(self.model.generate_content, prompt)
+        return resp.text
+
+
+class ChatCompletionsProvider:
+    """OpenAI-compatible chat completions API (OpenAI, DeepSeek)."""
+    def __init__(self, name, url, api_key, model, timeout=PROVIDER_TIMEOUT, client=None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self._client = client
+
+    async def generate(self, prompt):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        resp = await self._client.post(self.url, headers={"Authorization": f"Bearer {self.api_key}"}, json={
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0,
+            "response_format": {"type": "json_object"},
+        })
+        resp.raise_for_status()
+        return resp.json()["choices"][0]["message"]["content"]
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def deepseek_provider(api_key, timeout=PROVIDER_TIMEOUT):
+    return ChatCompletionsProvider("deepseek", DEEPSEEK_URL, api_key, DEEPSEEK_MODEL, timeout)
+
+
+def openai_provider(api_key, timeout=PROVIDER_TIMEOUT):
+    return ChatCompletionsProvider("openai", OPENAI_URL, api_key, OPENAI_MODEL, timeout)
+
+
+class FakeProvider:
+    """
+    Local stand-in for tests and benchmarks: answers `answer` (a string, or
+    a callable taking the prompt) after `delay` seconds, or raises `error`.
+    """
+    def __init__(self, name, answer="{}", delay=0, error=None, timeout=PROVIDER_TIMEOUT):
+        self.name = name
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.timeout = timeout
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        if self.delay: await asyncio.sleep(self.delay)
+        if self.error: raise self.error
+        return self.answer(prompt) if callable(self.answer) else self.answer
+
+
+class ProviderStats:
+    """Call outcomes and recent latencies per provider name."""
+    OUTCOMES = ("ok", "error", "timeout", "cancelled")
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.counts = {}
+        self.latencies = {}
+        self.hedges = 0 # times a second provider was started on the latency budget
+
+    def record(self, name, seconds, outcome):
+        counts = self.counts.setdefault(name, dict.fromkeys(self.OUTCOMES, 0))
+        counts[outcome] += 1
+        if outcome == "ok":
+            self.latencies.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, name, q):
+        values = sorted(self.latencies.get(name, ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def summary(self):
+        return {name: {**counts, "p50": self.percentile(name, 0.5), "p95": self.percentile(name, 0.95)}
+                for name, counts in self.counts.items()}
+
+
+class HedgedDispatcher:
+    """
+    Has the same generate(prompt) interface as a provider. The first
+    provider starts right away; each further one starts when all running
+    calls have exceeded `hedge_after` seconds, or at once when a call fails.
+    The first successful answer wins and the other calls are cancelled.
+    Each call is bounded by its provider's timeout.
+    """
+    def __init__(self, providers, hedge_after=HEDGE_AFTER, stats=None):
+        if not providers:
+            raise ValueError("at least one provider is required")
+        self.providers = list(providers)
+        self.hedge_after = hedge_after
+        self.stats = stats or ProviderStats()
+
+    @property
+    def name(self):
+        return "+".join(p.name for p in self.providers)
+
+    async def aclose(self):
+        for provider in self.providers:
+            close = getattr(provider, "aclose", None)
+            if close: await close()
+
+    async def _call(self, provider, prompt):
+        start = time.perf_counter()
+        try:
+            text = await asyncio.wait_for(provider.generate(prompt), provider.timeout)
+        except asyncio.TimeoutError:
+            self.stats.record(provider.name, time.perf_counter() - start, "timeout")
+            raise ProviderError(f"{provider.name}: timed out after {provider.timeout}s")
+        except asyncio.CancelledError:
+            self.stats.record(provider.name, time.perf_counter() - start, "cancelled")
+            raise
+        except Exception as e:
+            self.stats.record(provider.name, time.perf_counter() - start, "error")
+            raise ProviderError(f"{provider.name}: {e}") from e
+        self.stats.record(provider.name, time.perf_counter() - start, "ok")
+        return text
+
+    async def generate(self, prompt):
+        waiting = list(self.providers)
+        running = {}
+        errors = []
+
+        def launch():
+            provider = waiting.pop(0)
+            running[asyncio.create_task(self._call(provider, prompt))] = provider
+
+        launch()
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, timeout=self.hedge_after if waiting else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.stats.hedges += 1
+                    logger.info(f"Hedging: {running[next(iter(running))].name} over {self.hedge_after}s, starting {waiting[0].name}")
+                    launch()
+                    continue
+                for task in done:
+                    running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(str(task.exception()))
+                if waiting: launch()
+            raise ProviderError("; ".join(errors))
+        finally:
+            for task in running: task.cancel()
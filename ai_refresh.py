@@ -0,0 +1,392 @@
+"""
+AI price refresh pipeline.
+
+Fetches the source pages concurrently (httpx, which python-telegram-bot
+already depends on), splits their text into brand-sized chunks and asks
+the model for structured car/mobile JSON per chunk, MAX_PARALLEL_CHUNKS at
+a time. Each answer is validated against the catalog schema, a failed
+chunk is retried on its own, and the chunks' results are merged. Progress
+is reported through an optional async callback. The model is anything
+with an async generate(prompt) returning the answer text (ai_providers).
+Pages with a registered site parser (site_parsers) are parsed straight
+from their tables; the model is only asked for a group none of whose
+sources parsed. With a SourceCache, fetches are conditional and a group of
+sources whose content is unchanged since its last successful extraction
+is not extracted again.
+"""
+import os
+import re
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+import httpx
+import site_parsers
+from html_text import StreamingTextExtractor
+from prices import parse_price
+
+logger = logging.getLogger(__name__)
+
+# Reference URLs for grounding
+CAR_URL = "https://www.iranjib.ir/showgroup/45/%D9%82%DB%8C%D9%85%D8%AA-%D8%AE%D9%88%D8%AF%D8%B1%D9%88-%D8%AA%D9%88%D9%84%DB%8C%D8%AF-%D8%AF%D8%A7%D8%AE%D9%84/"
+MOBILE_URLS = (
+    "https://www.iranjib.ir/showgroup/28/%D9%82%DB%8C%D9%85%D8%AA-%D8%B1%D9%88%D8%B2-%D9%85%D9%88%D8%A8%D8%A7%DB%8C%D9%84/",
+    "https://torob.com/browse/94/%DA%AF%D9%88%D8%B4%DB%8C-%D9%85%D9%88%D8%A8%D8%A7%DB%8C%D9%84-mobile/?stock_status=new",
+    "https://www.mobile.ir/phones/prices.aspx?terms=&brandid=&provinceid=&duration=1&price_from=-1&price_to=-1&shopid=&pagesize=50&sort=date&dir=desc&submit=%D8%AC%D8%B3%D8%AA%D8%AC%D9%88",
+)
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+FETCH_TIMEOUT = 10
+MAX_CONNECTIONS = 8
+FETCH_ERROR_TEXT = "خطا در دریافت اطلاعات از سایت"
+
+GROUP_LABELS = {"cars": "خودرو", "mobile": "موبایل"}
+
+CAR_TEXT_LIMIT = 150000
+MOBILE_TEXT_LIMIT = 60000
+CHUNK_CHARS = 12000
+MAX_PARALLEL_CHUNKS = 4
+CHUNK_ATTEMPTS = 3
+RETRY_DELAY = 2 # seconds, doubled per attempt
+
+GROUP_FIELDS = {"cars": ("factoryPrice", "marketPrice"), "mobile": ("officialPrice", "marketPrice")}
+# Chunks are cut right before one of these where possible, so a brand's rows stay together
+CAR_BRANDS = ("ایران خودرو", "سایپا", "پارس خودرو", "مدیران خودرو", "کرمان موتور", "بهمن موتور", "فردا موتور",
+              "آرین پارس", "ایران خودرو دیزل", "سایپا دیزل", "راین", "کاسپین", "پژو", "رنو", "کیا", "هیوندای")
+MOBILE_BRANDS = ("Apple", "Samsung", "Xiaomi", "Huawei", "Honor", "Nokia", "Motorola", "Realme", "Poco",
+                 "اپل", "آیفون", "سامسونگ", "شیائومی", "هواوی", "آنر", "نوکیا", "موتورولا", "ریلمی", "پوکو")
+
+
+class SourceCache:
+    """
+    Per-URL ETag/Last-Modified validators, cleaned text, its hash and the
+    site parser's result, and the source hash of the last successful extraction of each group
+    ("cars", "mobile"). Persisted as JSON next to the databases.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.sources = {}
+        self.extracted = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.sources = data.get("sources", {})
+                self.extracted = data.get("extracted", {})
+            except Exception as e:
+                logger.error(f"Error loading source cache ({path}): {e}")
+
+    def request_headers(self, url):
+        entry = self.sources.get(url)
+        headers = {}
+        if entry and entry.get("text") is not None:
+            if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def cached(self, url):
+        entry = self.sources.get(url)
+        return (entry["text"], entry["hash"], entry.get("parsed")) if entry and entry.get("text") is not None else None
+
+    def store(self, url, text, etag=None, last_modified=None, parsed=None):
+        digest = text_hash(text)
+        self.sources[url] = {"etag": etag, "last_modified": last_modified, "hash": digest, "text": text, "parsed": parsed}
+        return digest
+
+    def is_extracted(self, group, digest):
+        return self.extracted.get(group) == digest
+
+    def mark_extracted(self, group, digest):
+        self.extracted[group] = digest
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            temp_file = f"{self.path}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({"sources": self.sources, "extracted": self.extracted}, f, ensure_ascii=False)
+            shutil.move(temp_file, self.path)
+        except Exception as e:
+            logger.error(f"Error saving source cache ({self.path}): {e}")
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def group_hash(digests):
+    return text_hash("|".join(digests))
+
+
+async def report(progress, text):
+    """Sends a progress line; failures (e.g. an unchanged message) never stop the pipeline."""
+    if progress is None:
+        return
+    try:
+        await progress(text)
+    except Exception as e:
+        logger.debug(f"Progress update failed: {e}")
+
+
+def make_client():
+    return httpx.AsyncClient(headers=HEADERS, timeout=FETCH_TIMEOUT, follow_redirects=True,
+                             limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS))
+
+
+async def fetch_text(client, url, limit, cache=None):
+    """
+    Streams the page through StreamingTextExtractor and stops reading once
+    `limit` characters of text are collected, unless the URL has a site
+    parser, which reads the whole page. Returns (text, hash, parsed); hash
+    is None when the fetch failed and nothing is cached, parsed is None
+    without a parser or when its result failed validation. A 304 or a
+    failed fetch falls back to the cache.
+    """
+    headers = cache.request_headers(url) if cache else {}
+    try:
+        async with client.stream("GET", url, headers=headers) as resp:
+            if resp.status_code == 304 and cache and cache.cached(url):
+                logger.info(f"Source not modified: {url}")
+                return cache.cached(url)
+            resp.raise_for_status()
+            extractor = StreamingTextExtractor(limit)
+            parser = site_parsers.parser_for(url)
+            async for chunk in resp.aiter_text():
+                if not extractor.full: extractor.feed(chunk)
+                if parser: parser.feed(chunk)
+                elif extractor.full: break
+            if not extractor.full: extractor.close()
+            text = extractor.text()
+        parsed = None
+        if parser:
+            parser.close()
+            parsed = parser.result()
+        if cache:
+            return text, cache.store(url, text, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), parsed), parsed
+        return text, text_hash(text), parsed
+    except Exception as e:
+        logger.error(f"Error fetching {url}: {e}")
+        if cache and cache.cached(url):
+            return cache.cached(url)
+        return FETCH_ERROR_TEXT, None, None
+
+
+async def fetch_sources(sources, client=None, progress=None, cache=None):
+    """
+    Fetches (url, char limit) sources concurrently over one pooled client;
+    returns (text, hash, parsed) triples in the same order.
+    """
+    own_client = client is None
+    client = client or make_client()
+    done = 0
+    async def fetch(url, limit):
+        nonlocal done
+        result = await fetch_text(client, url, limit, cache)
+        done += 1
+        await report(progress, f"🌐 دریافت منابع ({done}/{len(sources)})...")
+        return result
+    try:
+        return await asyncio.gather(*(fetch(url, limit) for url, limit in sources))
+    finally:
+        if own_client: await client.aclose()
+
+
+def car_prompt(today, car_text):
+    return (
+        f"امروز {today} است. وظیفه شما استخراج دقیق‌ترین و بروزترین قیمت خودروهای صفر در ایران است. "
+        f"در ادامه بخشی از محتوای متنی سایت ایران جیب (منبع معتبر قیمت خودرو) آورده شده است. "
+        f"لطفا قیمت‌ها را دقیقا از این متن استخراج کنید:\n\n{car_text}\n\n"
+        "قیمت‌ها باید دقیقا مطابق با متن بالا باشند. "
+        "خروجی فقط و فقط به صورت یک JSON معتبر با ساختار زیر باشد:\n"
+        "{\n"
+        "  \"ایران خودرو\": {\n"
+        "    \"models\": [\n"
+        "      {\n"
+        "        \"name\": \"پژو 207\",\n"
+        "        \"variants\": [\n"
+        "          {\n"
+        "            \"name\": \"دنده ای هیدرولیک\",\n"
+        "            \"factoryPrice\": 450000000,\n"
+        "            \"marketPrice\": 750000000\n"
+        "          }\n"
+        "        ]\n"
+        "      }\n"
+        "    ]\n"
+        "  }\n"
+        "}\n"
+        "فقط برندها و مدل‌هایی را که در این متن آمده‌اند بیاورید؛ اگر قیمتی در متن نیست {} برگردانید. قیمت‌ها به تومان و عدد باشند."
+    )
+
+
+def mobile_prompt(today, mobile_text):
+    return (
+        f"امروز {today} است. وظیفه شما استخراج دقیق‌ترین و بروزترین قیمت گوشی‌های موبایل در ایران است. "
+        f"در ادامه بخشی از محتوای متنی یکی از سایت‌های معتبر قیمت موبایل آورده شده است:\n\n"
+        f"{mobile_text}\n\n"
+        "برای هر مدل گوشی فقط یک قیمت ثبت کنید و به هیچ وجه نام سایت‌ها را در خروجی نیاورید. "
+        "قیمت رسمی (با گارانتی) و قیمت بازار را تفکیک کنید. "
+        "خروجی فقط و فقط به صورت یک JSON معتبر با ساختار زیر باشد:\n"
+        "{\n"
+        "  \"Samsung\": {\n"
+        "    \"models\": [\n"
+        "      {\n"
+        "        \"name\": \"Galaxy S24 Ultra\",\n"
+        "        \"variants\": [\n"
+        "          {\n"
+        "            \"name\": \"256GB RAM 12\",\n"
+        "            \"officialPrice\": 72000000,\n"
+        "            \"marketPrice\": 68000000\n"
+        "          }\n"
+        "        ]\n"
+        "      }\n"
+        "    ]\n"
+        "  }\n"
+        "}\n"
+        "فقط برندها و مدل‌هایی را که در این متن آمده‌اند بیاورید؛ اگر قیمتی در متن نیست {} برگردانید. "
+        "نام برند را به انگلیسی بنویسید (Apple, Samsung, Xiaomi, ...). قیمت‌ها به تومان و عدد باشند."
+    )
+
+
+def split_chunks(text, size=CHUNK_CHARS, markers=()):
+    """
+    Splits text into pieces of at most `size` characters, cut right before
+    the last brand marker in the window when that keeps at least half of
+    it, else at the last space.
+    """
+    chunks = []
+    while len(text) > size:
+        window = text[:size]
+        cut = max((window.rfind(m) for m in markers), default=-1)
+        if cut < size // 2: cut = window.rfind(" ")
+        if cut <= 0: cut = size
+        chunks.append(text[:cut].strip())
+        text = text[cut:]
+    if text.strip(): chunks.append(text.strip())
+    return chunks
+
+
+def validate_catalog(data, fields):
+    """
+    Checks a model answer against the catalog schema
+    ({brand: {"models": [{"name", "variants": [{"name", <price fields>}]}]}})
+    and returns its valid part, prices as int toman; entries that don't fit
+    and implausible prices (below site_parsers.MIN_PRICE) are dropped. Returns {} for an empty answer and None when the answer
+    isn't a catalog or nothing in it is valid.
+    """
+    if not isinstance(data, dict):
+        return None
+    if not data:
+        return {}
+    out = {}
+    for brand, b_data in data.items():
+        models = b_data.get("models") if isinstance(b_data, dict) else None
+        if not isinstance(models, list): continue
+        for model in models:
+            if not isinstance(model, dict) or not isinstance(model.get("name"), str) or not isinstance(model.get("variants"), list): continue
+            variants = []
+            for v in model["variants"]:
+                if not isinstance(v, dict) or not isinstance(v.get("name"), str): continue
+                prices = {f: parse_price(v.get(f)) for f in fields}
+                prices = {f: p for f, p in prices.items() if p and p >= site_parsers.MIN_PRICE}
+                if prices: variants.append({"name": v["name"].strip(), **prices})
+            if variants:
+                out.setdefault(brand.strip(), {"models": []})["models"].append({"name": model["name"].strip(), "variants": variants})
+    return out or None
+
+
+def parse_json(text):
+    try:
+        # Clean markdown code blocks if present
+        clean_text = re.sub(r'```json\n?|\n?```', '', text).strip()
+        return json.loads(clean_text)
+    except: return None
+
+
+async def extract_chunk(model, prompt, fields, limiter):
+    """One chunk's validated catalog, retried up to CHUNK_ATTEMPTS times; None if every attempt failed."""
+    for attempt in range(CHUNK_ATTEMPTS):
+        if attempt: await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+        try:
+            async with limiter:
+                answer = await model.generate(prompt)
+            result = validate_catalog(parse_json(answer), fields)
+            if result is not None:
+                return result
+            logger.error(f"Invalid chunk answer (attempt {attempt + 1}/{CHUNK_ATTEMPTS})")
+        except Exception as e:
+            logger.error(f"Chunk extraction failed (attempt {attempt + 1}/{CHUNK_ATTEMPTS}): {e}")
+    return None
+
+
+async def run_refresh(model, today, progress=None, client=None, cache=None, car_url=CAR_URL, mobile_urls=MOBILE_URLS, apply=None):
+    """
+    Runs the whole refresh and returns (new_cars, new_mobiles); either is
+    None when no chunk of it could be extracted or, with a cache, when its
+    sources are unchanged since the last successful extraction.
+    A group with at least one validated site parse uses the merged parses
+    and skips the model. A group only counts as extracted when all its
+    chunks succeeded. Nothing but the source cache is saved here; with
+    `apply`, apply(new_cars, new_mobiles) stores the result first and the
+    groups are only marked extracted once it returned, so a failed save is
+    extracted again next time.
+    """
+    sources = [(car_url, CAR_TEXT_LIMIT)] + [(url, MOBILE_TEXT_LIMIT) for url in mobile_urls]
+    fetched = await fetch_sources(sources, client, progress, cache)
+    groups = {"cars": fetched[:1], "mobile": fetched[1:]}
+    digests, parsed = {}, {}
+    for group, results in groups.items():
+        hashes = [h for _, h, _ in results]
+        # Failed fetches (no hash) never count as "unchanged"
+        digests[group] = group_hash(hashes) if all(hashes) else None
+        parses = [p for _, _, p in results if p]
+        if parses: parsed[group] = site_parsers.merge_catalogs(parses)
+    skip = {g for g, d in digests.items() if cache and d and cache.is_extracted(g, d)}
+    if skip:
+        await report(progress, f"♻️ بدون تغییر نسبت به آخرین استخراج: {'، '.join(GROUP_LABELS[g] for g in groups if g in skip)}")
+    direct = [g for g in groups if g in parsed and g not in skip]
+    if direct:
+        await report(progress, f"📋 استخراج مستقیم از جدول سایت: {'، '.join(GROUP_LABELS[g] for g in direct)}")
+
+    prompts = {}
+    for group, make_prompt, markers in (("cars", car_prompt, CAR_BRANDS), ("mobile", mobile_prompt, MOBILE_BRANDS)):
+        if group in skip or group in parsed: continue
+        texts = [t for t, h, _ in groups[group] if h] # failed fetches have nothing to extract
+        prompts[group] = [make_prompt(today, chunk) for text in texts for chunk in split_chunks(text, CHUNK_CHARS, markers)]
+    total = sum(len(p) for p in prompts.values())
+    limiter = asyncio.Semaphore(MAX_PARALLEL_CHUNKS)
+    done = 0
+    extracted = {} # group -> source hash, marked in the cache once applied
+
+    async def run_chunk(group, prompt):
+        nonlocal done
+        result = await extract_chunk(model, prompt, GROUP_FIELDS[group], limiter)
+        done += 1
+        await report(progress, f"🤖 استخراج قیمت‌ها با هوش مصنوعی ({done}/{total})...")
+        return result
+
+    async def extract(group):
+        if group in skip:
+            return None
+        if group in parsed:
+            result, complete = parsed[group], True
+        else:
+            chunks = await asyncio.gather(*(run_chunk(group, p) for p in prompts[group]))
+            ok = [c for c in chunks if c is not None]
+            if len(ok) < len(chunks):
+                logger.error(f"AI refresh ({group}): {len(chunks) - len(ok)}/{len(chunks)} chunks failed")
+            result, complete = site_parsers.merge_catalogs(ok) or None, bool(chunks) and len(ok) == len(chunks)
+        if result and complete and digests[group]:
+            extracted[group] = digests[group]
+        return result
+
+    if total:
+        await report(progress, f"🤖 استخراج قیمت‌ها با هوش مصنوعی ({total} بخش)...")
+    try:
+        results = tuple(await asyncio.gather(*(extract(g) for g in groups)))
+        if apply: apply(*results)
+        if cache:
+            for group, digest in extracted.items(): cache.mark_extracted(group, digest)
+        return results
+    finally:
+        if cache: cache.save()
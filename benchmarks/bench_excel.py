@@ -0,0 +1,99 @@
+"""
+Excel ingest benchmark: columnar catalogs_from_frame vs. the old iterrows loop.
+
+    python benchmarks/bench_excel.py [rows ...]
+
+Builds price sheets of the given sizes (default 1000 10000 100000) shaped
+like the bot's upload (type, brand, model, variant, factoryPrice,
+marketPrice; some prices as Persian text), checks that both paths give
+the same catalogs after normalize_catalog, and reports their times.
+Reading the .xlsx itself is not timed.
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from excel_handler import catalogs_from_frame
+from prices import normalize_catalog
+
+LEGACY_MAX_ROWS = 20000 # the old loop is quadratic in models per brand; larger sheets only time the new path
+
+
+def legacy_catalogs(df):
+    """handle_document's loop before the columnar ingest."""
+    new_car_db, new_mobile_db = {}, {}
+    has_cars = has_mobiles = False
+    for index, row in df.iterrows():
+        row_type_val = row.get('type', 'car')
+        if pd.isna(row_type_val) or str(row_type_val).strip() == '':
+            row_type = 'car'
+        else:
+            row_type = str(row_type_val).lower().strip()
+        brand = str(row['brand']).strip()
+        model_name = str(row['model']).strip()
+        variant_name = str(row.get('variant', '')).strip()
+        if pd.isna(variant_name) or variant_name == 'nan': variant_name = ''
+        if row_type == 'car':
+            has_cars = True
+            if brand not in new_car_db: new_car_db[brand] = {"models": []}
+            model_obj = next((m for m in new_car_db[brand]["models"] if m["name"] == model_name), None)
+            if not model_obj:
+                model_obj = {"name": model_name, "variants": []}
+                new_car_db[brand]["models"].append(model_obj)
+            model_obj["variants"].append({"name": variant_name, "factoryPrice": row['factoryPrice'], "marketPrice": row['marketPrice']})
+        elif row_type == 'mobile':
+            has_mobiles = True
+            if brand not in new_mobile_db: new_mobile_db[brand] = {"models": []}
+            model_obj = next((m for m in new_mobile_db[brand]["models"] if m["name"] == model_name), None)
+            if not model_obj:
+                model_obj = {"name": model_name, "variants": []}
+                new_mobile_db[brand]["models"].append(model_obj)
+            model_obj["variants"].append({"name": variant_name, "marketPrice": row['marketPrice'], "officialPrice": row.get('factoryPrice', 0)})
+    return (new_car_db if has_cars else None), (new_mobile_db if has_mobiles else None)
+
+
+def build_sheet(rows, seed=1):
+    rnd = random.Random(seed)
+    brands = [f"برند {i}" for i in range(40)]
+    data = []
+    for i in range(rows):
+        price = rnd.randrange(10**8, 10**10)
+        market = f"{price:,}".translate(str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")) if i % 10 == 0 else price
+        data.append({
+            "type": "mobile" if i % 4 == 0 else ("" if i % 7 == 0 else "car"),
+            "brand": rnd.choice(brands),
+            "model": f" مدل {rnd.randrange(max(rows // 10, 1))}",
+            "variant": None if i % 13 == 0 else f"تیپ {i % 9}",
+            "factoryPrice": "توافقی" if i % 17 == 0 else price // 2,
+            "marketPrice": market,
+        })
+    return pd.DataFrame(data)
+
+
+def normalized(catalogs):
+    return tuple(normalize_catalog(c) if c is not None else None for c in catalogs)
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000]
+    for rows in sizes:
+        df = build_sheet(rows)
+        start = time.perf_counter()
+        new = catalogs_from_frame(df)
+        columnar = time.perf_counter() - start
+        line = f"{rows:>7,} rows: columnar {columnar * 1000:8.1f} ms"
+        if rows <= LEGACY_MAX_ROWS:
+            start = time.perf_counter()
+            old = legacy_catalogs(df)
+            legacy = time.perf_counter() - start
+            same = normalized(old) == normalized(new)
+            line += f", iterrows {legacy * 1000:8.1f} ms ({legacy / columnar:.0f}x), same output: {same}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
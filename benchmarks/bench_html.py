@@ -0,0 +1,100 @@
+"""
+HTML -> text benchmark: streaming extractor vs. the old regex cleanup.
+
+    python benchmarks/bench_html.py [--synthetic | page.html ...]
+
+Runs on the pages given, by default on the fixture pages in
+benchmarks/fixtures. Those are synthetic stand-ins, hand-written to the
+layout of the iranjib and mobile.ir price pages (inline script bundles,
+menus, grouped price tables, ad slots), not saved copies of them;
+--synthetic builds larger generated pages instead.
+Pages are held as bytes, as they come off the socket: the regex version
+decodes the whole body first (resp.text), the streaming one decodes and
+parses CHUNK_SIZE pieces and stops at the character budget. Reports CPU
+time and tracemalloc peak for each.
+"""
+import os
+import re
+import sys
+import time
+import codecs
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_refresh import CAR_TEXT_LIMIT, MOBILE_TEXT_LIMIT
+from html_text import StreamingTextExtractor
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CHUNK_SIZE = 16384
+ROUNDS = 5
+
+
+def regex_clean(html):
+    """The cleanup ai_refresh used before the streaming extractor."""
+    html = re.sub(r'<script.*?</script>', '', html, flags=re.DOTALL|re.IGNORECASE)
+    html = re.sub(r'<style.*?</style>', '', html, flags=re.DOTALL|re.IGNORECASE)
+    html = re.sub(r'<[^>]+>', ' ', html)
+    return re.sub(r'\s+', ' ', html).strip()
+
+
+def run_regex(body, limit):
+    return regex_clean(body.decode('utf-8', errors='replace'))[:limit]
+
+
+def run_stream(body, limit):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    extractor = StreamingTextExtractor(limit)
+    for i in range(0, len(body), CHUNK_SIZE):
+        extractor.feed(decoder.decode(body[i:i + CHUNK_SIZE]))
+        if extractor.full: break
+    if not extractor.full: extractor.close()
+    return extractor.text()
+
+
+def synthetic_page(rows, seed=1):
+    rnd = random.Random(seed)
+    script = "<script>window.__STATE__=" + "{\"k\":\"" + "x" * 40000 + "\"};</script>"
+    style = "<style>" + ".c{color:red;margin:0 auto}" * 2000 + "</style>"
+    parts = ["<html><head><title>قیمت روز</title>", style, script, "</head><body>",
+             "<nav>" + "".join(f"<a href='/g/{i}'>گروه {i}</a>" for i in range(300)) + "</nav>",
+             "<table><tr><th>مدل</th><th>قیمت کارخانه</th><th>قیمت بازار</th></tr>"]
+    for i in range(rows):
+        parts.append(f"<tr class='row'><td><a href='/p/{i}'>پژو {200 + i % 50} تیپ {i % 7}</a></td>"
+                     f"<td>{rnd.randrange(10**8, 10**10):,}</td><td>{rnd.randrange(10**8, 10**10):,} تومان</td></tr>")
+        if i % 40 == 0: parts.append("<tr><td colspan='3'><script>ad()</script>تبلیغات</td></tr>")
+    parts.append("</table>")
+    parts.append("".join(f"<div class='card'><h3>Galaxy A{i}</h3><span>{rnd.randrange(10**7, 10**9):,}</span></div>" for i in range(rows // 2)))
+    parts.append(script + "</body></html>")
+    return "".join(parts).encode('utf-8')
+
+
+def measure(func, body, limit):
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        text = func(body, limit)
+    cpu = (time.process_time() - start) / ROUNDS
+    tracemalloc.start()
+    func(body, limit)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak, len(text)
+
+
+def main():
+    if sys.argv[1:] == ["--synthetic"]:
+        pages = [("synthetic-cars", synthetic_page(3000)), ("synthetic-mobile", synthetic_page(800, seed=2))]
+    else:
+        paths = sys.argv[1:] or sorted(os.path.join(FIXTURES, f) for f in os.listdir(FIXTURES) if f.endswith(".html"))
+        pages = [(os.path.basename(p), open(p, 'rb').read()) for p in paths]
+    for name, body in pages:
+        limit = CAR_TEXT_LIMIT if "car" in name else MOBILE_TEXT_LIMIT
+        print(f"{name}: {len(body) / 1024:,.0f} KiB, budget {limit:,} chars")
+        for label, func in (("regex", run_regex), ("stream", run_stream)):
+            cpu, peak, chars = measure(func, body, limit)
+            print(f"  {label:>6}: {cpu * 1000:7.1f} ms cpu, peak {peak / 1024:8,.0f} KiB, {chars:,} chars")
+
+
+if __name__ == "__main__":
+    main()
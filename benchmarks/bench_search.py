@@ -0,0 +1,64 @@
+"""
+Search index benchmark on a synthetic catalog.
+
+    python benchmarks/bench_search.py [variants]
+
+Builds a catalog with the given number of variants (default 50000), then
+reports indexing throughput and per-query latency of search.SearchIndex.
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import CatalogStore
+from search import SearchIndex
+
+BRANDS = ["ایران خودرو", "سایپا", "پژو", "کیا", "هیوندای", "تویوتا", "بی ام و", "مرسدس بنز", "رنو", "چری",
+          "جک", "ام وی ام", "هایما", "فونیکس", "دیگنیتی", "فیدلیتی", "لاماری", "کی ام سی", "بسترن", "دانگ فنگ"]
+WORDS = ["دنده", "اتوماتیک", "تیپ", "پلاس", "اسپرت", "توربو", "هیبرید", "دوگانه سوز", "پانوراما", "فول", "کلاسیک", "جدید"]
+QUERIES = ["پژو ۲۰۶", "پژو206", "سايپا", "توربو", "كيا اسپرت", "۲۰", "تیپ ۵", "اتوماتیک پلاس", "بی ام و", "ناموجود",
+           "اتوماتیگ", "سایپ توربوو", "پژ 207", "هیوندا"]
+
+
+def build_catalog(variants, seed=1):
+    rnd = random.Random(seed)
+    db, count, m = {}, 0, 0
+    while count < variants:
+        brand = BRANDS[m % len(BRANDS)]
+        model = {"name": f"{rnd.choice(WORDS)} {100 + m}", "variants": []}
+        for v in range(min(10, variants - count)):
+            model["variants"].append({"name": f"تیپ {v} {rnd.choice(WORDS)} {rnd.choice(WORDS)}", "marketPrice": rnd.randrange(10**8, 10**10)})
+            count += 1
+        db.setdefault(brand, {"models": []})["models"].append(model)
+        m += 1
+    return db
+
+
+def main():
+    variants = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    store = CatalogStore("bench")
+    store.set_source("excel", build_catalog(variants))
+    snapshot = store.snapshot()
+
+    start = time.perf_counter()
+    index = SearchIndex({"cars": snapshot})
+    build = time.perf_counter() - start
+    print(f"index: {len(index.docs):,} docs in {build * 1000:.0f} ms ({len(index.docs) / build:,.0f} docs/s)")
+
+    for q in QUERIES:
+        rounds = 200
+        start = time.perf_counter()
+        for _ in range(rounds):
+            index._cache.clear() # measure lookups, not the query cache
+            results = index.search(q)
+        elapsed = (time.perf_counter() - start) / rounds
+        top = results[0] if results else None
+        label = " / ".join(p for p in (top.brand, top.model, top.variant) if p) if top else "-"
+        print(f"{q!r:>18}: {elapsed * 1e6:8.0f} us, {len(results):2} results, top: {label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,36 @@
 
+import io
 import logging
-import json
+import asyncio
 import os
 import datetime
-import shutil
-import re
+import tarfile
 import jdatetime
 import pandas as pd
-import requests
 import google.generativeai as genai
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, BotCommand, MenuButtonCommands
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, BotCommand, MenuButtonCommands, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, InlineQueryHandler, filters
+from database_manager import configure as configure_database, get_db
+from catalog import CatalogStore, CatalogFile
+from catalog_delta import diff_catalogs, apply_delta
+from price_list import PriceListCache, render_car_list, render_mobile_list
+from prices import normalize_catalog, format_price, has_price
+from excel_handler import SHEET_EXTENSIONS, parse_price_sheet_async, shutdown_parse_pool
+from search import SearchCache, BRAND, MODEL, MAX_RESULTS as MAX_SEARCH_RESULTS
+from router import CallbackRouter, ANY_ADMIN
+from admin_panel import admin_router, handle_admin_text
+import ai_refresh
+import ai_providers
+from scheduler import schedule_periodic
+from state_manager import (
+    get_state, set_state, update_data, reset_state,
+    STATE_ESTIMATE_BRAND, STATE_ESTIMATE_MODEL, STATE_ESTIMATE_YEAR,
+    STATE_ESTIMATE_MILEAGE, STATE_ESTIMATE_PAINT, STATE_SEARCH,
+    STATE_ADMIN_ADD_ADMIN, STATE_ADMIN_SPONSOR_NAME, STATE_ADMIN_SPONSOR_LINK,
+    STATE_ADMIN_BROADCAST, STATE_ADMIN_EDIT_MENU_LABEL, STATE_ADMIN_EDIT_MENU_URL,
+    STATE_ADMIN_SET_SUPPORT, STATE_ADMIN_WAIT_EXCEL
+)
+from callback_codec import PREFIX as CALLBACK_PREFIX, pack, unpack as unpack_callback, CAR_BRAND, CAR_MODEL, CAR_VARIANT, MOB_BRAND, MOB_MODEL, MOB_VARIANT
 
 # Configuration
 TOKEN = 'REPLACE_ME_TOKEN' 
@@ -19,6 +39,8 @@ GEMINI_API_KEY = ''
 DEEPSEEK_API_KEY = ''
 OPENAI_API_KEY = ''
 DATA_FILE = 'bot_data.json'
+STORAGE_BACKEND = 'json' # json, sqlite
+SQLITE_FILE = 'bot_data.db'
 
 # Default Menu Configuration
 DEFAULT_CONFIG = {
@@ -38,6 +60,18 @@ CAR_DB_EXCEL = {}
 CAR_DB_AI = {}
 MOBILE_DB_EXCEL = {}
 MOBILE_DB_AI = {}
+# Merged, versioned views of the Excel/AI databases (see get_effective_car_db)
+CAR_CATALOG = CatalogStore("cars", "car_catalog_ids.json")
+MOBILE_CATALOG = CatalogStore("mobile", "mobile_catalog_ids.json")
+# Source files; saves that name the changed brands only append them to the file's journal (<file>.log),
+# which is folded back in on shutdown and before a backup
+CATALOG_FILES = {
+    ("cars", "excel"): CatalogFile('car_db_excel.json'), ("cars", "ai"): CatalogFile('car_db_ai.json'),
+    ("mobile", "excel"): CatalogFile('mobile_db_excel.json'), ("mobile", "ai"): CatalogFile('mobile_db_ai.json'),
+}
+CAR_PRICE_LIST = PriceListCache(render_car_list)
+MOBILE_PRICE_LIST = PriceListCache(render_mobile_list)
+SEARCH_INDEX = SearchCache()
 # ... (Insert DB Logic if using full generator) ...
 YEARS = [1404, 1403, 1402, 1401, 1400, 1399, 1398, 1397, 1396, 1395, 1394, 1393, 1392, 1391, 1390]
 PAINT_CONDITIONS = [
@@ -55,88 +89,33 @@ PAINT_CONDITIONS = [
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-user_states = {}
-# User States
-STATE_IDLE = "IDLE"
-STATE_ESTIMATE_BRAND = "EST_BRAND"
-STATE_ESTIMATE_MODEL = "EST_MODEL"
-STATE_ESTIMATE_YEAR = "EST_YEAR"
-STATE_ESTIMATE_MILEAGE = "EST_MILEAGE"
-STATE_ESTIMATE_PAINT = "EST_PAINT"
-# Admin States
-STATE_ADMIN_ADD_ADMIN = "ADM_ADD_ADMIN"
-STATE_ADMIN_SPONSOR_NAME = "ADM_SPONSOR_NAME"
-STATE_ADMIN_SPONSOR_LINK = "ADM_SPONSOR_LINK"
-STATE_ADMIN_BROADCAST = "ADM_BCAST"
-STATE_ADMIN_EDIT_MENU_LABEL = "ADM_EDIT_LABEL"
-STATE_ADMIN_EDIT_MENU_URL = "ADM_EDIT_URL"
-STATE_ADMIN_SET_SUPPORT = "ADM_SET_SUPPORT"
-STATE_ADMIN_SET_CHANNEL_URL = "ADM_SET_CHANNEL_URL"
-STATE_ADMIN_WAIT_EXCEL = "ADM_WAIT_EXCEL"
-STATE_SEARCH = "SEARCH"
-
 # --- Data Management ---
+# bot_data.json (or bot_data.db with the sqlite backend) is loaded once and
+# served from memory by the process-wide store (get_db(), set up in main);
+# external edits are detected on read.
+
 def load_data():
-    default_data = {
-        "backup_interval": 0, 
-        "users": [], 
-        "admins": [], 
-        "sponsor": {}, 
-        "menu_config": DEFAULT_CONFIG, 
-        "support_config": {"mode": "text", "value": "پیام خود را ارسال کنید..."},
-        "panel_user": "",
-        "panel_pass": ""
-    }
-    
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                d = json.load(f)
-                if "menu_config" not in d: d["menu_config"] = DEFAULT_CONFIG
-                for k, v in DEFAULT_CONFIG.items():
-                    if k not in d["menu_config"]: d["menu_config"][k] = v
-                return d
-        except json.JSONDecodeError:
-            # Handle corrupted file
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            corrupt_filename = f"{DATA_FILE}.corrupt.{timestamp}"
-            try:
-                shutil.copy(DATA_FILE, corrupt_filename)
-                logger.error(f"❌ Data file corrupted! Renamed to {corrupt_filename} and creating new DB.")
-            except: pass
-            return default_data
-        except Exception as e:
-            logger.error(f"❌ Error loading data: {e}")
-            return default_data
-            
-    return default_data
+    return get_db().load_data()
 
 def save_data(data):
-    try:
-        # Write to temp file first to prevent corruption during write
-        temp_file = f"{DATA_FILE}.tmp"
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        shutil.move(temp_file, DATA_FILE)
-    except Exception as e:
-        logger.error(f"❌ Error saving data: {e}")
+    get_db().save_data(data)
 
-def save_car_db(db_type="excel"):
+def save_car_db(db_type="excel", brands=None):
     try:
-        filename = 'car_db_excel.json' if db_type == "excel" else 'car_db_ai.json'
-        db = CAR_DB_EXCEL if db_type == "excel" else CAR_DB_AI
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(db, f, ensure_ascii=False, indent=4)
+        db = normalize_catalog(CAR_DB_EXCEL if db_type == "excel" else CAR_DB_AI, brands)
+        CAR_CATALOG.set_source(db_type, db, brands)
+        if brands is None: CATALOG_FILES["cars", db_type].save(db)
+        else: CATALOG_FILES["cars", db_type].save_brands(db, brands)
         logger.info(f"Car database ({db_type}) saved successfully.")
     except Exception as e:
         logger.error(f"Error saving car database ({db_type}): {e}")
 
-def save_mobile_db(db_type="excel"):
+def save_mobile_db(db_type="excel", brands=None):
     try:
-        filename = 'mobile_db_excel.json' if db_type == "excel" else 'mobile_db_ai.json'
-        db = MOBILE_DB_EXCEL if db_type == "excel" else MOBILE_DB_AI
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(db, f, ensure_ascii=False, indent=4)
+        db = normalize_catalog(MOBILE_DB_EXCEL if db_type == "excel" else MOBILE_DB_AI, brands)
+        MOBILE_CATALOG.set_source(db_type, db, brands)
+        if brands is None: CATALOG_FILES["mobile", db_type].save(db)
+        else: CATALOG_FILES["mobile", db_type].save_brands(db, brands)
         logger.info(f"Mobile database ({db_type}) saved successfully.")
     except Exception as e:
         logger.error(f"Error saving mobile database ({db_type}): {e}")
@@ -144,114 +123,48 @@ def save_mobile_db(db_type="excel"):
 def load_car_db():
     global CAR_DB_EXCEL, CAR_DB_AI
     try:
-        if os.path.exists('car_db_excel.json'):
-            with open('car_db_excel.json', 'r', encoding='utf-8') as f:
-                CAR_DB_EXCEL = json.load(f)
-        if os.path.exists('car_db_ai.json'):
-            with open('car_db_ai.json', 'r', encoding='utf-8') as f:
-                CAR_DB_AI = json.load(f)
+        CAR_DB_EXCEL = CATALOG_FILES["cars", "excel"].load()
+        CAR_DB_AI = CATALOG_FILES["cars", "ai"].load()
     except Exception as e:
         logger.error(f"Error loading car databases: {e}")
+    CAR_CATALOG.set_source("excel", normalize_catalog(CAR_DB_EXCEL))
+    CAR_CATALOG.set_source("ai", normalize_catalog(CAR_DB_AI))
 
 def load_mobile_db():
     global MOBILE_DB_EXCEL, MOBILE_DB_AI
     try:
-        if os.path.exists('mobile_db_excel.json'):
-            with open('mobile_db_excel.json', 'r', encoding='utf-8') as f:
-                MOBILE_DB_EXCEL = json.load(f)
-        if os.path.exists('mobile_db_ai.json'):
-            with open('mobile_db_ai.json', 'r', encoding='utf-8') as f:
-                MOBILE_DB_AI = json.load(f)
+        MOBILE_DB_EXCEL = CATALOG_FILES["mobile", "excel"].load()
+        MOBILE_DB_AI = CATALOG_FILES["mobile", "ai"].load()
     except Exception as e:
         logger.error(f"Error loading mobile databases: {e}")
+    MOBILE_CATALOG.set_source("excel", normalize_catalog(MOBILE_DB_EXCEL))
+    MOBILE_CATALOG.set_source("ai", normalize_catalog(MOBILE_DB_AI))
+
+def get_catalog_priority():
+    return load_data().get("ai_config", {}).get("priority", "excel")
 
 def get_effective_car_db():
-    d = load_data()
-    conf = d.get("ai_config", {})
-    priority = conf.get("priority", "excel")
-    
-    if priority == "ai":
-        return CAR_DB_AI
-    if priority == "excel":
-        return CAR_DB_EXCEL
-    
-    # Hybrid Mode (Default/Fallback)
-    merged = json.loads(json.dumps(CAR_DB_AI))
-    for brand, b_data in CAR_DB_EXCEL.items():
-        if brand not in merged:
-            merged[brand] = b_data
-            continue
-        for model in b_data.get("models", []):
-            m_name = model["name"]
-            existing_model = next((m for m in merged[brand]["models"] if m["name"] == m_name), None)
-            if not existing_model:
-                merged[brand]["models"].append(model)
-                continue
-            for variant in model.get("variants", []):
-                v_name = variant["name"]
-                existing_variant = next((v for v in existing_model["variants"] if v["name"] == v_name), None)
-                if not existing_variant:
-                    existing_model["variants"].append(variant)
-                else:
-                    if variant.get("marketPrice", 0) > 0:
-                        existing_variant.update(variant)
-    return merged
+    # Prebuilt snapshot; only rebuilt when a source DB or the priority changes
+    return CAR_CATALOG.snapshot(get_catalog_priority())
 
 def get_effective_mobile_db():
-    d = load_data()
-    conf = d.get("ai_config", {})
-    priority = conf.get("priority", "excel")
-    
-    if priority == "ai":
-        return MOBILE_DB_AI
-    if priority == "excel":
-        return MOBILE_DB_EXCEL
-    
-    # Hybrid Mode
-    merged = json.loads(json.dumps(MOBILE_DB_AI))
-    for brand, b_data in MOBILE_DB_EXCEL.items():
-        if brand not in merged:
-            merged[brand] = b_data
-            continue
-        for model in b_data.get("models", []):
-            m_name = model["name"]
-            existing_model = next((m for m in merged[brand]["models"] if m["name"] == m_name), None)
-            if not existing_model:
-                merged[brand]["models"].append(model)
-                continue
-            for variant in model.get("variants", []):
-                v_name = variant["name"]
-                existing_variant = next((v for v in existing_model["variants"] if v["name"] == v_name), None)
-                if not existing_variant:
-                    existing_model["variants"].append(variant)
-                else:
-                    if variant.get("marketPrice", 0) > 0:
-                        existing_variant.update(variant)
-    return merged
+    return MOBILE_CATALOG.snapshot(get_catalog_priority())
 
 
+def resolve_car_brand(user_id, model_name, effective_db):
+    # Model names can repeat across brands; prefer the brand the user picked
+    brands = effective_db.find_brands(model_name)
+    if not brands: return None
+    preferred = get_state(user_id)["data"].get("brand")
+    return preferred if preferred in brands else brands[0]
+
 def register_user(user_id):
-    d = load_data()
-    if user_id not in d.get("users", []):
-        if "users" not in d: d["users"] = []
-        d["users"].append(user_id)
-        save_data(d)
+    get_db().register_user(user_id)
 
 def is_admin(user_id):
-    d = load_data()
-    return str(user_id) == str(OWNER_ID) or user_id in d.get("admins", [])
+    return get_db().is_admin(user_id, OWNER_ID)
 
 # --- Helper Functions ---
-def get_state(user_id):
-    if user_id not in user_states: user_states[user_id] = {"state": STATE_IDLE, "data": {}}
-    return user_states[user_id]
-def set_state(user_id, state):
-    if user_id not in user_states: user_states[user_id] = {"state": state, "data": {}}
-    else: user_states[user_id]["state"] = state
-def update_data(user_id, key, value):
-    if user_id in user_states: user_states[user_id]["data"][key] = value
-def reset_state(user_id):
-    user_states[user_id] = {"state": STATE_IDLE, "data": {}}
 
 # --- Keyboards ---
 def get_main_menu(user_id):
@@ -317,6 +230,7 @@ def get_ai_control_menu(user_id):
     source = conf.get("source", "gemini")
     priority = conf.get("priority", "excel")
     schedule = conf.get("schedule", 0)
+    kill = ai_kill_switch_on()
 
     keyboard = [
         [InlineKeyboardButton("⚙️ منبع دیتا (Source)", callback_data="noop")],
@@ -341,17 +255,43 @@ def get_ai_control_menu(user_id):
         ],
         [InlineKeyboardButton("🚫 خاموش کردن زمانبندی", callback_data="ai_set_schedule_0")],
         [InlineKeyboardButton("🔄 آپدیت قیمت‌ها (همین الان)", callback_data="ai_update_now")],
+        [InlineKeyboardButton("📈 آمار سرویس‌های AI", callback_data="ai_stats")],
+        [InlineKeyboardButton(("🛑 توقف اضطراری AI: روشن" if kill else "⚡ توقف اضطراری AI: خاموش"), callback_data="ai_toggle_kill")],
         [InlineKeyboardButton("🔙 بازگشت", callback_data="admin_home")]
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def write_backup():
+    """
+    backup_<time>.tar.gz with the database export (users included) and the
+    catalog files, their journals folded in; install.sh restores it.
+    """
+    backup_file = f"backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.tar.gz"
+    with tarfile.open(backup_file, "w:gz") as tar:
+        tar.add(get_db().export_backup(), arcname=os.path.basename(DATA_FILE))
+        for catalog_file in CATALOG_FILES.values():
+            catalog_file.compact()
+            if os.path.exists(catalog_file.path): tar.add(catalog_file.path, arcname=os.path.basename(catalog_file.path))
+    return backup_file
+
+async def send_backup(bot, chat_id, caption):
+    try:
+        backup_file = write_backup()
+    except Exception as e:
+        logger.error(f"Error writing backup: {e}")
+        return False
+    try:
+        with open(backup_file, 'rb') as doc:
+            await bot.send_document(chat_id=chat_id, document=doc, caption=caption)
+    finally:
+        os.remove(backup_file)
+    return True
+
 async def send_auto_backup(context: ContextTypes.DEFAULT_TYPE):
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'rb') as doc:
-                await context.bot.send_document(chat_id=OWNER_ID, document=doc, caption="💾 Auto-Backup")
-        except Exception as e:
-            logger.error(f"Error sending auto-backup: {e}")
+    try:
+        await send_backup(context.bot, OWNER_ID, "💾 Auto-Backup")
+    except Exception as e:
+        logger.error(f"Error sending auto-backup: {e}")
 
 # --- Handlers ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -374,793 +314,697 @@ async def fix_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ خطا: {e}")
 
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global CAR_DB_EXCEL, CAR_DB_AI, MOBILE_DB_EXCEL, MOBILE_DB_AI
-    query = update.callback_query
-    user_id = query.from_user.id
-    data = query.data
-    await query.answer()
-    
-    if data == "main_menu":
-        reset_state(user_id)
-        await query.edit_message_text(text="منوی اصلی:", reply_markup=get_main_menu(user_id))
-        return
-    
-    # --- ADMIN HOME ---
-    if data == "admin_home" and is_admin(user_id):
-        keyboard = [
-            [InlineKeyboardButton("⚙️ مدیریت منو", callback_data="admin_menus")],
-            [InlineKeyboardButton("✨ مرکز کنترل AI", callback_data="admin_ai_control")],
-            [InlineKeyboardButton("📂 مدیریت اکسل", callback_data="admin_excel_management")],
-            [InlineKeyboardButton("➕ افزودن تکی خودرو", callback_data="admin_add_car")],
-            [InlineKeyboardButton("📞 تنظیم پشتیبانی", callback_data="admin_set_support")],
-            [InlineKeyboardButton("👥 ادمین‌ها", callback_data="admin_manage_admins")],
-            [InlineKeyboardButton("💾 بکاپ", callback_data="admin_backup_menu")],
-            [InlineKeyboardButton("⭐ اسپانسر", callback_data="admin_set_sponsor")],
-            [InlineKeyboardButton("📣 پیام همگانی", callback_data="admin_broadcast")],
-            [InlineKeyboardButton("🔙 خروج", callback_data="main_menu")]
-        ]
-        await query.edit_message_text("🛠 **پنل مدیریت**", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+# --- Catalog Navigation ---
+# Buttons carry compact IDs (callback_codec); the legacy name-based payloads
+# still in users' chats are routed to the same helpers.
+async def show_car_models(query, user_id, brand_name):
+    effective_db = get_effective_car_db()
+    models = effective_db[brand_name]["models"] if brand_name in effective_db else ()
+    keyboard = [[InlineKeyboardButton(m["name"], callback_data=pack(CAR_MODEL, effective_db.catalog_id(brand_name, m["name"])))] for m in models]
+    if get_state(user_id)["state"] == STATE_ESTIMATE_BRAND:
+        update_data(user_id, "brand", brand_name)
+        set_state(user_id, STATE_ESTIMATE_MODEL)
+        keyboard.append([InlineKeyboardButton("🔙 انصراف", callback_data="main_menu")])
+        await query.edit_message_text(f"خودروی {brand_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
         return
 
-    if data == "admin_ai_control" and is_admin(user_id):
-        await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
-        return
+    if brand_name in effective_db:
+        update_data(user_id, "brand", brand_name)
+        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")])
+        await query.edit_message_text(f"مدل‌های {brand_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-    if data == "admin_excel_management" and is_admin(user_id):
-        keyboard = [
-            [InlineKeyboardButton("📥 دانلود فایل نمونه (Template)", callback_data="admin_download_template")],
-            [InlineKeyboardButton("📤 آپلود فایل تکمیل شده", callback_data="admin_update_excel")],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="admin_home")]
-        ]
-        await query.edit_message_text("📊 **مدیریت دیتابیس اکسل**\n\nمی‌توانید فایل نمونه را دانلود کرده و پس از پر کردن، دوباره آپلود کنید.", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+async def show_car_model(query, user_id, brand_name, model_name):
+    if get_state(user_id)["state"] == STATE_ESTIMATE_MODEL:
+        update_data(user_id, "model", model_name)
+        set_state(user_id, STATE_ESTIMATE_YEAR)
+        keyboard = []
+        row = []
+        for i, year in enumerate(YEARS):
+            row.append(InlineKeyboardButton(str(year), callback_data=f"year_{year}"))
+            if (i + 1) % 3 == 0: keyboard.append(row); row = []
+        if row: keyboard.append(row)
+        await query.edit_message_text("سال ساخت:", reply_markup=InlineKeyboardMarkup(keyboard))
         return
 
-    if data == "admin_download_template" and is_admin(user_id):
-        try:
-            # Create a multi-sheet Excel file or just one sheet with a 'type' column
-            # Let's use one sheet with a 'type' column for simplicity, or two dataframes
-            car_df = pd.DataFrame(columns=['type', 'brand', 'model', 'variant', 'factoryPrice', 'marketPrice'])
-            car_df.loc[0] = ['car', 'ایران خودرو', 'پژو 207', 'دنده ای هیدرولیک', 450000000, 750000000]
-            car_df.loc[1] = ['mobile', 'Samsung', 'Galaxy S24 Ultra', '256GB', 0, 75000000]
-            
-            template_path = "template.xlsx"
-            car_df.to_excel(template_path, index=False)
-            await context.bot.send_document(chat_id=user_id, document=open(template_path, 'rb'), caption="📝 فایل نمونه اکسل (خودرو و موبایل)\nستون type باید شامل car یا mobile باشد.\nلطفا طبق همین فرمت فایل را پر کرده و ارسال کنید.")
-            os.remove(template_path)
-        except Exception as e:
-            await query.message.reply_text(f"❌ خطا در ساخت فایل: {e}")
-        return
+    effective_db = get_effective_car_db()
+    found_model = effective_db.get_model(brand_name, model_name)
+    if found_model:
+        keyboard = []
+        for variant in found_model["variants"]:
+            keyboard.append([InlineKeyboardButton(variant["name"], callback_data=pack(CAR_VARIANT, effective_db.catalog_id(brand_name, model_name, variant["name"])))])
+        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data=pack(CAR_BRAND, effective_db.catalog_id(brand_name)))])
+        await query.edit_message_text(f"تیپ خودرو {model_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def show_car_variant(query, brand_name, model_name, found_variant):
+    m_text = format_price(found_variant, 'marketPrice')
+    f_text = format_price(found_variant, 'factoryPrice')
+    
+    diff_text = ""
+    if has_price(found_variant, 'marketPrice') and has_price(found_variant, 'factoryPrice'):
+        diff = found_variant.get('marketPrice', 0) - found_variant.get('factoryPrice', 0)
+        diff_text = f"\n\n⚖️ **اختلاف قیمت:**\n💰 {diff:,} تومان"
+
+    text = (f"📊 **استعلام قیمت**\n\n"
+            f"🚘 {found_variant['name']}\n"
+            f"-------------------\n"
+            f"📉 **قیمت بازار:**\n"
+            f"💰 {m_text}\n\n"
+            f"🏭 **کارخانه:**\n"
+            f"🏦 {f_text}"
+            f"{diff_text}")
+    
+    keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data=pack(CAR_MODEL, get_effective_car_db().catalog_id(brand_name, model_name)))]]
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
 
-    if data == "admin_update_excel" and is_admin(user_id):
-        set_state(user_id, STATE_ADMIN_WAIT_EXCEL)
-        await query.message.reply_text("📂 لطفا فایل اکسل (xlsx) را با فرمت مشخص شده ارسال کنید.")
-        return
+async def show_mobile_models(query, brand_name):
+    effective_db = get_effective_mobile_db()
+    if brand_name in effective_db:
+        keyboard = []
+        for model in effective_db[brand_name]["models"]:
+            keyboard.append([InlineKeyboardButton(model["name"], callback_data=pack(MOB_MODEL, effective_db.catalog_id(brand_name, model["name"])))])
+        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")])
+        await query.edit_message_text(f"مدل‌های {brand_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-    if data.startswith("ai_set_source_") and is_admin(user_id):
-        source = data.replace("ai_set_source_", "")
-        d = load_data()
-        if "ai_config" not in d: d["ai_config"] = {}
-        d["ai_config"]["source"] = source
-        save_data(d)
-        await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
+async def show_mobile_model(query, brand_name, model_name):
+    effective_db = get_effective_mobile_db()
+    found_model = effective_db.get_model(brand_name, model_name)
+    if not found_model:
         return
-
-    if data.startswith("ai_set_priority_") and is_admin(user_id):
-        priority = data.replace("ai_set_priority_", "")
-        d = load_data()
-        if "ai_config" not in d: d["ai_config"] = {}
-        d["ai_config"]["priority"] = priority
-        save_data(d)
-        await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
+    back_button = InlineKeyboardButton("🔙 بازگشت", callback_data=pack(MOB_BRAND, effective_db.catalog_id(brand_name)))
+    variants = found_model.get("variants", [])
+    if not variants:
+        # Legacy support
+        p_str = format_price(found_model, 'price') if 'price' in found_model else '-'
+        
+        text = (f"📱 **قیمت روز موبایل**\n"
+                f"🏷 مدل: {found_model['name']}\n"
+                f"💾 حافظه: {found_model.get('storage', '-')}\n"
+                f"-------------------\n"
+                f"💰 **قیمت:** {p_str}")
+        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup([[back_button]]))
+    else:
+        keyboard = []
+        for variant in variants:
+            keyboard.append([InlineKeyboardButton(variant["name"], callback_data=pack(MOB_VARIANT, effective_db.catalog_id(brand_name, model_name, variant["name"])))])
+        keyboard.append([back_button])
+        await query.edit_message_text(f"مدل {model_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def show_mobile_variant(query, brand_name, model_name, found_variant):
+    m_str = format_price(found_variant, 'marketPrice')
+    o_str = format_price(found_variant, 'officialPrice')
+
+    text = (f"📊 **استعلام قیمت موبایل**\n\n"
+            f"📱 {model_name} ({found_variant['name']})\n"
+            f"-------------------\n"
+            f"📉 **قیمت بازار:**\n"
+            f"💰 {m_str}\n\n")
+    
+    if found_variant.get('officialPrice', 0) > 0 or not has_price(found_variant, 'officialPrice'):
+        text += (f"🛡 **گارانتی:**\n"
+                 f"🏦 {o_str}")
+    
+    keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data=pack(MOB_MODEL, get_effective_mobile_db().catalog_id(brand_name, model_name)))]]
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def handle_catalog_callback(query, user_id, route, ids):
+    is_car = route in (CAR_BRAND, CAR_MODEL, CAR_VARIANT)
+    effective_db = get_effective_car_db() if is_car else get_effective_mobile_db()
+    key = effective_db.resolve_id(ids[0]) if ids else None
+    if not key:
         return
+    if route in (CAR_BRAND, MOB_BRAND) and len(key) == 1:
+        if is_car: await show_car_models(query, user_id, key[0])
+        else: await show_mobile_models(query, key[0])
+    elif route in (CAR_MODEL, MOB_MODEL) and len(key) == 2:
+        if is_car: await show_car_model(query, user_id, *key)
+        else: await show_mobile_model(query, *key)
+    elif route in (CAR_VARIANT, MOB_VARIANT) and len(key) == 3:
+        found_variant = effective_db.get_variant(*key)
+        if not found_variant: return
+        if is_car: await show_car_variant(query, key[0], key[1], found_variant)
+        else: await show_mobile_variant(query, key[0], key[1], found_variant)
+
+# --- Callback Routes ---
+# Exact payloads and parameterized prefixes are registered once with the
+# admin roles they require; handle_callback only dispatches.
+router = CallbackRouter(role_resolver=lambda user_id: get_db().get_admin_role(user_id, OWNER_ID))
+router.include(admin_router) # channel/force-join, gold & currency, admin roles
+
+# Compact catalog payloads ("#cb:1a", see callback_codec)
+@router.prefix(CALLBACK_PREFIX)
+async def cb_catalog(query, context, arg):
+    compact = unpack_callback(query.data)
+    if compact:
+        await handle_catalog_callback(query, query.from_user.id, *compact)
+
+@router.exact("main_menu")
+async def cb_main_menu(query, context, arg):
+    user_id = query.from_user.id
+    reset_state(user_id)
+    await query.edit_message_text(text="منوی اصلی:", reply_markup=get_main_menu(user_id))
 
-    if data.startswith("ai_set_schedule_") and is_admin(user_id):
-        hours = int(data.replace("ai_set_schedule_", ""))
-        d = load_data()
-        if "ai_config" not in d: d["ai_config"] = {}
-        d["ai_config"]["schedule"] = hours
-        save_data(d)
-        # Logic to restart the job queue would be needed here
-        await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
-        return
+# --- ADMIN HOME ---
+@router.exact("admin_home", roles=ANY_ADMIN)
+async def cb_admin_home(query, context, arg):
+    keyboard = [
+        [InlineKeyboardButton("⚙️ مدیریت منو", callback_data="admin_menus")],
+        [InlineKeyboardButton("✨ مرکز کنترل AI", callback_data="admin_ai_control")],
+        [InlineKeyboardButton("📂 مدیریت اکسل", callback_data="admin_excel_management")],
+        [InlineKeyboardButton("➕ افزودن تکی خودرو", callback_data="admin_add_car")],
+        [InlineKeyboardButton("📞 تنظیم پشتیبانی", callback_data="admin_set_support")],
+        [InlineKeyboardButton("📢 کانال و جوین اجباری", callback_data="admin_channel_settings")],
+        [InlineKeyboardButton("💰 طلا و ارز", callback_data="admin_economy_menu")],
+        [InlineKeyboardButton("👥 ادمین‌ها", callback_data="admin_manage_admins")],
+        [InlineKeyboardButton("💾 بکاپ", callback_data="admin_backup_menu")],
+        [InlineKeyboardButton("⭐ اسپانسر", callback_data="admin_set_sponsor")],
+        [InlineKeyboardButton("📣 پیام همگانی", callback_data="admin_broadcast")],
+        [InlineKeyboardButton("🔙 خروج", callback_data="main_menu")]
+    ]
+    await query.edit_message_text(f"🛠 **پنل مدیریت**\n👥 تعداد کاربران: {len(get_db().users):,}", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
-    # --- ADMIN: CHANNEL SETTINGS (REMOVED REDUNDANT) ---
-    # Generic menu management handles this now.
+@router.exact("admin_ai_control", roles=ANY_ADMIN)
+async def cb_admin_ai_control(query, context, arg):
+    user_id = query.from_user.id
+    await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
 
-    # --- ADMIN: SET SUPPORT ---
-    if data == "admin_set_support":
-        set_state(user_id, STATE_ADMIN_SET_SUPPORT)
-        await query.message.reply_text(
-            "📞 **تنظیم دکمه پشتیبانی**\\n\\n"
-            "لطفا یکی از موارد زیر را ارسال کنید:\\n"
-            "1. یک **لینک** (مثلا https://t.me/admin) -> دکمه به صورت لینک مستقیم باز می‌شود.\\n"
-            "2. یک **متن یا شماره** -> وقتی کاربر کلیک کند، این متن به او نمایش داده می‌شود.",
-            parse_mode='Markdown'
-        )
-        return
+@router.exact("admin_excel_management", roles=ANY_ADMIN)
+async def cb_admin_excel_management(query, context, arg):
+    keyboard = [
+        [InlineKeyboardButton("📥 دانلود فایل نمونه (Template)", callback_data="admin_download_template")],
+        [InlineKeyboardButton("📤 آپلود فایل تکمیل شده", callback_data="admin_update_excel")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="admin_home")]
+    ]
+    await query.edit_message_text("📊 **مدیریت دیتابیس اکسل**\n\nمی‌توانید فایل نمونه را دانلود کرده و پس از پر کردن، دوباره آپلود کنید.", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
-    # --- ADMIN: MENU MANAGEMENT ---
-    if data == "admin_menus":
-        d = load_data()
-        c = d.get("menu_config", DEFAULT_CONFIG)
-        
-        # Ensure all default keys exist (merge new buttons)
-        changed = False
-        for k, v in DEFAULT_CONFIG.items():
-            if k not in c:
-                c[k] = v
-                changed = True
-            else:
-                # Ensure nested keys like 'url' exist if they are in default
-                if "url" in v and "url" not in c[k]:
-                    c[k]["url"] = v["url"]
-                    changed = True
+@router.exact("admin_download_template", roles=ANY_ADMIN)
+async def cb_admin_download_template(query, context, arg):
+    user_id = query.from_user.id
+    try:
+        # Create a multi-sheet Excel file or just one sheet with a 'type' column
+        # Let's use one sheet with a 'type' column for simplicity, or two dataframes
+        car_df = pd.DataFrame(columns=['type', 'brand', 'model', 'variant', 'factoryPrice', 'marketPrice'])
+        car_df.loc[0] = ['car', 'ایران خودرو', 'پژو 207', 'دنده ای هیدرولیک', 450000000, 750000000]
+        car_df.loc[1] = ['mobile', 'Samsung', 'Galaxy S24 Ultra', '256GB', 0, 75000000]
         
-        if changed:
-            d["menu_config"] = c
-            save_data(d)
+        template_path = "template.xlsx"
+        car_df.to_excel(template_path, index=False)
+        await context.bot.send_document(chat_id=user_id, document=open(template_path, 'rb'), caption="📝 فایل نمونه اکسل (خودرو و موبایل)\nستون type باید شامل car یا mobile باشد.\nلطفا طبق همین فرمت فایل را پر کرده و ارسال کنید.")
+        os.remove(template_path)
+    except Exception as e:
+        await query.message.reply_text(f"❌ خطا در ساخت فایل: {e}")
 
-        keyboard = []
-        for key, val in c.items():
-            status = "✅" if val["active"] else "❌"
-            keyboard.append([InlineKeyboardButton(f"{status} {val['label']}", callback_data=f"edit_menu_{key}")])
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_home")])
-        await query.edit_message_text("⚙️ **مدیریت منو**\\n\\nکدام دکمه را می‌خواهید ویرایش کنید؟", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-        return
+@router.exact("admin_update_excel", roles=ANY_ADMIN)
+async def cb_admin_update_excel(query, context, arg):
+    user_id = query.from_user.id
+    set_state(user_id, STATE_ADMIN_WAIT_EXCEL)
+    await query.message.reply_text("📂 لطفا فایل اکسل (xlsx/xls) یا csv را با فرمت مشخص شده ارسال کنید.")
 
-    if data.startswith("edit_menu_"):
-        key = data.replace("edit_menu_", "")
-            
-        d = load_data()
-        c = d.get("menu_config", DEFAULT_CONFIG).get(key, {})
-        
-        status_text = "فعال ✅" if c["active"] else "غیرفعال ❌"
-        text = f"🔧 ویرایش دکمه: **{c['label']}**\\nوضعیت فعلی: {status_text}\\n"
-        if "url" in c: text += f"لینک فعلی: {c['url']}"
-        
-        keyboard = [
-            [InlineKeyboardButton("✏️ تغییر نام دکمه", callback_data=f"menu_set_label_{key}")],
-            [InlineKeyboardButton("👁️ تغییر وضعیت (روشن/خاموش)", callback_data=f"menu_toggle_{key}")]
-        ]
-        if "url" in c:
-            keyboard.append([InlineKeyboardButton("🔗 تغییر لینک", callback_data=f"menu_set_url_{key}")])
-        
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_menus")])
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-        return
+@router.prefix("ai_set_source_", roles=ANY_ADMIN)
+async def cb_ai_set_source(query, context, arg):
+    user_id = query.from_user.id
+    source = arg
+    d = load_data()
+    if "ai_config" not in d: d["ai_config"] = {}
+    d["ai_config"]["source"] = source
+    save_data(d)
+    await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
 
-    if data.startswith("menu_toggle_"):
-        key = data.replace("menu_toggle_", "")
-        d = load_data()
-        if "menu_config" not in d: d["menu_config"] = DEFAULT_CONFIG
-        d["menu_config"][key]["active"] = not d["menu_config"][key]["active"]
+@router.prefix("ai_set_priority_", roles=ANY_ADMIN)
+async def cb_ai_set_priority(query, context, arg):
+    user_id = query.from_user.id
+    priority = arg
+    d = load_data()
+    if "ai_config" not in d: d["ai_config"] = {}
+    d["ai_config"]["priority"] = priority
+    save_data(d)
+    await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
+
+@router.prefix("ai_set_schedule_", roles=ANY_ADMIN)
+async def cb_ai_set_schedule(query, context, arg):
+    user_id = query.from_user.id
+    hours = int(arg)
+    d = load_data()
+    if "ai_config" not in d: d["ai_config"] = {}
+    d["ai_config"]["schedule"] = hours
+    save_data(d)
+    schedule_ai_update(context.job_queue)
+    await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
+
+@router.exact("ai_toggle_kill", roles=ANY_ADMIN)
+async def cb_ai_toggle_kill(query, context, arg):
+    user_id = query.from_user.id
+    d = load_data()
+    settings = d.setdefault("settings", {})
+    settings["ai_kill_switch"] = not settings.get("ai_kill_switch", False)
+    save_data(d)
+    await query.edit_message_text("✨ **مرکز کنترل هوش مصنوعی**", reply_markup=get_ai_control_menu(user_id), parse_mode='Markdown')
+
+# --- ADMIN: SET SUPPORT ---
+@router.exact("admin_set_support", roles=ANY_ADMIN)
+async def cb_admin_set_support(query, context, arg):
+    user_id = query.from_user.id
+    set_state(user_id, STATE_ADMIN_SET_SUPPORT)
+    await query.message.reply_text(
+        "📞 **تنظیم دکمه پشتیبانی**\\n\\n"
+        "لطفا یکی از موارد زیر را ارسال کنید:\\n"
+        "1. یک **لینک** (مثلا https://t.me/admin) -> دکمه به صورت لینک مستقیم باز می‌شود.\\n"
+        "2. یک **متن یا شماره** -> وقتی کاربر کلیک کند، این متن به او نمایش داده می‌شود.",
+        parse_mode='Markdown'
+    )
+
+# --- ADMIN: MENU MANAGEMENT ---
+@router.exact("admin_menus", roles=ANY_ADMIN)
+async def cb_admin_menus(query, context, arg):
+    d = load_data()
+    c = d.get("menu_config", DEFAULT_CONFIG)
+    
+    # Ensure all default keys exist (merge new buttons)
+    changed = False
+    for k, v in DEFAULT_CONFIG.items():
+        if k not in c:
+            c[k] = v
+            changed = True
+        else:
+            # Ensure nested keys like 'url' exist if they are in default
+            if "url" in v and "url" not in c[k]:
+                c[k]["url"] = v["url"]
+                changed = True
+    
+    if changed:
+        d["menu_config"] = c
         save_data(d)
-        new_status = "✅ فعال" if d["menu_config"][key]["active"] else "❌ غیرفعال"
-        await query.answer(f"دکمه {new_status} شد", show_alert=True)
-        # Refresh Logic
-        query.data = f"edit_menu_{key}" 
-        await handle_callback(update, context) 
-        return
 
-    if data.startswith("menu_set_label_"):
-        key = data.replace("menu_set_label_", "")
-        update_data(user_id, "edit_key", key)
-        set_state(user_id, STATE_ADMIN_EDIT_MENU_LABEL)
-        await query.message.reply_text(f"✍️ نام جدید برای این دکمه را وارد کنید:")
-        return
+    keyboard = []
+    for key, val in c.items():
+        status = "✅" if val["active"] else "❌"
+        keyboard.append([InlineKeyboardButton(f"{status} {val['label']}", callback_data=f"edit_menu_{key}")])
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_home")])
+    await query.edit_message_text("⚙️ **مدیریت منو**\\n\\nکدام دکمه را می‌خواهید ویرایش کنید؟", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
+@router.prefix("edit_menu_", roles=ANY_ADMIN)
+async def cb_edit_menu(query, context, arg):
+    key = arg
+        
+    d = load_data()
+    c = d.get("menu_config", DEFAULT_CONFIG).get(key, {})
+    
+    status_text = "فعال ✅" if c["active"] else "غیرفعال ❌"
+    text = f"🔧 ویرایش دکمه: **{c['label']}**\\nوضعیت فعلی: {status_text}\\n"
+    if "url" in c: text += f"لینک فعلی: {c['url']}"
+    
+    keyboard = [
+        [InlineKeyboardButton("✏️ تغییر نام دکمه", callback_data=f"menu_set_label_{key}")],
+        [InlineKeyboardButton("👁️ تغییر وضعیت (روشن/خاموش)", callback_data=f"menu_toggle_{key}")]
+    ]
+    if "url" in c:
+        keyboard.append([InlineKeyboardButton("🔗 تغییر لینک", callback_data=f"menu_set_url_{key}")])
+    
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_menus")])
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
-    if data.startswith("menu_set_url_"):
-        key = data.replace("menu_set_url_", "")
-        update_data(user_id, "edit_key", key)
-        set_state(user_id, STATE_ADMIN_EDIT_MENU_URL)
-        await query.message.reply_text(f"🔗 لینک جدید را وارد کنید (باید با https شروع شود):")
-        return
+@router.prefix("menu_toggle_", roles=ANY_ADMIN, answer=False)
+async def cb_menu_toggle(query, context, arg):
+    key = arg
+    d = load_data()
+    if "menu_config" not in d: d["menu_config"] = DEFAULT_CONFIG
+    d["menu_config"][key]["active"] = not d["menu_config"][key]["active"]
+    save_data(d)
+    new_status = "✅ فعال" if d["menu_config"][key]["active"] else "❌ غیرفعال"
+    await query.answer(f"دکمه {new_status} شد", show_alert=True)
+    # Refresh Logic
+    await cb_edit_menu(query, context, key)
+
+@router.prefix("menu_set_label_", roles=ANY_ADMIN)
+async def cb_menu_set_label(query, context, arg):
+    user_id = query.from_user.id
+    key = arg
+    update_data(user_id, "edit_key", key)
+    set_state(user_id, STATE_ADMIN_EDIT_MENU_LABEL)
+    await query.message.reply_text(f"✍️ نام جدید برای این دکمه را وارد کنید:")
 
-    # --- ADMIN: SPONSOR ---
-    if data == "admin_set_sponsor":
-        set_state(user_id, STATE_ADMIN_SPONSOR_NAME)
-        await query.message.reply_text("✍️ نام اسپانسر را وارد کنید:")
-        return
+@router.prefix("menu_set_url_", roles=ANY_ADMIN)
+async def cb_menu_set_url(query, context, arg):
+    user_id = query.from_user.id
+    key = arg
+    update_data(user_id, "edit_key", key)
+    set_state(user_id, STATE_ADMIN_EDIT_MENU_URL)
+    await query.message.reply_text(f"🔗 لینک جدید را وارد کنید (باید با https شروع شود):")
+
+# --- ADMIN: SPONSOR ---
+@router.exact("admin_set_sponsor", roles=ANY_ADMIN)
+async def cb_admin_set_sponsor(query, context, arg):
+    user_id = query.from_user.id
+    set_state(user_id, STATE_ADMIN_SPONSOR_NAME)
+    await query.message.reply_text("✍️ نام اسپانسر را وارد کنید:")
 
-    # --- ADMIN: BROADCAST ---
-    if data == "admin_broadcast":
-        set_state(user_id, STATE_ADMIN_BROADCAST)
-        await query.message.reply_text("✍️ متن پیام همگانی را بفرستید (برای همه کاربران ارسال می‌شود):")
-        return
+# --- ADMIN: BROADCAST ---
+@router.exact("admin_broadcast", roles=ANY_ADMIN)
+async def cb_admin_broadcast(query, context, arg):
+    user_id = query.from_user.id
+    set_state(user_id, STATE_ADMIN_BROADCAST)
+    await query.message.reply_text("✍️ متن پیام همگانی را بفرستید (برای همه کاربران ارسال می‌شود):")
 
-    # --- ADMIN: MANAGE ADMINS ---
-    if data == "admin_manage_admins":
-        d = load_data()
-        admins = d.get("admins", [])
-        text = f"👥 لیست ادمین‌ها:\\nOwner: {OWNER_ID}\\n" + "\\n".join([str(a) for a in admins])
-        keyboard = [
-            [InlineKeyboardButton("➕ افزودن ادمین جدید", callback_data="admin_add_new_admin")],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="admin_home")]
-        ]
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+# --- ADMIN: MANAGE ADMINS (list, roles and removal live in admin_panel) ---
+@router.exact("admin_add_new_admin", roles=ANY_ADMIN)
+async def cb_admin_add_new_admin(query, context, arg):
+    user_id = query.from_user.id
+    set_state(user_id, STATE_ADMIN_ADD_ADMIN)
+    await query.message.reply_text("🔢 شناسه عددی (ID) کاربر را وارد کنید:")
 
-    if data == "admin_add_new_admin":
-        set_state(user_id, STATE_ADMIN_ADD_ADMIN)
-        await query.message.reply_text("🔢 شناسه عددی (ID) کاربر را وارد کنید:")
-        return
+# --- BACKUP MENU ---
+@router.exact("admin_backup_menu", roles=ANY_ADMIN)
+async def cb_admin_backup_menu(query, context, arg):
+    d = load_data()
+    interval = d.get("backup_interval", 0)
+    status = "❌ خاموش" if interval == 0 else (f"✅ هر {interval} ساعت")
+    keyboard = [
+        [InlineKeyboardButton("📥 دریافت بکاپ (همین الان)", callback_data="backup_get_now")],
+        [InlineKeyboardButton("⏱ تنظیم ساعتی (1h)", callback_data="backup_set_1h"), InlineKeyboardButton("📅 تنظیم روزانه (24h)", callback_data="backup_set_24h")],
+        [InlineKeyboardButton("🚫 خاموش کردن بکاپ", callback_data="backup_off")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="admin_home")]
+    ]
+    await query.edit_message_text(f"💾 مدیریت بکاپ\\nوضعیت: {status}", reply_markup=InlineKeyboardMarkup(keyboard))
+
+@router.exact("backup_get_now", roles=ANY_ADMIN)
+async def cb_backup_get_now(query, context, arg):
+    if not await send_backup(context.bot, query.from_user.id, "💾 Manual Backup"):
+        await query.message.reply_text("❌ ساخت بکاپ ناموفق بود.")
+
+@router.exact("backup_off", roles=ANY_ADMIN)
+@router.prefix("backup_set_", roles=ANY_ADMIN)
+async def cb_backup_set(query, context, arg):
+    new_interval = 0
+    if arg == "1h": new_interval = 1
+    elif arg == "24h": new_interval = 24
+    d = load_data()
+    d['backup_interval'] = new_interval
+    save_data(d)
+    schedule_periodic(context.job_queue, 'auto_backup', send_auto_backup, new_interval, first=60, jitter=0)
+    await query.edit_message_text(f"✅ تنظیم شد: {new_interval} ساعت", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("بازگشت", callback_data="admin_backup_menu")]]))
+
+# --- USER: SUPPORT HANDLER ---
+@router.exact("menu_support")
+async def cb_menu_support(query, context, arg):
+    d = load_data()
+    sup_conf = d.get("support_config", {"mode": "text", "value": "..."})
+    text_val = sup_conf["value"]
+    await query.message.reply_text(f"📞 **اطلاعات پشتیبانی:**\\n\\n{text_val}", parse_mode='Markdown')
 
-    # --- BACKUP MENU ---
-    if data == "admin_backup_menu" and is_admin(user_id):
-        d = load_data()
-        interval = d.get("backup_interval", 0)
-        status = "❌ خاموش" if interval == 0 else (f"✅ هر {interval} ساعت")
-        keyboard = [
-            [InlineKeyboardButton("📥 دریافت بکاپ (همین الان)", callback_data="backup_get_now")],
-            [InlineKeyboardButton("⏱ تنظیم ساعتی (1h)", callback_data="backup_set_1h"), InlineKeyboardButton("📅 تنظیم روزانه (24h)", callback_data="backup_set_24h")],
-            [InlineKeyboardButton("🚫 خاموش کردن بکاپ", callback_data="backup_off")],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="admin_home")]
-        ]
-        await query.edit_message_text(f"💾 مدیریت بکاپ\\nوضعیت: {status}", reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+# --- MOBILE FLOW (AI-Powered) ---
+@router.exact("menu_mobile_list")
+async def cb_menu_mobile_list(query, context, arg):
+    keyboard = [
+        [InlineKeyboardButton("📋 لیست کلی قیمت‌ها", callback_data="mobile_list_full")],
+        [InlineKeyboardButton("🏢 انتخاب برند موبایل", callback_data="mobile_list_categories")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="main_menu")]
+    ]
+    await query.edit_message_text("📱 نحوه نمایش لیست موبایل را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-    if data == "backup_get_now":
-        if os.path.exists(DATA_FILE):
-             await context.bot.send_document(chat_id=user_id, document=open(DATA_FILE, 'rb'), caption="💾 Manual Backup")
-        else: await query.message.reply_text("❌ فایلی وجود ندارد.")
+@router.exact("mobile_list_full")
+async def cb_mobile_list_full(query, context, arg):
+    user_id = query.from_user.id
+    effective_db = get_effective_mobile_db()
+    if not effective_db:
+        await query.edit_message_text("⚠️ دیتابیس موبایل خالی است.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")]]))
         return
 
-    if data.startswith("backup_set_") or data == "backup_off":
-        new_interval = 0
-        if data == "backup_set_1h": new_interval = 1
-        elif data == "backup_set_24h": new_interval = 24
-        d = load_data()
-        d['backup_interval'] = new_interval
-        save_data(d)
-        await query.edit_message_text(f"✅ تنظیم شد: {new_interval} ساعت", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("بازگشت", callback_data="admin_backup_menu")]]))
-        return
+    chunks = MOBILE_PRICE_LIST.get(effective_db, jdatetime.date.today().strftime('%Y/%m/%d')).chunks
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            await query.edit_message_text(chunk, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")]]))
+        else:
+            await context.bot.send_message(chat_id=user_id, text=chunk, parse_mode='Markdown')
 
-    # --- USER: SUPPORT HANDLER ---
-    if data == "menu_support":
-        d = load_data()
-        sup_conf = d.get("support_config", {"mode": "text", "value": "..."})
-        text_val = sup_conf["value"]
-        await query.message.reply_text(f"📞 **اطلاعات پشتیبانی:**\\n\\n{text_val}", parse_mode='Markdown')
+@router.exact("mobile_list_categories")
+async def cb_mobile_list_categories(query, context, arg):
+    keyboard = []
+    effective_db = get_effective_mobile_db()
+    if not effective_db:
+        await query.edit_message_text("⚠️ دیتابیس موبایل خالی است. لطفا از پنل مدیریت فایل اکسل آپلود کنید یا آپلود AI را بزنید.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")]]))
         return
+    for brand in effective_db.keys(): keyboard.append([InlineKeyboardButton(brand, callback_data=pack(MOB_BRAND, effective_db.catalog_id(brand)))])
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")])
+    await query.edit_message_text("📱 برند موبایل را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+# Legacy name-based payloads (buttons sent before compact IDs)
+@router.prefix("mob_brand_")
+async def cb_mob_brand(query, context, arg):
+    await show_mobile_models(query, arg)
+
+@router.prefix("mob_model_")
+async def cb_mob_model(query, context, arg):
+    rest = arg
+    parts = rest.split("_", 1)
+    await show_mobile_model(query, parts[0], parts[1] if len(parts) > 1 else "")
+
+@router.prefix("mob_variant_")
+async def cb_mob_variant(query, context, arg):
+    rest = arg
+    # format: brand_model_idx
+    # since model can have underscores, we split from the right
+    parts = rest.rsplit("_", 1)
+    idx = int(parts[1])
+    bm_parts = parts[0].split("_", 1)
+    brand_name = bm_parts[0]
+    model_name = bm_parts[1] if len(bm_parts) > 1 else ""
+    found_model = get_effective_mobile_db().get_model(brand_name, model_name)
+    if found_model and idx < len(found_model.get("variants", ())):
+        await show_mobile_variant(query, brand_name, model_name, found_model["variants"][idx])
+
+# --- CAR PRICE LIST (AI-Powered) ---
+@router.exact("menu_prices")
+async def cb_menu_prices(query, context, arg):
+    keyboard = [
+        [InlineKeyboardButton("📋 لیست کلی قیمت‌ها", callback_data="car_list_full")],
+        [InlineKeyboardButton("🏢 انتخاب برند خودرو", callback_data="car_list_categories")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="main_menu")]
+    ]
+    await query.edit_message_text("🚗 نحوه نمایش لیست قیمت خودرو را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-    # --- MOBILE FLOW (AI-Powered) ---
-    if data == "menu_mobile_list":
-        keyboard = [
-            [InlineKeyboardButton("📋 لیست کلی قیمت‌ها", callback_data="mobile_list_full")],
-            [InlineKeyboardButton("🏢 انتخاب برند موبایل", callback_data="mobile_list_categories")],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="main_menu")]
-        ]
-        await query.edit_message_text("📱 نحوه نمایش لیست موبایل را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
+@router.exact("car_list_full")
+async def cb_car_list_full(query, context, arg):
+    user_id = query.from_user.id
+    effective_db = get_effective_car_db()
+    if not effective_db:
+        await query.edit_message_text("⚠️ دیتابیس خودرو خالی است.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")]]))
         return
 
-    if data == "mobile_list_full":
-        effective_db = get_effective_mobile_db()
-        if not effective_db:
-            await query.edit_message_text("⚠️ دیتابیس موبایل خالی است.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")]]))
-            return
-
-        lines = [f"📱 **لیست قیمت روز موبایل**\n📅 تاریخ: {jdatetime.date.today().strftime('%Y/%m/%d')}\n"]
-        for brand, b_data in effective_db.items():
-            lines.append(f"\n🏷 **{brand}**")
-            lines.append("-------------------")
-            for model in b_data.get("models", []):
-                variants = model.get("variants", [])
-                if not variants and "price" in model:
-                    # Legacy support
-                    price = model['price']
-                    try: p_str = f"{int(float(str(price).replace(',', ''))):,} تومان"
-                    except: p_str = str(price)
-                    lines.append(f"🔹 {model['name']} ({model.get('storage', '-')}) ➔ {p_str}")
-                else:
-                    for variant in variants:
-                        m_price = variant.get('marketPrice', 0)
-                        o_price = variant.get('officialPrice', 0)
-                        
-                        try:
-                            m_val = int(float(str(m_price).replace(',', '')))
-                            m_str = f"{m_val:,} تومان"
-                        except:
-                            m_val = 0
-                            m_str = str(m_price)
-                        
-                        try:
-                            o_val = int(float(str(o_price).replace(',', '')))
-                            o_str = f"{o_val:,} تومان"
-                        except:
-                            o_val = 0
-                            o_str = str(o_price)
-
-                        lines.append(f"🔹 **{model['name']} ({variant['name']})**")
-                        if o_val > 0 or (isinstance(o_price, str) and o_price.strip() != ""):
-                            lines.append(f"   🛡 گارانتی: {o_str}")
-                        lines.append(f"   🏪 بازار: {m_str}")
-                        lines.append("")
-            lines.append("-------------------")
-
-        # Split into messages of max 4000 chars
-        full_text = "\n".join(lines)
-        chunks = [full_text[i:i+4000] for i in range(0, len(full_text), 4000)]
-        
-        for i, chunk in enumerate(chunks):
-            if i == 0:
-                await query.edit_message_text(chunk, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")]]))
-            else:
-                await context.bot.send_message(chat_id=user_id, text=chunk, parse_mode='Markdown')
-        return
+    chunks = CAR_PRICE_LIST.get(effective_db, jdatetime.date.today().strftime('%Y/%m/%d')).chunks
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            await query.edit_message_text(chunk, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")]]))
+        else:
+            await context.bot.send_message(chat_id=user_id, text=chunk, parse_mode='Markdown')
 
-    if data == "mobile_list_categories":
-        keyboard = []
-        effective_db = get_effective_mobile_db()
-        if not effective_db:
-            await query.edit_message_text("⚠️ دیتابیس موبایل خالی است. لطفا از پنل مدیریت فایل اکسل آپلود کنید یا آپلود AI را بزنید.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")]]))
-            return
-        for brand in effective_db.keys(): keyboard.append([InlineKeyboardButton(brand, callback_data=f"mob_brand_{brand}")])
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")])
-        await query.edit_message_text("📱 برند موبایل را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
+@router.exact("car_list_categories")
+async def cb_car_list_categories(query, context, arg):
+    keyboard = []
+    effective_db = get_effective_car_db()
+    if not effective_db:
+        await query.edit_message_text("⚠️ دیتابیس خودرو خالی است. لطفا از پنل مدیریت فایل اکسل آپلود کنید یا آپلود AI را بزنید.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")]]))
         return
+    for brand in effective_db.keys(): keyboard.append([InlineKeyboardButton(brand, callback_data=pack(CAR_BRAND, effective_db.catalog_id(brand)))])
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")])
+    await query.edit_message_text("🏢 شرکت سازنده را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-    if data.startswith("mob_brand_"):
-        brand_name = data.replace("mob_brand_", "")
-        effective_db = get_effective_mobile_db()
-        if brand_name in effective_db:
-            keyboard = []
-            for model in effective_db[brand_name]["models"]:
-                keyboard.append([InlineKeyboardButton(model["name"], callback_data=f"mob_model_{brand_name}_{model['name']}")])
-            keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_mobile_list")])
-            await query.edit_message_text(f"مدل‌های {brand_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+# Legacy name-based payloads (buttons sent before compact IDs)
+@router.prefix("brand_")
+async def cb_brand(query, context, arg):
+    user_id = query.from_user.id
+    await show_car_models(query, user_id, arg)
 
-    if data.startswith("mob_model_"):
-        rest = data.replace("mob_model_", "")
-        parts = rest.split("_", 1)
-        brand_name = parts[0]
-        model_name = parts[1] if len(parts) > 1 else ""
-        
-        found_model = None
-        effective_db = get_effective_mobile_db()
-        if brand_name in effective_db:
-            for m in effective_db[brand_name]["models"]:
-                if m["name"] == model_name: found_model = m; break
-        
-        if found_model:
-            variants = found_model.get("variants", [])
-            if not variants:
-                # Legacy support
-                price = found_model.get('price', '-')
-                try: p_str = f"{int(float(str(price).replace(',', ''))):,} تومان"
-                except: p_str = str(price)
-                
-                text = (f"📱 **قیمت روز موبایل**\n"
-                        f"🏷 مدل: {found_model['name']}\n"
-                        f"💾 حافظه: {found_model.get('storage', '-')}\n"
-                        f"-------------------\n"
-                        f"💰 **قیمت:** {p_str}")
-                keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data=f"mob_brand_{brand_name}")]]
-                await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-            else:
-                keyboard = []
-                for idx, variant in enumerate(variants):
-                    keyboard.append([InlineKeyboardButton(variant["name"], callback_data=f"mob_variant_{brand_name}_{model_name}_{idx}")])
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data=f"mob_brand_{brand_name}")])
-                await query.edit_message_text(f"مدل {model_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+@router.prefix("model_")
+async def cb_model(query, context, arg):
+    user_id = query.from_user.id
+    model_name = arg
+    await show_car_model(query, user_id, resolve_car_brand(user_id, model_name, get_effective_car_db()), model_name)
 
-    if data.startswith("mob_variant_"):
-        rest = data.replace("mob_variant_", "")
-        # format: brand_model_idx
-        # since model can have underscores, we split from the right
-        parts = rest.rsplit("_", 1)
-        idx = int(parts[1])
-        brand_model = parts[0]
-        bm_parts = brand_model.split("_", 1)
-        brand_name = bm_parts[0]
-        model_name = bm_parts[1] if len(bm_parts) > 1 else ""
-        
-        found_variant = None
-        effective_db = get_effective_mobile_db()
-        if brand_name in effective_db:
-            for m in effective_db[brand_name]["models"]:
-                if m["name"] == model_name and idx < len(m.get("variants", [])):
-                    found_variant = m["variants"][idx]
-                    break
-        
-        if found_variant:
-            m_p = found_variant.get('marketPrice', 0)
-            o_p = found_variant.get('officialPrice', 0)
-            
-            try:
-                m_val = int(float(str(m_p).replace(',', '')))
-                m_str = f"{m_val:,} تومان"
-            except:
-                m_val = 0
-                m_str = str(m_p)
-            
-            try:
-                o_val = int(float(str(o_p).replace(',', '')))
-                o_str = f"{o_val:,} تومان"
-            except:
-                o_val = 0
-                o_str = str(o_p)
-
-            text = (f"📊 **استعلام قیمت موبایل**\n\n"
-                    f"📱 {model_name} ({found_variant['name']})\n"
-                    f"-------------------\n"
-                    f"📉 **قیمت بازار:**\n"
-                    f"💰 {m_str}\n\n")
-            
-            if o_val > 0 or (isinstance(o_p, str) and o_p.strip() != ""):
-                text += (f"🛡 **گارانتی:**\n"
-                         f"🏦 {o_str}")
-            
-            keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data=f"mob_model_{brand_name}_{model_name}")]]
-            await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+@router.prefix("variant_")
+async def cb_variant(query, context, arg):
+    user_id = query.from_user.id
+    model_name, idx = arg.rsplit("_", 1)
+    idx = int(idx)
+    brand_name = resolve_car_brand(user_id, model_name, get_effective_car_db())
+    found_model = get_effective_car_db().get_model(brand_name, model_name)
+    if found_model and idx < len(found_model.get("variants", ())):
+        await show_car_variant(query, brand_name, model_name, found_model["variants"][idx])
+
+@router.exact("menu_search")
+async def cb_menu_search(query, context, arg):
+    user_id = query.from_user.id
+    set_state(user_id, STATE_SEARCH)
+    await query.edit_message_text("🔍 نام خودرو یا برند مورد نظر را وارد کنید:", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="main_menu")]]))
 
-    # --- CAR PRICE LIST (AI-Powered) ---
-    if data == "menu_prices":
-        keyboard = [
-            [InlineKeyboardButton("📋 لیست کلی قیمت‌ها", callback_data="car_list_full")],
-            [InlineKeyboardButton("🏢 انتخاب برند خودرو", callback_data="car_list_categories")],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data="main_menu")]
-        ]
-        await query.edit_message_text("🚗 نحوه نمایش لیست قیمت خودرو را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+@router.exact("menu_estimate")
+async def cb_menu_estimate(query, context, arg):
+    user_id = query.from_user.id
+    set_state(user_id, STATE_ESTIMATE_BRAND)
+    keyboard = []
+    effective_db = get_effective_car_db()
+    for brand in effective_db.keys(): keyboard.append([InlineKeyboardButton(brand, callback_data=pack(CAR_BRAND, effective_db.catalog_id(brand)))])
+    keyboard.append([InlineKeyboardButton("🔙 انصراف", callback_data="main_menu")])
+    await query.edit_message_text("برند را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-    if data == "car_list_full":
-        effective_db = get_effective_car_db()
-        if not effective_db:
-            await query.edit_message_text("⚠️ دیتابیس خودرو خالی است.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")]]))
-            return
+@router.prefix("year_")
+async def cb_year(query, context, arg):
+    user_id = query.from_user.id
+    year = int(arg)
+    update_data(user_id, "year", year)
+    set_state(user_id, STATE_ESTIMATE_MILEAGE)
+    await query.edit_message_text("کارکرد (کیلومتر) را وارد کنید (فقط عدد):")
 
-        lines = [f"🚗 **لیست قیمت روز خودرو**\n📅 تاریخ: {jdatetime.date.today().strftime('%Y/%m/%d')}\n"]
-        for brand, b_data in effective_db.items():
-            lines.append(f"\n🏢 **{brand}**")
-            lines.append("-------------------")
-            for model in b_data.get("models", []):
-                for variant in model.get("variants", []):
-                    m_price = variant.get('marketPrice', 0)
-                    f_price = variant.get('factoryPrice', 0)
-                    
-                    try:
-                        m_val = int(float(str(m_price).replace(',', '')))
-                        m_str = f"{m_val:,} تومان"
-                    except:
-                        m_val = 0
-                        m_str = str(m_price)
-                    
-                    try:
-                        f_val = int(float(str(f_price).replace(',', '')))
-                        f_str = f"{f_val:,} تومان"
-                    except:
-                        f_val = 0
-                        f_str = str(f_price)
-                    
-                    diff = m_val - f_val if f_val > 0 and m_val > 0 else 0
-                    try: d_str = f"{diff:,} تومان"
-                    except: d_str = str(diff)
-
-                    lines.append(f"🔹 **{model['name']} ({variant['name']})**")
-                    lines.append(f"   🏠 کارخانه: {f_str}")
-                    lines.append(f"   🏪 بازار: {m_str}")
-                    if diff > 0:
-                        lines.append(f"   📈 اختلاف: {d_str}")
-                    elif diff < 0:
-                        lines.append(f"   📉 اختلاف: {d_str}")
-                    lines.append("")
-            lines.append("-------------------")
-
-        full_text = "\n".join(lines)
-        chunks = [full_text[i:i+4000] for i in range(0, len(full_text), 4000)]
+@router.prefix("paint_")
+async def cb_paint(query, context, arg):
+    user_id = query.from_user.id
+    paint_idx = int(arg)
+    condition = PAINT_CONDITIONS[paint_idx]
+    user_data = get_state(user_id)["data"]
+    brand, model, year, mileage = user_data.get("brand"), user_data.get("model"), user_data.get("year"), user_data.get("mileage")
+    
+    zero_price = 800000000 # Default fallback 800M
+    effective_db = get_effective_car_db()
+    found_model = effective_db.get_model(resolve_car_brand(user_id, model, effective_db), model)
+    first_variant = found_model["variants"][0] if found_model and found_model.get("variants") else {}
+    if "marketPrice" in first_variant and has_price(first_variant, "marketPrice"):
+        zero_price = first_variant["marketPrice"]
+    
+    age = 1404 - year
+    age_drop = 0.05 if age == 1 else (0.05 + ((age - 1) * 0.035) if age > 1 else 0)
+    if age > 10: age_drop = 0.40
+    
+    diff = mileage - (age * 20000)
+    mileage_drop = (diff / 10000) * 0.01 if diff > 0 else (diff / 10000) * 0.005
+    mileage_drop = max(min(mileage_drop, 0.15), -0.05)
         
-        for i, chunk in enumerate(chunks):
-            if i == 0:
-                await query.edit_message_text(chunk, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")]]))
-            else:
-                await context.bot.send_message(chat_id=user_id, text=chunk, parse_mode='Markdown')
-        return
+    total_drop = age_drop + mileage_drop + condition["drop"]
+    final_price = round((zero_price * (1 - total_drop)) / 1000000) * 1000000
+    
+    today = jdatetime.date.today().strftime('%Y/%m/%d')
+    result = (f"🎯 **کارشناسی قیمت**\n"
+              f"📅 تاریخ: {today}\n"
+              f"🚙 **{brand} {model}**\n"
+              f"-----------------\n"
+              f"📅 سال: {year} | 🛣 کارکرد: {mileage:,}\n"
+              f"🎨 بدنه: {condition['label']}\n"
+              f"-----------------\n"
+              f"💰 **قیمت تقریبی:** {final_price:,} تومان")
+    
+    keyboard = [[InlineKeyboardButton("🏠 منوی اصلی", callback_data="main_menu")]]
+    await query.edit_message_text(result, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+    reset_state(user_id)
 
-    if data == "car_list_categories":
-        keyboard = []
-        effective_db = get_effective_car_db()
-        if not effective_db:
-            await query.edit_message_text("⚠️ دیتابیس خودرو خالی است. لطفا از پنل مدیریت فایل اکسل آپلود کنید یا آپلود AI را بزنید.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")]]))
-            return
-        for brand in effective_db.keys(): keyboard.append([InlineKeyboardButton(brand, callback_data=f"brand_{brand}")])
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")])
-        await query.edit_message_text("🏢 شرکت سازنده را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+def make_gemini_model():
+    genai.configure(api_key=GEMINI_API_KEY)
+    # Using urlContext for direct grounding on the provided high-quality sources
+    # We also keep google_search as a fallback/supplement
+    try:
+        return genai.GenerativeModel('gemini-3-flash-preview', tools=[{'urlContext': {}}, {'google_search': {}}])
+    except:
+        return genai.GenerativeModel('gemini-3-flash-preview')
+
+def apply_ai_update(new_cars, new_mobs, today):
+    if new_cars:
+        CAR_DB_AI.update(new_cars)
+        save_car_db("ai", brands=new_cars.keys())
+    if new_mobs:
+        MOBILE_DB_AI.update(new_mobs)
+        save_mobile_db("ai", brands=new_mobs.keys())
+
+    # Also save a text version for the "Full List" cache
+    d = load_data()
+    if "cache" not in d: d["cache"] = {}
+    d["cache"]["car_date"] = today
+    d["cache"]["mobile_date"] = today
+    save_data(d)
+
+AI_UPDATE_LOCK = asyncio.Lock() # one refresh at a time, manual or scheduled
+AI_UPDATE_JOB = 'ai_update'
+AI_SOURCE_CACHE = ai_refresh.SourceCache('ai_source_cache.json')
+AI_STATS = ai_providers.ProviderStats() # latency/error counts of every provider since start
+
+def ai_provider_names():
+    """Providers for the configured source that have a key; 'hybrid' uses all of them, hedged in this order."""
+    keys = {'gemini': GEMINI_API_KEY, 'deepseek': DEEPSEEK_API_KEY, 'openai': OPENAI_API_KEY}
+    source = load_data().get("ai_config", {}).get("source", "gemini")
+    names = list(keys) if source == 'hybrid' else [source]
+    return [name for name in names if keys.get(name)]
+
+def make_ai_provider():
+    factories = {
+        'gemini': lambda: ai_providers.GeminiProvider(make_gemini_model()),
+        'deepseek': lambda: ai_providers.deepseek_provider(DEEPSEEK_API_KEY),
+        'openai': lambda: ai_providers.openai_provider(OPENAI_API_KEY),
+    }
+    return ai_providers.HedgedDispatcher([factories[name]() for name in ai_provider_names()], stats=AI_STATS)
 
-    if data.startswith("brand_"):
-        brand_name = data.replace("brand_", "")
-        current_state = get_state(user_id)["state"]
-        effective_db = get_effective_car_db()
-        if current_state == STATE_ESTIMATE_BRAND:
-            update_data(user_id, "brand", brand_name)
-            set_state(user_id, STATE_ESTIMATE_MODEL)
-            keyboard = []
-            if brand_name in effective_db:
-                for model in effective_db[brand_name]["models"]: keyboard.append([InlineKeyboardButton(model["name"], callback_data=f"model_{model['name']}")])
-            keyboard.append([InlineKeyboardButton("🔙 انصراف", callback_data="main_menu")])
-            await query.edit_message_text(f"خودروی {brand_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
-            return
-        
-        if brand_name in effective_db:
-            keyboard = []
-            for model in effective_db[brand_name]["models"]: keyboard.append([InlineKeyboardButton(model["name"], callback_data=f"model_{model['name']}")])
-            keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_prices")])
-            await query.edit_message_text(f"مدل‌های {brand_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+def ai_update_available():
+    return bool(ai_provider_names())
 
-    if data.startswith("model_"):
-        model_name = data.replace("model_", "")
-        current_state = get_state(user_id)["state"]
-        if current_state == STATE_ESTIMATE_MODEL:
-            update_data(user_id, "model", model_name)
-            set_state(user_id, STATE_ESTIMATE_YEAR)
-            keyboard = []
-            row = []
-            for i, year in enumerate(YEARS):
-                row.append(InlineKeyboardButton(str(year), callback_data=f"year_{year}"))
-                if (i + 1) % 3 == 0: keyboard.append(row); row = []
-            if row: keyboard.append(row)
-            await query.edit_message_text("سال ساخت:", reply_markup=InlineKeyboardMarkup(keyboard))
-            return
+def ai_kill_switch_on():
+    return bool(load_data().get("settings", {}).get("ai_kill_switch"))
 
-        found_model, brand_name = None, ""
-        effective_db = get_effective_car_db()
-        for b_name, b_data in effective_db.items():
-            for m in b_data["models"]:
-                if m["name"] == model_name: found_model = m; brand_name = b_name; break
-        
-        if found_model:
-            keyboard = []
-            for idx, variant in enumerate(found_model["variants"]):
-                keyboard.append([InlineKeyboardButton(variant["name"], callback_data=f"variant_{model_name}_{idx}")])
-            keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data=f"brand_{brand_name}")])
-            await query.edit_message_text(f"تیپ خودرو {model_name}:", reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+async def refresh_ai_prices(progress=None):
+    async with AI_UPDATE_LOCK:
+        today = jdatetime.date.today().strftime('%Y/%m/%d')
+        provider = make_ai_provider()
+        try:
+            # The source cache marks the groups extracted only after they are saved
+            await ai_refresh.run_refresh(provider, today, progress=progress, cache=AI_SOURCE_CACHE,
+                                         apply=lambda new_cars, new_mobs: apply_ai_update(new_cars, new_mobs, today))
+        finally:
+            await provider.aclose()
 
-    if data.startswith("variant_"):
-        parts = data.split("_")
-        model_name, idx = parts[1], int(parts[2])
-        found_variant = None
-        effective_db = get_effective_car_db()
-        for b_data in effective_db.values():
-            for m in b_data["models"]:
-                if m["name"] == model_name and idx < len(m["variants"]): found_variant = m["variants"][idx]; break
-        
-        if found_variant:
-            m_price = found_variant.get('marketPrice', 0)
-            f_price = found_variant.get('factoryPrice', 0)
-            
-            def format_p(p):
-                try:
-                    # Check if it's a number or can be converted to one
-                    val = float(str(p).replace(',', ''))
-                    return f"{int(val):,} تومان"
-                except:
-                    return str(p)
-            
-            m_text = format_p(m_price)
-            f_text = format_p(f_price)
-            
-            diff_text = ""
-            try:
-                m_val = int(float(str(m_price).replace(',', '')))
-                f_val = int(float(str(f_price).replace(',', '')))
-                diff = m_val - f_val
-                diff_text = f"\n\n⚖️ **اختلاف قیمت:**\n💰 {diff:,} تومان"
-            except:
-                pass
-
-            text = (f"📊 **استعلام قیمت**\n\n"
-                    f"🚘 {found_variant['name']}\n"
-                    f"-------------------\n"
-                    f"📉 **قیمت بازار:**\n"
-                    f"💰 {m_text}\n\n"
-                    f"🏭 **کارخانه:**\n"
-                    f"🏦 {f_text}"
-                    f"{diff_text}")
-            
-            keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data=f"model_{model_name}")]]
-            await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-        return
+async def run_ai_update(query):
+    # Runs as an application task so other users' updates keep flowing
+    try:
+        await refresh_ai_prices(progress=query.edit_message_text)
+        await query.edit_message_text("✅ دیتابیس با موفقیت بروزرسانی شد.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="admin_ai_control")]]))
+    except Exception as e:
+        logger.error(f"AI update error: {e}")
+        await query.edit_message_text(f"❌ خطا در بروزرسانی: {e}")
 
-    if data == "menu_search":
-        set_state(user_id, STATE_SEARCH)
-        await query.edit_message_text("🔍 نام خودرو یا برند مورد نظر را وارد کنید:", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="main_menu")]]))
+async def scheduled_ai_update(context: ContextTypes.DEFAULT_TYPE):
+    # Users keep reading the current snapshot; it is swapped only after a successful refresh
+    if ai_kill_switch_on():
+        logger.info("Scheduled AI update skipped: kill switch is on")
         return
-
-    if data == "menu_estimate":
-        set_state(user_id, STATE_ESTIMATE_BRAND)
-        keyboard = []
-        effective_db = get_effective_car_db()
-        for brand in effective_db.keys(): keyboard.append([InlineKeyboardButton(brand, callback_data=f"brand_{brand}")])
-        keyboard.append([InlineKeyboardButton("🔙 انصراف", callback_data="main_menu")])
-        await query.edit_message_text("برند را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(keyboard))
+    if not ai_update_available() or AI_UPDATE_LOCK.locked():
+        logger.info("Scheduled AI update skipped: unavailable or already running")
         return
+    await refresh_ai_prices()
+    logger.info("Scheduled AI update finished")
 
-    if data.startswith("year_"):
-        year = int(data.replace("year_", ""))
-        update_data(user_id, "year", year)
-        set_state(user_id, STATE_ESTIMATE_MILEAGE)
-        await query.edit_message_text("کارکرد (کیلومتر) را وارد کنید (فقط عدد):")
-        return
+def schedule_ai_update(job_queue):
+    hours = load_data().get("ai_config", {}).get("schedule", 0)
+    schedule_periodic(job_queue, AI_UPDATE_JOB, scheduled_ai_update, int(hours or 0))
 
-    if data.startswith("paint_"):
-        paint_idx = int(data.replace("paint_", ""))
-        condition = PAINT_CONDITIONS[paint_idx]
-        user_data = get_state(user_id)["data"]
-        brand, model, year, mileage = user_data.get("brand"), user_data.get("model"), user_data.get("year"), user_data.get("mileage")
-        
-        zero_price = 800000000 # Default fallback 800M
-        effective_db = get_effective_car_db()
-        for b in effective_db.values():
-            for m in b.get("models", []):
-                if m["name"] == model:
-                    try:
-                        p_val = m["variants"][0]["marketPrice"]
-                        zero_price = int(float(str(p_val).replace(',', '')))
-                    except:
-                        pass
-                    break
-        
-        age = 1404 - year
-        age_drop = 0.05 if age == 1 else (0.05 + ((age - 1) * 0.035) if age > 1 else 0)
-        if age > 10: age_drop = 0.40
-        
-        diff = mileage - (age * 20000)
-        mileage_drop = (diff / 10000) * 0.01 if diff > 0 else (diff / 10000) * 0.005
-        mileage_drop = max(min(mileage_drop, 0.15), -0.05)
-            
-        total_drop = age_drop + mileage_drop + condition["drop"]
-        final_price = round((zero_price * (1 - total_drop)) / 1000000) * 1000000
-        
-        today = jdatetime.date.today().strftime('%Y/%m/%d')
-        result = (f"🎯 **کارشناسی قیمت**\n"
-                  f"📅 تاریخ: {today}\n"
-                  f"🚙 **{brand} {model}**\n"
-                  f"-----------------\n"
-                  f"📅 سال: {year} | 🛣 کارکرد: {mileage:,}\n"
-                  f"🎨 بدنه: {condition['label']}\n"
-                  f"-----------------\n"
-                  f"💰 **قیمت تقریبی:** {final_price:,} تومان")
-        
-        keyboard = [[InlineKeyboardButton("🏠 منوی اصلی", callback_data="main_menu")]]
-        await query.edit_message_text(result, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-        reset_state(user_id)
+@router.exact("ai_update_now", roles=ANY_ADMIN)
+async def cb_ai_update_now(query, context, arg):
+    if not ai_update_available():
+        await query.edit_message_text("⚠️ کلید API برای منبع انتخاب‌شده تنظیم نشده است.")
         return
-
-    if data == "ai_update_now" and is_admin(user_id):
-        d = load_data()
-        conf = d.get("ai_config", {})
-        source = conf.get("source", "gemini")
-        today = jdatetime.date.today().strftime('%Y/%m/%d')
-        
-        await query.edit_message_text(f"⏳ در حال بروزرسانی دیتابیس از طریق هوش مصنوعی (با استعلام از منابع معتبر)...")
-        try:
-            if source == 'gemini' and GEMINI_API_KEY:
-                genai.configure(api_key=GEMINI_API_KEY)
-                # Using urlContext for direct grounding on the provided high-quality sources
-                # We also keep google_search as a fallback/supplement
-                try:
-                    model = genai.GenerativeModel('gemini-3-flash-preview', tools=[{'urlContext': {}}, {'google_search': {}}])
-                except:
-                    model = genai.GenerativeModel('gemini-3-flash-preview')
-                
-                # Reference URLs for grounding
-                car_url = "https://www.iranjib.ir/showgroup/45/%D9%82%DB%8C%D9%85%D8%AA-%D8%AE%D9%88%D8%AF%D8%B1%D9%88-%D8%AA%D9%88%D9%84%DB%8C%D8%AF-%D8%AF%D8%A7%D8%AE%D9%84/"
-                mob_url_1 = "https://www.iranjib.ir/showgroup/28/%D9%82%DB%8C%D9%85%D8%AA-%D8%B1%D9%88%D8%B2-%D9%85%D9%88%D8%A8%D8%A7%DB%8C%D9%84/"
-                mob_url_2 = "https://torob.com/browse/94/%DA%AF%D9%88%D8%B4%DB%8C-%D9%85%D9%88%D8%A8%D8%A7%DB%8C%D9%84-mobile/?stock_status=new"
-                mob_url_3 = "https://www.mobile.ir/phones/prices.aspx?terms=&brandid=&provinceid=&duration=1&price_from=-1&price_to=-1&shopid=&pagesize=50&sort=date&dir=desc&submit=%D8%AC%D8%B3%D8%AA%D8%AC%D9%88"
-
-                headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-                
-                def fetch_and_clean(url):
-                    try:
-                        html = requests.get(url, headers=headers, timeout=10).text
-                        import re
-                        html = re.sub(r'<script.*?</script>', '', html, flags=re.DOTALL|re.IGNORECASE)
-                        html = re.sub(r'<style.*?</style>', '', html, flags=re.DOTALL|re.IGNORECASE)
-                        html = re.sub(r'<[^>]+>', ' ', html)
-                        return re.sub(r'\s+', ' ', html).strip()
-                    except:
-                        return "خطا در دریافت اطلاعات از سایت"
-
-                car_html = fetch_and_clean(car_url)
-                mob_html_1 = fetch_and_clean(mob_url_1)
-                mob_html_2 = fetch_and_clean(mob_url_2)
-                mob_html_3 = fetch_and_clean(mob_url_3)
-
-                # Fetching structured JSON for Cars
-                car_prompt = (
-                    f"امروز {today} است. وظیفه شما استخراج دقیق‌ترین و بروزترین قیمت خودروهای صفر در ایران است. "
-                    f"در ادامه محتوای متنی سایت ایران جیب (منبع معتبر قیمت خودرو) آورده شده است. "
-                    f"لطفا قیمت‌ها را دقیقا از این متن استخراج کنید:\n\n{car_html[:25000]}\n\n"
-                    "قیمت‌ها باید دقیقا مطابق با متن بالا باشند. "
-                    "خروجی فقط و فقط به صورت یک JSON معتبر با ساختار زیر باشد:\n"
-                    "{\n"
-                    "  \"ایران خودرو\": {\n"
-                    "    \"models\": [\n"
-                    "      {\n"
-                    "        \"name\": \"پژو 207\",\n"
-                    "        \"variants\": [\n"
-                    "          {\n"
-                    "            \"name\": \"دنده ای هیدرولیک\",\n"
-                    "            \"factoryPrice\": 450000000,\n"
-                    "            \"marketPrice\": 750000000\n"
-                    "          }\n"
-                    "        ]\n"
-                    "      }\n"
-                    "    ]\n"
-                    "  }\n"
-                    "}\n"
-                    "تمام برندهای اصلی (سایپا، مدیران خودرو، کرمان موتور و غیره) را شامل شود. قیمت‌ها به تومان و عدد باشند."
-                )
-                car_resp = model.generate_content(car_prompt)
-                
-                # Fetching structured JSON for Mobiles
-                mob_prompt = (
-                    f"امروز {today} است. وظیفه شما استخراج دقیق‌ترین و بروزترین قیمت گوشی‌های موبایل در ایران است. "
-                    f"در ادامه محتوای متنی از ۳ سایت معتبر (ایران جیب، ترب، موبایل دات آی آر) آورده شده است:\n\n"
-                    f"منبع ۱:\n{mob_html_1[:10000]}\n\n"
-                    f"منبع ۲:\n{mob_html_2[:10000]}\n\n"
-                    f"منبع ۳:\n{mob_html_3[:10000]}\n\n"
-                    "لطفا قیمت‌ها را از این سه منبع تحلیل کنید و برای هر مدل گوشی، فقط یک قیمت نهایی (میانگین یا معتبرترین قیمت) ارائه دهید. "
-                    "به هیچ وجه نام سایت‌ها را در خروجی نیاورید و برای هر مدل فقط یک قیمت ثبت کنید. "
-                    "قیمت رسمی (با گارانتی) و قیمت بازار را تفکیک کنید. "
-                    "خروجی فقط و فقط به صورت یک JSON معتبر با ساختار زیر باشد:\n"
-                    "{\n"
-                    "  \"Samsung\": {\n"
-                    "    \"models\": [\n"
-                    "      {\n"
-                    "        \"name\": \"Galaxy S24 Ultra\",\n"
-                    "        \"variants\": [\n"
-                    "          {\n"
-                    "            \"name\": \"256GB RAM 12\",\n"
-                    "            \"officialPrice\": 72000000,\n"
-                    "            \"marketPrice\": 68000000\n"
-                    "          }\n"
-                    "        ]\n"
-                    "      }\n"
-                    "    ]\n"
-                    "  }\n"
-                    "}\n"
-                    "برندهای Apple, Samsung, Xiaomi را شامل شود. قیمت‌ها به تومان و عدد باشند."
-                )
-                mob_resp = model.generate_content(mob_prompt)
-                
-                def parse_json(text):
-                    try:
-                        # Clean markdown code blocks if present
-                        clean_text = re.sub(r'```json\n?|\n?```', '', text).strip()
-                        return json.loads(clean_text)
-                    except: return None
-
-                new_cars = parse_json(car_resp.text)
-                new_mobs = parse_json(mob_resp.text)
-
-                if new_cars:
-                    CAR_DB_AI.update(new_cars)
-                    save_car_db("ai")
-                
-                if new_mobs:
-                    MOBILE_DB_AI.update(new_mobs)
-                    save_mobile_db("ai")
-
-                # Also save a text version for the "Full List" cache
-                if "cache" not in d: d["cache"] = {}
-                d["cache"]["car_date"] = today
-                d["cache"]["mobile_date"] = today
-                save_data(d)
-                
-                await query.edit_message_text("✅ دیتابیس با موفقیت بروزرسانی شد.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="admin_ai_control")]])) 
-            else:
-                await query.edit_message_text("⚠️ در حال حاضر فقط Gemini برای آپدیت دیتابیس پشتیبانی می‌شود.")
-        except Exception as e:
-            await query.edit_message_text(f"❌ خطا در بروزرسانی: {e}")
+    if ai_kill_switch_on():
+        await query.edit_message_text("🛑 آپدیت هوش مصنوعی با سوئیچ توقف اضطراری غیرفعال است.")
         return
+    if AI_UPDATE_LOCK.locked():
+        await query.edit_message_text("⏳ یک بروزرسانی در حال اجراست، لطفا صبر کنید.")
+        return
+    await query.edit_message_text(f"⏳ در حال بروزرسانی دیتابیس از طریق هوش مصنوعی (با استعلام از منابع معتبر)...")
+    context.application.create_task(run_ai_update(query))
+
+@router.exact("ai_stats", roles=ANY_ADMIN)
+async def cb_ai_stats(query, context, arg):
+    summary = AI_STATS.summary()
+    lines = ["📈 **آمار سرویس‌های هوش مصنوعی**", ""]
+    for name, s in summary.items():
+        latency = f"p50 {s['p50']:.1f}s / p95 {s['p95']:.1f}s" if s['p50'] is not None else "-"
+        lines.append(f"• {name}: {s['ok']} موفق، {s['error']} خطا، {s['timeout']} تایم‌اوت، {s['cancelled']} لغو | {latency}")
+    if not summary: lines.append("هنوز درخواستی ارسال نشده است.")
+    lines.append(f"\nدرخواست‌های موازی (hedge): {AI_STATS.hedges}")
+    await query.edit_message_text("\n".join(lines), reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="admin_ai_control")]]), parse_mode='Markdown')
+
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await router.dispatch(update, context)
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -1171,6 +1015,8 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"🆔 {user_id}")
         return
 
+    if await handle_admin_text(update, context): return
+
     # --- ADMIN: SET SUPPORT ---
     if state_info["state"] == STATE_ADMIN_SET_SUPPORT:
         d = load_data()
@@ -1238,14 +1084,13 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if state_info["state"] == STATE_ADMIN_BROADCAST:
-        d = load_data()
-        users = d.get("users", [])
         count = 0
-        for uid in users:
-            try:
-                await context.bot.send_message(chat_id=uid, text=text)
-                count += 1
-            except: pass
+        for chunk in get_db().users.iter_chunks():
+            for uid in chunk:
+                try:
+                    await context.bot.send_message(chat_id=uid, text=text)
+                    count += 1
+                except: pass
         await update.message.reply_text(f"✅ پیام به {count} نفر ارسال شد.")
         reset_state(user_id)
         return
@@ -1253,45 +1098,19 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # --- SEARCH LOGIC ---
     if state_info["state"] == STATE_SEARCH:
         results = []
-        search_query = text.lower()
-        
-        # Search in Cars
-        effective_car_db = get_effective_car_db()
-        for brand, b_data in effective_car_db.items():
-            if search_query in brand.lower():
-                results.append(f"🏢 **برند:** {brand}")
-            for model in b_data.get("models", []):
-                if search_query in model["name"].lower():
-                    results.append(f"🚗 **مدل:** {model['name']} ({brand})")
-                for variant in model.get("variants", []):
-                    if search_query in variant["name"].lower():
-                        p_val = variant.get('marketPrice', 0)
-                        try:
-                            p_formatted = f"{int(float(str(p_val).replace(',', ''))):,} تومان"
-                        except:
-                            p_formatted = str(p_val)
-                        results.append(f"🔹 **تیپ:** {variant['name']} ({model['name']}) -> {p_formatted}")
-        
-        # Search in Mobiles
-        effective_mob_db = get_effective_mobile_db()
-        for brand, b_data in effective_mob_db.items():
-            if search_query in brand.lower():
-                results.append(f"📱 **برند:** {brand}")
-            for model in b_data.get("models", []):
-                if search_query in model["name"].lower():
-                    results.append(f"📲 **مدل:** {model['name']} ({brand})")
-                for variant in model.get("variants", []):
-                    if search_query in variant["name"].lower():
-                        p_val = variant.get('marketPrice', 0)
-                        try:
-                            p_formatted = f"{int(float(str(p_val).replace(',', ''))):,} تومان"
-                        except:
-                            p_formatted = str(p_val)
-                        results.append(f"🔹 **مدل:** {variant['name']} ({model['name']}) -> {p_formatted}")
+        index = SEARCH_INDEX.get(cars=get_effective_car_db(), mobile=get_effective_mobile_db())
+        for doc in index.search(text, MAX_SEARCH_RESULTS + 1):
+            is_car = doc.catalog == "cars"
+            if doc.kind == BRAND:
+                results.append(f"{'🏢' if is_car else '📱'} **برند:** {doc.brand}")
+            elif doc.kind == MODEL:
+                results.append(f"{'🚗' if is_car else '📲'} **مدل:** {doc.model} ({doc.brand})")
+            else:
+                results.append(f"🔹 **{'تیپ' if is_car else 'مدل'}:** {doc.variant} ({doc.model}) -> {format_price(doc.record, 'marketPrice')}")
 
         if results:
-            response_text = "🔍 **نتایج جستجو:**\n\n" + "\n".join(results[:15])
-            if len(results) > 15: response_text += "\n\n... و موارد بیشتر"
+            response_text = "🔍 **نتایج جستجو:**\n\n" + "\n".join(results[:MAX_SEARCH_RESULTS])
+            if len(results) > MAX_SEARCH_RESULTS: response_text += "\n\n... و موارد بیشتر"
         else:
             response_text = "❌ موردی یافت نشد. لطفا نام دقیق‌تری وارد کنید."
         
@@ -1314,87 +1133,116 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except: await update.message.reply_text("⚠️ فقط عدد وارد کنید.")
         return
 
+# --- Inline Mode ---
+# "@bot پراید" in any chat; answered from the in-memory search index.
+INLINE_PAGE_SIZE = 20
+INLINE_MAX_RESULTS = 200
+INLINE_CACHE_TIME = 300 # seconds Telegram may cache an answer for the same query
+
+def inline_article(doc, result_id):
+    is_car = doc.catalog == "cars"
+    if doc.kind == BRAND:
+        models = [m["name"] for m in doc.record.get("models", ())]
+        title, description = doc.brand, f"{len(models)} مدل"
+        text = f"{'🏢' if is_car else '🏷'} **{doc.brand}**\n" + "\n".join(f"🔹 {m}" for m in models[:30])
+    elif doc.kind == MODEL:
+        variants = doc.record.get("variants", ())
+        title, description = doc.model, doc.brand
+        text = f"{'🚗' if is_car else '📱'} **{doc.brand} {doc.model}**\n" + "\n".join(
+            f"🔹 {v['name']}: {format_price(v, 'marketPrice')}" for v in variants[:30])
+        if not variants and "price" in doc.record:
+            # Legacy support
+            description = f"{doc.brand} - {format_price(doc.record, 'price')}"
+            text += f"💰 **قیمت:** {format_price(doc.record, 'price')}"
+    else:
+        v = doc.record
+        title, description = f"{doc.model} ({doc.variant})", f"{doc.brand} - بازار: {format_price(v, 'marketPrice')}"
+        text = f"{'🚘' if is_car else '📱'} **{doc.brand} {doc.model} ({doc.variant})**\n🏪 بازار: {format_price(v, 'marketPrice')}"
+        if is_car:
+            text += f"\n🏠 کارخانه: {format_price(v, 'factoryPrice')}"
+        elif v.get('officialPrice', 0) > 0 or not has_price(v, 'officialPrice'):
+            text += f"\n🛡 گارانتی: {format_price(v, 'officialPrice')}"
+    return InlineQueryResultArticle(id=result_id, title=title, description=description,
+                                    input_message_content=InputTextMessageContent(text, parse_mode='Markdown'))
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    inline_query = update.inline_query
+    text = inline_query.query.strip()
+    if not text:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME)
+        return
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    index = SEARCH_INDEX.get(cars=get_effective_car_db(), mobile=get_effective_mobile_db())
+    docs = index.search(text, INLINE_MAX_RESULTS) # cached per query by the index
+    page = docs[offset:offset + INLINE_PAGE_SIZE]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if offset + INLINE_PAGE_SIZE < len(docs) else ""
+    results = [inline_article(doc, str(offset + i)) for i, doc in enumerate(page)]
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, next_offset=next_offset)
+
+SHEET_ERRORS_SHOWN = 10
+
+def format_sheet_errors(result):
+    lines = [f"⚠️ {result['error_count']} خطا در فایل:"]
+    for error in result["errors"][:SHEET_ERRORS_SHOWN]:
+        where = [f"ردیف {error['row']}"] if error["row"] else []
+        if error["column"]: where.append(f"ستون {error['column']}")
+        lines.append(f"• {'، '.join(where)}: {error['message']}" if where else f"• {error['message']}")
+    if result["error_count"] > SHEET_ERRORS_SHOWN: lines.append(f"… و {result['error_count'] - SHEET_ERRORS_SHOWN} خطای دیگر")
+    return "\n".join(lines)
+
+async def send_rejected_rows(update, result):
+    if not result["quarantine"]: return
+    await update.message.reply_document(
+        document=io.BytesIO(result["quarantine"]), filename="rejected_rows.xlsx",
+        caption=f"📎 {result['rejected']} ردیف ردشده همراه با علت خطا (ستون error).\nپس از اصلاح، همین فایل را دوباره ارسال کنید؛ ستون‌های row و error نادیده گرفته می‌شوند.")
+
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global CAR_DB_EXCEL, MOBILE_DB_EXCEL
     user_id = update.effective_user.id
     state_info = get_state(user_id)
 
     if is_admin(user_id) and state_info["state"] == STATE_ADMIN_WAIT_EXCEL:
         doc = update.message.document
-        if not doc.file_name.endswith(('.xlsx', '.xls')):
-            await update.message.reply_text("❌ فرمت فایل نامعتبر است. لطفا فایل اکسل (xlsx) ارسال کنید.")
+        if not (doc.file_name or '').lower().endswith(SHEET_EXTENSIONS):
+            await update.message.reply_text("❌ فرمت فایل نامعتبر است. لطفا فایل اکسل (xlsx/xls) یا csv ارسال کنید.")
             return
 
         try:
+            # Kept in memory; parsing runs in a worker process so other users' updates keep flowing
             file = await context.bot.get_file(doc.file_id)
-            file_path = f"{doc.file_id}.xlsx"
-            await file.download_to_drive(file_path)
-
-            df = pd.read_excel(file_path)
-            required_columns = ['brand', 'model', 'variant', 'factoryPrice', 'marketPrice']
-            if not all(col in df.columns for col in required_columns):
-                await update.message.reply_text(f"❌ فایل اکسل ناقص است. ستون‌های مورد نیاز: {required_columns}")
-                os.remove(file_path)
+            buffer = io.BytesIO()
+            await file.download_to_memory(buffer)
+            status = await update.message.reply_text("⏳ فایل دریافت شد، در حال پردازش...")
+
+            async def progress(seconds):
+                await status.edit_text(f"⏳ در حال پردازش فایل... ({int(seconds)} ثانیه)")
+
+            result = await parse_price_sheet_async(buffer.getvalue(), doc.file_name, progress)
+            new_car_db, new_mobile_db = result["cars"], result["mobiles"]
+            if new_car_db is None and new_mobile_db is None and result["errors"]:
+                await status.edit_text("❌ فایل اکسل پردازش نشد.\n\n" + format_sheet_errors(result))
+                await send_rejected_rows(update, result)
                 return
 
-            global CAR_DB_EXCEL, MOBILE_DB_EXCEL
-            new_car_db = {}
-            new_mobile_db = {}
-            has_cars = False
-            has_mobiles = False
-            
-            for index, row in df.iterrows():
-                row_type_val = row.get('type', 'car')
-                if pd.isna(row_type_val) or str(row_type_val).strip() == '':
-                    row_type = 'car'
-                else:
-                    row_type = str(row_type_val).lower().strip()
-                    
-                brand = str(row['brand']).strip()
-                model_name = str(row['model']).strip()
-                variant_name = str(row.get('variant', '')).strip()
-                if pd.isna(variant_name) or variant_name == 'nan': variant_name = ''
-                
-                if row_type == 'car':
-                    has_cars = True
-                    if brand not in new_car_db:
-                        new_car_db[brand] = {"models": []}
-                    
-                    model_obj = next((m for m in new_car_db[brand]["models"] if m["name"] == model_name), None)
-                    if not model_obj:
-                        model_obj = {"name": model_name, "variants": []}
-                        new_car_db[brand]["models"].append(model_obj)
-                    
-                    model_obj["variants"].append({
-                        "name": variant_name,
-                        "factoryPrice": row['factoryPrice'],
-                        "marketPrice": row['marketPrice']
-                    })
-                elif row_type == 'mobile':
-                    has_mobiles = True
-                    if brand not in new_mobile_db:
-                        new_mobile_db[brand] = {"models": []}
-                    
-                    model_obj = next((m for m in new_mobile_db[brand]["models"] if m["name"] == model_name), None)
-                    if not model_obj:
-                        model_obj = {"name": model_name, "variants": []}
-                        new_mobile_db[brand]["models"].append(model_obj)
-                    
-                    model_obj["variants"].append({
-                        "name": variant_name,
-                        "marketPrice": row['marketPrice'],
-                        "officialPrice": row.get('factoryPrice', 0)
-                    })
-
-            if has_cars:
-                CAR_DB_EXCEL = new_car_db
-                save_car_db("excel")
-            if has_mobiles:
-                MOBILE_DB_EXCEL = new_mobile_db
-                save_mobile_db("excel")
-            
-            await update.message.reply_text(f"✅ فایل اکسل با موفقیت پردازش شد. {len(df)} رکورد بررسی شد.")
-            os.remove(file_path)
+            # The sheet replaces each catalog it has rows for; only the brands that differ are applied and saved.
+            # With rejected rows it only upserts, so a typo doesn't delete that item; so does a re-sent error sheet.
+            partial = result["rejected"] > 0 or result["upsert"]
+            reports = []
+            if new_car_db is not None:
+                delta = diff_catalogs(CAR_DB_EXCEL, new_car_db, removals=not partial)
+                apply_delta(CAR_DB_EXCEL, new_car_db, delta, upsert=partial)
+                if delta: save_car_db("excel", brands=delta.brands)
+                reports.append(f"🚗 خودرو: {delta.report()}")
+            if new_mobile_db is not None:
+                delta = diff_catalogs(MOBILE_DB_EXCEL, new_mobile_db, removals=not partial)
+                apply_delta(MOBILE_DB_EXCEL, new_mobile_db, delta, upsert=partial)
+                if delta: save_mobile_db("excel", brands=delta.brands)
+                reports.append(f"📱 موبایل: {delta.report()}")
+            if result["errors"]: reports.append(format_sheet_errors(result))
+            if result["rejected"]: reports.append(f"🚫 {result['rejected']} ردیف رد شد؛ موارد موجود حذف نشدند و فقط ردیف‌های سالم اعمال شدند.")
+            elif partial: reports.append("ℹ️ فایل خطاها: فقط ردیف‌های همین فایل بروزرسانی شدند.")
+
+            await status.edit_text(f"✅ فایل اکسل با موفقیت پردازش شد. {result['rows']} رکورد بررسی شد.\n\n" + "\n\n".join(reports))
+            await send_rejected_rows(update, result)
 
         except Exception as e:
             logger.error(f"Excel Processing Error: {e}")
@@ -1408,11 +1256,16 @@ async def post_init(application):
     try:
         data = load_data()
         interval = data.get("backup_interval", 0)
-        if interval and int(interval) > 0 and application.job_queue:
-            application.job_queue.run_repeating(send_auto_backup, interval=int(interval)*3600, first=60, name='auto_backup')
+        schedule_periodic(application.job_queue, 'auto_backup', send_auto_backup, int(interval or 0), first=60, jitter=0)
     except Exception as e:
         logger.error(f"Error in post_init backup setup: {e}")
 
+    # Scheduled AI update (ai_config.schedule)
+    try:
+        schedule_ai_update(application.job_queue)
+    except Exception as e:
+        logger.error(f"Error in post_init AI schedule setup: {e}")
+
     # Fix Commands
     try:
         await application.bot.set_my_commands([
@@ -1424,14 +1277,22 @@ async def post_init(application):
     except Exception as e:
         logger.error(f"Error setting commands: {e}")
 
+async def post_shutdown(application):
+    shutdown_parse_pool()
+    for catalog_file in CATALOG_FILES.values():
+        try: catalog_file.compact() # the JSON files alone are the full catalogs while the bot is stopped
+        except Exception as e: logger.error(f"Error compacting {catalog_file.path}: {e}")
+
 if __name__ == '__main__':
+    configure_database(STORAGE_BACKEND, DATA_FILE, DEFAULT_CONFIG, SQLITE_FILE)
     load_car_db()
     load_mobile_db()
     if TOKEN == 'REPLACE_ME_TOKEN': print("⚠️ Configure token in bot.py")
-    app = ApplicationBuilder().token(TOKEN).post_init(post_init).build()
+    app = ApplicationBuilder().token(TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("fixmenu", fix_menu))
     app.add_handler(CallbackQueryHandler(handle_callback))
+    app.add_handler(InlineQueryHandler(handle_inline_query))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
     app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
 
@@ -0,0 +1,50 @@
+"""
+Compact callback_data payloads for catalog buttons.
+
+Format: "#<route>:<id>[.<id>...]" with base36 catalog IDs, e.g. "#cv:2bq".
+Telegram limits callback_data to 64 bytes, so buttons carry the short IDs
+from catalog.CatalogIds instead of brand/model/variant names. Legacy
+payloads (brand_, model_, mob_variant_, ...) never start with "#".
+"""
+
+PREFIX = "#"
+MAX_CALLBACK_BYTES = 64
+
+CAR_BRAND = "cb"
+CAR_MODEL = "cm"
+CAR_VARIANT = "cv"
+MOB_BRAND = "mb"
+MOB_MODEL = "mm"
+MOB_VARIANT = "mv"
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def to_base36(n):
+    if n < 0: raise ValueError("catalog ids are non-negative")
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _DIGITS[r] + out
+        if n == 0: return out
+
+
+def pack(route, *ids):
+    data = f"{PREFIX}{route}:" + ".".join(to_base36(i) for i in ids)
+    if len(data.encode('utf-8')) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data too long: {data}")
+    return data
+
+
+def unpack(data):
+    """Returns (route, ids) for compact payloads, or None for anything else."""
+    if not data or not data.startswith(PREFIX):
+        return None
+    route, sep, rest = data[len(PREFIX):].partition(":")
+    if not sep:
+        return None
+    try:
+        ids = tuple(int(part, 36) for part in rest.split(".") if part)
+    except ValueError:
+        return None
+    return route, ids
@@ -0,0 +1,335 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from types import MappingProxyType
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_EXCEL = "excel"
+PRIORITY_AI = "ai"
+PRIORITY_HYBRID = "hybrid"
+
+COMPACT_MIN_BYTES = 1 << 20 # a CatalogFile journal is folded into the file past this size (or the file's)
+
+
+def freeze(value):
+    """Recursively converts dicts to read-only mappings and lists to tuples."""
+    if isinstance(value, (MappingProxyType, tuple)):
+        return value
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def merge_brand(ai_brand, excel_brand):
+    """
+    Hybrid merge of one brand: AI data is the base, Excel adds missing
+    models/variants and overrides variants that carry a market price.
+    """
+    if ai_brand is None: return excel_brand
+    if excel_brand is None: return ai_brand
+
+    models, model_pos = [], {}
+    for m in ai_brand.get("models", ()):
+        model_pos.setdefault(m["name"], len(models))
+        m = dict(m)
+        if "variants" in m: m["variants"] = list(m["variants"])
+        models.append(m)
+
+    for m in excel_brand.get("models", ()):
+        idx = model_pos.get(m["name"])
+        if idx is None:
+            model_pos[m["name"]] = len(models)
+            models.append(m)
+            continue
+        variants = models[idx].setdefault("variants", [])
+        var_pos = {}
+        for i, v in enumerate(variants): var_pos.setdefault(v["name"], i)
+        for v in m.get("variants", ()):
+            i = var_pos.get(v["name"])
+            if i is None:
+                var_pos[v["name"]] = len(variants)
+                variants.append(v)
+            elif v.get("marketPrice", 0) > 0:
+                variants[i] = {**variants[i], **v}
+
+    merged = dict(ai_brand)
+    merged["models"] = models
+    return freeze(merged)
+
+
+class CatalogIds:
+    """
+    Stable short integer IDs for (brand,), (brand, model) and
+    (brand, model, variant) keys. IDs are never reused and are persisted, so
+    buttons already sitting in users' chats keep resolving after restarts.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._ids = {}
+        self._keys = {}
+        self._next = 1
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for entry in json.load(f):
+                        cid, key = entry[0], tuple(entry[1:])
+                        self._ids[key] = cid
+                        self._keys[cid] = key
+                        self._next = max(self._next, cid + 1)
+            except Exception as e:
+                logger.error(f"Error loading catalog ids ({path}): {e}")
+
+    def assign(self, key):
+        cid = self._ids.get(key)
+        if cid is None:
+            cid = self._next
+            self._next += 1
+            self._ids[key] = cid
+            self._keys[cid] = key
+            self._dirty = True
+        return cid
+
+    def get(self, key):
+        return self._ids.get(key)
+
+    def resolve(self, cid):
+        return self._keys.get(cid)
+
+    def save(self):
+        if not self._dirty or not self.path:
+            return
+        try:
+            temp_file = f"{self.path}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump([[cid, *key] for cid, key in self._keys.items()], f, ensure_ascii=False)
+            shutil.move(temp_file, self.path)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Error saving catalog ids ({self.path}): {e}")
+
+
+class CatalogFile:
+    """
+    A catalog JSON file plus an append-only journal next to it
+    (<path>.log, one {"brand": ..., "data": ... or null} line per brand
+    upsert/removal). save_brands() only appends the changed brands; load()
+    replays the journal over the file, and save() rewrites the file and
+    drops the journal once it outgrows the file. Until then the file alone
+    is not the whole catalog: compact() folds the journal in (the bot does
+    it on shutdown and before a backup), and copies made while the bot
+    runs must take the journal along.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.journal = f"{path}.log"
+
+    def load(self):
+        db = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                db = json.load(f)
+        if os.path.exists(self.journal):
+            with open(self.journal, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # a torn last line from a crash mid-append
+                    if entry.get("data") is None: db.pop(entry["brand"], None)
+                    else: db[entry["brand"]] = entry["data"]
+        return db
+
+    def save(self, db):
+        temp_file = f"{self.path}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(db, f, ensure_ascii=False, indent=4)
+        shutil.move(temp_file, self.path)
+        if os.path.exists(self.journal): os.remove(self.journal)
+
+    def compact(self):
+        """Folds the journal into the file, so the file alone is the full catalog."""
+        if os.path.exists(self.journal): self.save(self.load())
+
+    def save_brands(self, db, brands):
+        with open(self.journal, 'a', encoding='utf-8') as f:
+            for brand in brands:
+                f.write(json.dumps({"brand": brand, "data": db.get(brand)}, ensure_ascii=False) + "\n")
+        base = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if os.path.getsize(self.journal) > max(COMPACT_MIN_BYTES, base):
+            self.save(db)
+
+
+class BrandIndex:
+    """Name -> record maps for the models and variants of one brand."""
+    def __init__(self, brand_data):
+        self.models = {}
+        self.variants = {}
+        for m in brand_data.get("models", ()):
+            if m["name"] in self.models: continue
+            self.models[m["name"]] = m
+            by_name = {}
+            for v in m.get("variants", ()): by_name.setdefault(v["name"], v)
+            self.variants[m["name"]] = by_name
+
+
+class CatalogSnapshot(Mapping):
+    """
+    Immutable effective catalog (brand -> brand data) at a given version.
+    `changed` holds the brands that differ from the previous version.
+    Lookups by (brand, model) / (brand, model, variant) and model -> brands
+    are served from prebuilt hash indexes; catalog_id()/resolve_id() map
+    names to the short IDs used in callback_data and back.
+    """
+    def __init__(self, brands, version=0, changed=frozenset(), index=None, model_brands=None, ids=None):
+        self._brands = brands
+        self.version = version
+        self.changed = changed
+        self._index = index or {}
+        self._model_brands = model_brands or {}
+        self._ids = ids or CatalogIds()
+
+    def catalog_id(self, brand, model=None, variant=None):
+        key = (brand,) if model is None else ((brand, model) if variant is None else (brand, model, variant))
+        return self._ids.get(key)
+
+    def resolve_id(self, cid):
+        """Returns the (brand[, model[, variant]]) key of an ID, or None if it is not in this snapshot."""
+        key = self._ids.resolve(cid)
+        return key if key and key[0] in self._index else None
+
+    def get_model(self, brand, model):
+        idx = self._index.get(brand)
+        return idx.models.get(model) if idx else None
+
+    def get_variant(self, brand, model, variant):
+        idx = self._index.get(brand)
+        return idx.variants.get(model, {}).get(variant) if idx else None
+
+    def find_brands(self, model):
+        """Brands that have a model with this name, in catalog order."""
+        return self._model_brands.get(model, ())
+
+    def __getitem__(self, brand):
+        return self._brands[brand]
+
+    def __iter__(self):
+        return iter(self._brands)
+
+    def __len__(self):
+        return len(self._brands)
+
+
+class CatalogStore:
+    """
+    Holds the Excel and AI sources of one catalog (cars or mobiles) and the
+    merged snapshot for the active priority. Sources are frozen on publish and
+    only the brands that changed are re-merged; snapshot() is O(1) as long as
+    the priority stays the same.
+    """
+    def __init__(self, name, ids_file=None):
+        self.name = name
+        self.ids = CatalogIds(ids_file)
+        self._sources = {"excel": {}, "ai": {}}
+        self._merged = {}
+        self._index = {}
+        self._model_brands = {}
+        self._priority = PRIORITY_EXCEL
+        self._snapshot = CatalogSnapshot({})
+        self._lock = threading.RLock()
+
+    def set_source(self, kind, db, brands=None):
+        """
+        Publishes a new version of the "excel" or "ai" source.
+        `brands` limits the comparison to the given brands when the caller
+        knows what changed. Returns the set of brands that actually changed.
+        """
+        with self._lock:
+            old = self._sources[kind]
+            if brands is None:
+                new = {b: freeze(v) for b, v in db.items()}
+                candidates = set(old) | set(new)
+            else:
+                new = dict(old)
+                candidates = set(brands)
+                for b in candidates:
+                    if b in db: new[b] = freeze(db[b])
+                    else: new.pop(b, None)
+            changed = {b for b in candidates if old.get(b) != new.get(b)}
+            self._sources[kind] = new
+            if changed:
+                self._rebuild(changed)
+            return changed
+
+    def snapshot(self, priority=PRIORITY_EXCEL):
+        with self._lock:
+            if priority != self._priority:
+                self._priority = priority
+                self._merged = {}
+                self._index = {}
+                self._model_brands = {}
+                self._rebuild(None)
+            return self._snapshot
+
+    def _merge(self, brand):
+        excel, ai = self._sources["excel"], self._sources["ai"]
+        if self._priority == PRIORITY_AI: return ai.get(brand)
+        if self._priority == PRIORITY_EXCEL: return excel.get(brand)
+        return merge_brand(ai.get(brand), excel.get(brand))
+
+    def _brand_order(self):
+        excel, ai = self._sources["excel"], self._sources["ai"]
+        if self._priority == PRIORITY_AI: return ai.keys()
+        if self._priority == PRIORITY_EXCEL: return excel.keys()
+        return list(ai) + [b for b in excel if b not in ai]
+
+    def _rebuild(self, brands):
+        full = brands is None
+        if full:
+            brands = set(self._sources["excel"]) | set(self._sources["ai"])
+        changed = set()
+        for brand in brands:
+            merged = self._merge(brand)
+            old = self._merged.get(brand)
+            if merged is None:
+                if brand in self._merged:
+                    del self._merged[brand]
+                    changed.add(brand)
+            elif full or old is not merged and old != merged:
+                self._merged[brand] = merged
+                changed.add(brand)
+        if not changed and not full:
+            return
+        for brand in changed:
+            self._reindex(brand)
+        order = [b for b in self._brand_order() if b in self._merged]
+        ordered = {b: self._merged[b] for b in order}
+        position = {b: i for i, b in enumerate(order)}
+        model_brands = {m: tuple(sorted(bs, key=position.get)) for m, bs in self._model_brands.items()}
+        self._snapshot = CatalogSnapshot(MappingProxyType(ordered), self._snapshot.version + 1, frozenset(changed),
+                                         index=dict(self._index), model_brands=model_brands, ids=self.ids)
+        self.ids.save()
+        logger.info(f"Catalog '{self.name}' rebuilt: v{self._snapshot.version}, {len(changed)} brand(s) changed")
+
+    def _reindex(self, brand):
+        old = self._index.pop(brand, None)
+        if old:
+            for model in old.models:
+                brands = self._model_brands.get(model)
+                if brands:
+                    brands.discard(brand)
+                    if not brands: del self._model_brands[model]
+        if brand in self._merged:
+            idx = BrandIndex(self._merged[brand])
+            self._index[brand] = idx
+            self.ids.assign((brand,))
+            for model, variants in idx.variants.items():
+                self._model_brands.setdefault(model, set()).add(brand)
+                self.ids.assign((brand, model))
+                for variant in variants: self.ids.assign((brand, model, variant))
@@ -0,0 +1,156 @@
+"""
+Variant-level diff between two versions of a catalog source.
+
+diff_catalogs() walks the new catalog once against a name index of the old
+one and records added/removed models and variants and repriced fields;
+`brands` is the set of brands whose data differs at all, which is what
+apply_delta() replaces and what the store and the journal need to see.
+"""
+from prices import PRICE_FIELDS, TEXT_SUFFIX
+
+_FA_DIGITS = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
+
+
+def fa_number(n):
+    return str(n).translate(_FA_DIGITS)
+
+
+class CatalogDelta:
+    def __init__(self):
+        self.added_models = [] # (brand, model)
+        self.removed_models = []
+        self.added_variants = [] # (brand, model, variant)
+        self.removed_variants = []
+        self.repriced = [] # (brand, model, variant or None, field, old, new)
+        self.brands = set()
+
+    def __bool__(self):
+        return bool(self.brands)
+
+    def summary(self):
+        """One line for the admin, e.g. "۳۴ تغییر قیمت، ۵ مدل جدید"."""
+        parts = [(len(self.repriced), "تغییر قیمت"), (len(self.added_models), "مدل جدید"),
+                 (len(self.added_variants), "تیپ جدید"), (len(self.removed_models), "مدل حذف‌شده"),
+                 (len(self.removed_variants), "تیپ حذف‌شده")]
+        text = "، ".join(f"{fa_number(n)} {label}" for n, label in parts if n)
+        return text or ("بدون تغییر قیمت" if self.brands else "بدون تغییر")
+
+    def report(self, limit=5):
+        """summary() plus up to `limit` of the largest price changes."""
+        lines = [self.summary()]
+        def size(change):
+            old, new = change[4], change[5]
+            return abs(new - old) if isinstance(old, int) and isinstance(new, int) else 0
+        for brand, model, variant, field, old, new in sorted(self.repriced, key=size, reverse=True)[:limit]:
+            name = " / ".join(p for p in (brand, model, variant) if p)
+            if isinstance(old, int) and isinstance(new, int): old, new = f"{old:,}", f"{new:,}"
+            lines.append(f"• {name}: {old} ← {new}")
+        return "\n".join(lines)
+
+
+def _price(record, field):
+    text = record.get(field + TEXT_SUFFIX)
+    return text if text is not None else record.get(field)
+
+
+def _compare(delta, brand, model, variant, old, new):
+    changed = False
+    for field in PRICE_FIELDS:
+        before, after = _price(old, field), _price(new, field)
+        if before != after:
+            delta.repriced.append((brand, model, variant, field, before, after))
+            changed = True
+    return changed or old != new
+
+
+def diff_catalogs(old, new, removals=True):
+    """
+    Delta from `old` to `new` (brand -> {"models": [...]}). Without
+    `removals`, `new` is treated as an upsert: what it lacks is kept, not
+    removed.
+    """
+    delta = CatalogDelta()
+    for brand in new:
+        old_brand = old.get(brand)
+        if old_brand is None:
+            delta.added_models.extend((brand, m["name"]) for m in new[brand].get("models", ()))
+            delta.brands.add(brand)
+            continue
+        old_models = {}
+        for m in old_brand.get("models", ()): old_models.setdefault(m["name"], m)
+        seen = set()
+        for model in new[brand].get("models", ()):
+            name = model["name"]
+            seen.add(name)
+            before = old_models.get(name)
+            if before is None:
+                delta.added_models.append((brand, name))
+                delta.brands.add(brand)
+                continue
+            if _compare(delta, brand, name, None, {k: v for k, v in before.items() if k != "variants"},
+                        {k: v for k, v in model.items() if k != "variants"}):
+                delta.brands.add(brand)
+            old_variants = {}
+            for v in before.get("variants", ()): old_variants.setdefault(v["name"], v)
+            seen_variants = set()
+            for variant in model.get("variants", ()):
+                seen_variants.add(variant["name"])
+                prev = old_variants.get(variant["name"])
+                if prev is None:
+                    delta.added_variants.append((brand, name, variant["name"]))
+                    delta.brands.add(brand)
+                elif _compare(delta, brand, name, variant["name"], prev, variant):
+                    delta.brands.add(brand)
+            if removals:
+                gone = [v for v in old_variants if v not in seen_variants]
+                delta.removed_variants.extend((brand, name, v) for v in gone)
+                if gone: delta.brands.add(brand)
+        if removals:
+            gone = [m for m in old_models if m not in seen]
+            delta.removed_models.extend((brand, m) for m in gone)
+            if gone: delta.brands.add(brand)
+        # Order-only or duplicate-name changes still make the brand differ
+        if removals and brand not in delta.brands and old_brand != new[brand]:
+            delta.brands.add(brand)
+    if removals:
+        for brand in old:
+            if brand not in new:
+                delta.removed_models.extend((brand, m["name"]) for m in old[brand].get("models", ()))
+                delta.brands.add(brand)
+    return delta
+
+
+def _upsert_brand(old, new):
+    """`old` brand data with the models and variants of `new` replacing those of the same name."""
+    models = list(old.get("models", ()))
+    index = {m["name"]: i for i, m in enumerate(models)}
+    for model in new.get("models", ()):
+        i = index.get(model["name"])
+        if i is None:
+            index[model["name"]] = len(models)
+            models.append(model)
+            continue
+        variants = list(models[i].get("variants", ()))
+        v_index = {v["name"]: j for j, v in enumerate(variants)}
+        for variant in model.get("variants", ()):
+            j = v_index.get(variant["name"])
+            if j is None:
+                v_index[variant["name"]] = len(variants)
+                variants.append(variant)
+            else: variants[j] = variant
+        models[i] = {**model, "variants": variants} if variants else model
+    return {**old, "models": models}
+
+
+def apply_delta(target, new, delta, upsert=False):
+    """
+    Replaces only the brands in the delta: changed brands get the new data,
+    removed ones are dropped. With `upsert` (a delta diffed without
+    removals), what `new` lacks is kept and only matching models and
+    variants are replaced.
+    """
+    for brand in delta.brands:
+        if brand not in new: target.pop(brand, None)
+        elif upsert and brand in target: target[brand] = _upsert_brand(target[brand], new[brand])
+        else: target[brand] = new[brand]
+    return target
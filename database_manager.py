@@ -1,12 +1,18 @@
 import json
 import os
+import copy
 import datetime
 import shutil
 import logging
+import sqlite3
+import threading
+from user_registry import UserRegistry, SQLiteUserRegistry
 
 logger = logging.getLogger(__name__)
 
 DATA_FILE = 'bot_data.json'
+SQLITE_FILE = 'bot_data.db'
+STORAGE_BACKEND = 'json' # json, sqlite
 
 DEFAULT_CONFIG = {
     "calc": {"label": "🧮 ماشین‌حساب", "url": "https://www.hamrah-mechanic.com/carprice/", "active": True, "type": "webapp"},
@@ -21,16 +27,34 @@ DEFAULT_CONFIG = {
     "support": {"label": "📞 پشتیبانی", "active": True, "type": "dynamic"}
 }
 
+def users_log_file(data_file):
+    """The user registry log kept next to a data file (bot_data.json -> bot_data_users.log)."""
+    return f"{os.path.splitext(data_file)[0]}_users.log"
+
+
 class DatabaseManager:
-    def __init__(self):
-        self.data_file = DATA_FILE
+    """
+    Process-wide store for bot_data.json.
+    The file is parsed once and served from memory; every read only stats the
+    file (mtime + size) so external edits (restore, install.sh) are picked up.
+    save_data() writes through to disk and refreshes the cached copy.
+    Users live in a separate append-only registry (self.users); a legacy
+    "users" list found in the data file is merged into it on load.
+    """
+    def __init__(self, data_file=DATA_FILE, default_config=DEFAULT_CONFIG):
+        self.data_file = data_file
+        self.default_config = default_config
+        self._cache = None
+        self._cache_sig = None
+        self._roles = None # user_id -> role of every admin; rebuilt after each save or re-read
+        self._lock = threading.RLock()
+        self.users = UserRegistry(users_log_file(data_file))
         self.default_data = {
             "backup_interval": 0, 
-            "users": [], 
             "admins": [], 
             "roles": {}, # user_id -> role ("full", "editor", "support")
             "sponsor": {}, 
-            "menu_config": DEFAULT_CONFIG, 
+            "menu_config": default_config, 
             "support_config": {"mode": "text", "value": "پیام خود را ارسال کنید..."},
             "panel_user": "",
             "panel_pass": "",
@@ -48,19 +72,29 @@ class DatabaseManager:
             }
         }
 
-    def load_data(self):
+    def _file_signature(self):
+        try:
+            st = os.stat(self.data_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _fresh_defaults(self):
+        return copy.deepcopy(self.default_data)
+
+    def _read_file(self):
         if os.path.exists(self.data_file):
             try:
                 with open(self.data_file, 'r', encoding='utf-8') as f:
                     d = json.load(f)
-                    if "menu_config" not in d: d["menu_config"] = DEFAULT_CONFIG
-                    for k, v in DEFAULT_CONFIG.items():
-                        if k not in d["menu_config"]: d["menu_config"][k] = v
-                    if "settings" not in d: d["settings"] = self.default_data["settings"]
+                    if "menu_config" not in d: d["menu_config"] = copy.deepcopy(self.default_config)
+                    for k, v in self.default_config.items():
+                        if k not in d["menu_config"]: d["menu_config"][k] = copy.deepcopy(v)
+                    if "settings" not in d: d["settings"] = copy.deepcopy(self.default_data["settings"])
                     if "roles" not in d: d["roles"] = {}
                     if "car_db" not in d: d["car_db"] = {}
                     if "mobile_db" not in d: d["mobile_db"] = {}
-                    if "economy_db" not in d: d["economy_db"] = self.default_data["economy_db"]
+                    if "economy_db" not in d: d["economy_db"] = copy.deepcopy(self.default_data["economy_db"])
                     return d
             except json.JSONDecodeError:
                 timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -69,35 +103,66 @@ class DatabaseManager:
                     shutil.copy(self.data_file, corrupt_filename)
                     logger.error(f"❌ Data file corrupted! Renamed to {corrupt_filename} and creating new DB.")
                 except: pass
-                return self.default_data
+                return self._fresh_defaults()
             except Exception as e:
                 logger.error(f"❌ Error loading data: {e}")
-                return self.default_data
-        return self.default_data
+                return self._fresh_defaults()
+        return self._fresh_defaults()
+
+    def load_data(self):
+        """
+        Returns the cached data dict, re-reading the file only when its
+        mtime/size changed since the last load or save.
+        Callers that mutate the returned dict must persist it with save_data().
+        """
+        with self._lock:
+            sig = self._file_signature()
+            if self._cache is None or sig != self._cache_sig:
+                self._cache = self._read_file()
+                self._cache_sig = sig
+                self._roles = None
+                legacy_users = self._cache.pop("users", None)
+                if legacy_users:
+                    self.users.add_many(legacy_users)
+            return self._cache
 
     def save_data(self, data):
-        try:
-            temp_file = f"{self.data_file}.tmp"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            shutil.move(temp_file, self.data_file)
-        except Exception as e:
-            logger.error(f"❌ Error saving data: {e}")
+        with self._lock:
+            try:
+                temp_file = f"{self.data_file}.tmp"
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=4)
+                shutil.move(temp_file, self.data_file)
+                self._cache = data
+                self._cache_sig = self._file_signature()
+                self._roles = None
+            except Exception as e:
+                logger.error(f"❌ Error saving data: {e}")
+
+    def invalidate(self):
+        """Drops the in-memory copy so the next load_data() re-reads the file."""
+        with self._lock:
+            self._cache = None
+            self._cache_sig = None
+            self._roles = None
 
     def register_user(self, user_id):
-        d = self.load_data()
-        if user_id not in d.get("users", []):
-            if "users" not in d: d["users"] = []
-            d["users"].append(user_id)
-            self.save_data(d)
+        return self.users.touch(user_id)
 
     def get_admin_role(self, user_id, owner_id):
+        """
+        Resolved from a role table cached next to the data; it is dropped on
+        every save_data() and file re-read, so adding, removing or re-roling an
+        admin takes effect on the next lookup.
+        """
         if str(user_id) == str(owner_id):
             return "full"
-        d = self.load_data()
-        if user_id in d.get("admins", []):
-            return d.get("roles", {}).get(str(user_id), "editor") # Default to editor if no role is set
-        return None
+        with self._lock:
+            if self._roles is None or self._cache is None:
+                d = self.load_data()
+                roles = d.get("roles", {})
+                self._roles = {uid: roles.get(str(uid), "editor") for uid in d.get("admins", [])} # Default to editor if no role is set
+            return self._roles.get(user_id)
 
     def is_admin(self, user_id, owner_id):
         return self.get_admin_role(user_id, owner_id) is not None
@@ -128,4 +193,246 @@ class DatabaseManager:
         d = self.load_data()
         return d.get('admins', [])
 
-db = DatabaseManager()
+    def export_backup(self, backup_file=None):
+        """
+        Writes the full database (settings + users) to a JSON file and returns
+        its path. Restoring it as bot_data.json brings the users back: they
+        are folded into the registry on the next load, on either backend.
+        """
+        backup_file = backup_file or f"{self.data_file}.backup.json"
+        data = dict(self.load_data())
+        data["users"] = list(self.users)
+        with open(backup_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        return backup_file
+
+
+SQLITE_USERS_TABLE = "CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, first_seen INTEGER, last_seen INTEGER)"
+SQLITE_SCHEMA = SQLITE_USERS_TABLE + """;
+CREATE TABLE IF NOT EXISTS admins (user_id INTEGER PRIMARY KEY, role TEXT);
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS menu_config (key TEXT PRIMARY KEY, position INTEGER NOT NULL, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS economy_db (category TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS catalogs (niche TEXT NOT NULL, brand TEXT NOT NULL, position INTEGER NOT NULL, value TEXT NOT NULL, PRIMARY KEY (niche, brand));
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Top-level keys of bot_data.json that get their own table; everything else goes to `settings`.
+CATALOG_KEYS = ("car_db", "mobile_db")
+TABLE_KEYS = ("users", "admins", "roles", "menu_config", "economy_db") + CATALOG_KEYS
+
+# table -> (upsert, delete) statements; keys are tuples matching the primary key.
+SQLITE_ROW_SQL = {
+    "admins": ("INSERT OR REPLACE INTO admins(user_id, role) VALUES (?, ?)", "DELETE FROM admins WHERE user_id = ?"),
+    "settings": ("INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)", "DELETE FROM settings WHERE key = ?"),
+    "menu_config": ("INSERT OR REPLACE INTO menu_config(key, position, value) VALUES (?, ?, ?)", "DELETE FROM menu_config WHERE key = ?"),
+    "economy_db": ("INSERT OR REPLACE INTO economy_db(category, value) VALUES (?, ?)", "DELETE FROM economy_db WHERE category = ?"),
+    "catalogs": ("INSERT OR REPLACE INTO catalogs(niche, brand, position, value) VALUES (?, ?, ?, ?)", "DELETE FROM catalogs WHERE niche = ? AND brand = ?"),
+}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _as_user_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SQLiteDatabaseManager(DatabaseManager):
+    """
+    SQLite (WAL) backend exposing the same load_data/save_data API.
+    Each section of bot_data.json maps to its own table and save_data() only
+    writes the rows that changed since the last load/save, so toggling a menu
+    button no longer rewrites the whole database. Users are served by a
+    SQLiteUserRegistry over the `users` table.
+    bot_data.json is kept as an import source: it is migrated on first start,
+    and re-imported whenever it changes on disk (restore, install.sh).
+    """
+    def __init__(self, db_file=SQLITE_FILE, default_config=DEFAULT_CONFIG, json_file=DATA_FILE):
+        super().__init__(json_file, default_config)
+        self.db_file = db_file
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._migrate_users()
+        self._persisted = {}
+        self.users = SQLiteUserRegistry(self._conn, self._lock)
+
+    def _migrate_users(self):
+        """Databases created before the user registry have users(user_id, first_seen TEXT timestamp) only."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(users)")}
+        if "last_seen" in columns:
+            return
+        # Rebuilt rather than ALTERed: the old first_seen column has TEXT affinity
+        with self._conn:
+            self._conn.execute("ALTER TABLE users RENAME TO users_old")
+            self._conn.execute(SQLITE_USERS_TABLE)
+            self._conn.execute("INSERT INTO users(user_id, first_seen, last_seen) SELECT user_id, "
+                               "CAST(strftime('%s', first_seen) AS INTEGER), CAST(strftime('%s', first_seen) AS INTEGER) FROM users_old")
+            self._conn.execute("DROP TABLE users_old")
+        logger.info("SQLite users table migrated (first_seen/last_seen as epoch seconds)")
+
+    def _json_signature(self):
+        sig = super()._file_signature()
+        return f"{sig[0]}:{sig[1]}" if sig else None
+
+    def _file_signature(self):
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return (version, self._json_signature())
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _rows(self, data):
+        """Flattens a data dict into {table: {primary_key_tuple: row_values_tuple}}."""
+        rows = {table: {} for table in SQLITE_ROW_SQL}
+        roles = data.get("roles", {})
+        for admin_id in data.get("admins", []):
+            uid = _as_user_id(admin_id)
+            if uid is not None:
+                rows["admins"][(uid,)] = (roles.get(str(uid)),)
+        for pos, (key, val) in enumerate(data.get("menu_config", {}).items()):
+            rows["menu_config"][(key,)] = (pos, _dumps(val))
+        for category, val in data.get("economy_db", {}).items():
+            rows["economy_db"][(category,)] = (_dumps(val),)
+        for niche in CATALOG_KEYS:
+            for pos, (brand, b_data) in enumerate(data.get(niche, {}).items()):
+                rows["catalogs"][(niche, brand)] = (pos, _dumps(b_data))
+        for key, val in data.items():
+            if key not in TABLE_KEYS:
+                rows["settings"][(key,)] = (_dumps(val),)
+        return rows
+
+    def _write(self, data, replace=False):
+        rows = self._rows(data)
+        old_rows = {table: {} for table in SQLITE_ROW_SQL} if replace else self._persisted
+        cur = self._conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            if replace:
+                for table in SQLITE_ROW_SQL:
+                    cur.execute(f"DELETE FROM {table}")
+            for table, (upsert_sql, delete_sql) in SQLITE_ROW_SQL.items():
+                new, old = rows[table], old_rows.get(table, {})
+                changed = [key + val for key, val in new.items() if old.get(key) != val]
+                removed = [key for key in old if key not in new]
+                if changed: cur.executemany(upsert_sql, changed)
+                if removed: cur.executemany(delete_sql, removed)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        self._persisted = rows
+
+    def import_json(self, json_file=None):
+        """
+        One-shot migration: replaces the SQLite contents with a bot_data.json
+        file. Users are added from its legacy "users" list and from the
+        registry log next to it (bot_data_users.log), where the JSON backend
+        keeps them.
+        """
+        json_file = json_file or self.data_file
+        with self._lock:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._write(data, replace=True)
+            self.users.add_records(UserRegistry(users_log_file(json_file)).records())
+            self.users.add_many(data.get("users", []))
+            if json_file == self.data_file:
+                self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('json_signature', ?)", (self._json_signature(),))
+            logger.info(f"Imported {json_file} into {self.db_file}")
+            self._cache = None
+
+    def _read_file(self):
+        json_sig = self._json_signature()
+        if json_sig and json_sig != self._get_meta("json_signature"):
+            try:
+                self.import_json()
+            except Exception as e:
+                logger.error(f"❌ Error importing {self.data_file}: {e}")
+
+        d = self._fresh_defaults()
+        persisted = {table: {} for table in SQLITE_ROW_SQL}
+        c = self._conn
+        for key, value in c.execute("SELECT key, value FROM settings"):
+            d[key] = json.loads(value)
+            persisted["settings"][(key,)] = (value,)
+
+        menu = {}
+        for key, pos, value in c.execute("SELECT key, position, value FROM menu_config ORDER BY position"):
+            menu[key] = json.loads(value)
+            persisted["menu_config"][(key,)] = (pos, value)
+        if menu:
+            for k, v in self.default_config.items():
+                if k not in menu: menu[k] = copy.deepcopy(v)
+            d["menu_config"] = menu
+
+        economy = {}
+        for category, value in c.execute("SELECT category, value FROM economy_db"):
+            economy[category] = json.loads(value)
+            persisted["economy_db"][(category,)] = (value,)
+        if economy: d["economy_db"] = economy
+
+        for niche, brand, pos, value in c.execute("SELECT niche, brand, position, value FROM catalogs ORDER BY niche, position"):
+            d.setdefault(niche, {})[brand] = json.loads(value)
+            persisted["catalogs"][(niche, brand)] = (pos, value)
+
+        d["admins"], d["roles"] = [], {}
+        for uid, role in c.execute("SELECT user_id, role FROM admins ORDER BY user_id"):
+            d["admins"].append(uid)
+            if role is not None: d["roles"][str(uid)] = role
+            persisted["admins"][(uid,)] = (role,)
+
+        self._persisted = persisted
+        return d
+
+    def save_data(self, data):
+        with self._lock:
+            try:
+                self._write(data)
+                self._cache = data
+                self._cache_sig = self._file_signature()
+                self._roles = None
+            except Exception as e:
+                logger.error(f"❌ Error saving data: {e}")
+
+
+def create_database_manager(backend=STORAGE_BACKEND, data_file=DATA_FILE, default_config=DEFAULT_CONFIG, sqlite_file=SQLITE_FILE):
+    if backend == "sqlite":
+        return SQLiteDatabaseManager(sqlite_file, default_config, json_file=data_file)
+    return DatabaseManager(data_file, default_config)
+
+
+db = None # the process-wide store; set up once with configure() (bot.py does it at startup)
+
+
+def configure(backend=STORAGE_BACKEND, data_file=DATA_FILE, default_config=DEFAULT_CONFIG, sqlite_file=SQLITE_FILE):
+    """Creates the process-wide store. Modules reach it through get_db(), never with a manager of their own."""
+    global db
+    db = create_database_manager(backend, data_file, default_config, sqlite_file)
+    return db
+
+
+def get_db():
+    """The process-wide store; created with the module defaults if nothing configured it."""
+    return db if db is not None else configure()
+
+
+if __name__ == '__main__':
+    # One-shot migration: python database_manager.py [bot_data.json] [bot_data.db]
+    # Backup (install.sh): python database_manager.py backup <dest.json> [json|sqlite]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 2 and sys.argv[1] == 'backup':
+        backend = sys.argv[3] if len(sys.argv) > 3 else STORAGE_BACKEND
+        print(create_database_manager(backend).export_backup(sys.argv[2]))
+    else:
+        src = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+        dst = sys.argv[2] if len(sys.argv) > 2 else SQLITE_FILE
+        SQLiteDatabaseManager(dst, json_file=src).import_json(src)
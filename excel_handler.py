@@ -1,82 +1,467 @@
 import pandas as pd
+import numpy as np
 import io
+import csv
+import asyncio
 import logging
-from database_manager import db
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from prices import parse_price, normalize_catalog
+from catalog_delta import diff_catalogs
 
 logger = logging.getLogger(__name__)
 
-async def process_excel_update(file_bytes, niche):
+# Columns of the bot's price sheet (see handle_document) -> record fields per type
+CAR_PRICE_COLUMNS = {"factoryPrice": "factoryPrice", "marketPrice": "marketPrice"}
+MOBILE_PRICE_COLUMNS = {"marketPrice": "marketPrice", "officialPrice": "factoryPrice"}
+
+SHEET_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+BATCH_ROWS = 5000 # rows per DataFrame when an upload is read in batches
+REQUIRED_COLUMNS = ['brand', 'model', 'variant', 'factoryPrice', 'marketPrice']
+ROW_TYPES = ('car', 'mobile')
+MAX_SHEET_ERRORS = 50 # row messages kept per upload; the rest are only counted
+PARSE_WORKERS = 1 # processes parsing uploads, so the bot's event loop never does
+PROGRESS_INTERVAL = 5 # seconds between progress updates while a sheet is parsed
+MAX_PRICE = 10**12 # toman; anything above is a typo (extra zeros)
+INT64_LIMIT = 2.0 ** 63 # clean_prices casts to int64 only below this
+EMPTY_TEXT = ('', 'nan', 'None')
+
+
+def iter_sheet_rows(buffer, filename):
+    """
+    Yields the rows (header first) of the first sheet of an upload held in
+    a BytesIO: .xlsx through openpyxl's read-only streaming reader, .xls
+    through xlrd, .csv through the csv module. Empty cells are None.
+    """
+    name = filename.lower()
+    if name.endswith('.csv'):
+        text = io.TextIOWrapper(buffer, encoding='utf-8-sig', newline='')
+        try:
+            for row in csv.reader(text):
+                yield tuple(cell if cell.strip() else None for cell in row)
+        finally:
+            text.detach() # leave the buffer open for the caller
+    elif name.endswith('.xls'):
+        import xlrd # only needed for legacy .xls uploads
+        book = xlrd.open_workbook(file_contents=buffer.getvalue(), on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            for i in range(sheet.nrows):
+                yield tuple(None if cell == '' else cell for cell in sheet.row_values(i))
+        finally:
+            book.release_resources()
+    else:
+        from openpyxl import load_workbook
+        book = load_workbook(buffer, read_only=True, data_only=True)
+        try:
+            yield from book.worksheets[0].iter_rows(values_only=True)
+        finally:
+            book.close()
+
+
+def open_sheet(buffer, filename, batch=BATCH_ROWS):
+    """
+    Returns (column names, iterator of DataFrames of up to `batch` rows), so
+    a large sheet never has to be in memory as one frame. Blank rows are
+    skipped; short rows are padded. A frame's index is the sheet row number
+    (the header is row 1).
+    """
+    rows = iter_sheet_rows(buffer, filename)
+    columns = [str(c).strip() if c is not None else '' for c in next(rows, ())]
+
+    def frames():
+        chunk, numbers = [], []
+        for number, row in enumerate(rows, start=2):
+            if all(c is None for c in row): continue
+            chunk.append(tuple(row[:len(columns)]) + (None,) * (len(columns) - len(row)))
+            numbers.append(number)
+            if len(chunk) >= batch:
+                yield pd.DataFrame.from_records(chunk, columns=columns, index=numbers)
+                chunk, numbers = [], []
+        if chunk:
+            yield pd.DataFrame.from_records(chunk, columns=columns, index=numbers)
+
+    return columns, frames()
+
+
+def clean_prices(series, keep_text=True):
+    """
+    Parses a price column in bulk: numeric cells go through to_numeric, the
+    rest (Persian digits, separators, "تومان") through parse_price. Returns
+    an object Series of ints; cells that aren't prices keep their raw value
+    (for normalize_record to keep as display text), or become 0 without
+    keep_text. Numbers outside int64 stay floats instead of wrapping, so
+    the validator's MAX_PRICE check rejects them.
+    """
+    numeric = pd.to_numeric(series, errors="coerce")
+    ok = numeric.notna() & np.isfinite(numeric)
+    fits = ok & (numeric.astype(float).abs() < INT64_LIMIT)
+    out = series.astype(object).copy()
+    out[fits] = numeric[fits].astype("int64").astype(object)
+    out[ok & ~fits] = numeric[ok & ~fits].astype(float).astype(object)
+    rest = ~ok & series.notna()
+    if rest.any():
+        parsed = series[rest].map(parse_price)
+        found = parsed.notna()
+        values = parsed[found].astype(float)
+        fits = values.abs() < INT64_LIMIT
+        out[values.index[fits]] = parsed[found][fits].astype("int64").astype(object)
+        out[values.index[~fits]] = values[~fits].astype(object)
+        if not keep_text: out[parsed.index[~found]] = 0
+    if not keep_text: out[series.isna()] = 0
+    return out
+
+
+def text_column(series, strip=True):
+    """str() of every cell as one column, like str(row[col]) (NaN -> 'nan')."""
+    text = series.astype(str).where(series.notna(), 'nan') # None and NaN alike; pandas >= 3 keeps NA in str columns
+    return text.str.strip() if strip else text
+
+
+def build_catalog(frame, fields):
+    """
+    Builds {brand: {"models": [{"name", "variants": [...]}]}} from a frame
+    with brand, model, variant columns and the price columns in `fields`
+    (record field -> column). Brands, models and variants keep the order
+    of their first row; grouping is one groupby over (brand, model).
+    """
+    if frame.empty:
+        return {}
+    codes = frame.groupby(["brand", "model"], sort=False).ngroup().to_numpy()
+    order = codes.argsort(kind="stable")
+    codes = codes[order]
+    bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True]).tolist()
+    brands = frame["brand"].to_numpy(object)[order].tolist()
+    models = frame["model"].to_numpy(object)[order].tolist()
+    keys = ("name", *fields)
+    columns = [frame[col].to_numpy(object)[order].tolist() for col in ("variant", *fields.values())]
+    variants = [dict(zip(keys, values)) for values in zip(*columns)]
+    catalog = {}
+    for start, end in zip(bounds, bounds[1:]):
+        catalog.setdefault(brands[start], {"models": []})["models"].append({"name": models[start], "variants": variants[start:end]})
+    return catalog
+
+
+def sheet_error(row, column, message):
+    """A row-level message about an upload; row is the sheet row number (None for the whole file)."""
+    return {"row": row, "column": column, "message": message}
+
+
+class RowValidator:
+    """
+    Vectorized row checks for the batches of one price sheet: brand and
+    model present, prices numeric (or display text, with keep_text) and in
+    range, at least one price, no repeated key. Rejected rows are kept
+    with their messages for the error sheet; the first row of a key wins.
+    `names` maps frame columns to the sheet's column names for messages.
+    """
+    def __init__(self, keys, price_fields, keep_text=True, names=None):
+        self.keys = list(keys)
+        self.price_fields = list(price_fields)
+        self.keep_text = keep_text
+        self.names = names or {}
+        self.errors = [] # sheet_error dicts in row order
+        self.rejected = [] # raw rejected rows per batch, with "row" and "error" columns
+        self._seen = {} # key -> sheet row of its first valid row
+
+    def check(self, df, frame, checks=()):
+        """
+        Checks a batch: `df` is the raw sheet batch, `frame` the cleaned one
+        (same index = sheet rows). `checks` are extra (mask, column, message)
+        triples. Returns the mask of valid rows.
+        """
+        checks = list(checks)
+        checks.append((frame["brand"].isin(EMPTY_TEXT), "brand", "برند خالی است."))
+        checks.append((frame["model"].isin(EMPTY_TEXT), "model", "مدل خالی است."))
+        missing = pd.Series(True, index=frame.index)
+        for field in self.price_fields:
+            values = pd.to_numeric(frame[field], errors="coerce")
+            missing &= frame[field].isna()
+            checks.append(((values < 0) | (values > MAX_PRICE), field, "قیمت خارج از محدوده است."))
+            if not self.keep_text:
+                checks.append((values.isna() & frame[field].notna(), field, "قیمت عددی نیست."))
+        checks.append((missing, self.price_fields[0], "هیچ قیمتی وارد نشده است."))
+        bad = pd.Series(False, index=frame.index)
+        for mask, _, _ in checks: bad |= mask
+
+        # Repeated keys among the rows that passed, across batches
+        messages = {}
+        ok = frame.index[~bad]
+        for row, key in zip(ok.tolist(), zip(*(frame.loc[ok, k].tolist() for k in self.keys))):
+            first = self._seen.setdefault(key, row)
+            if first != row: messages[row] = [(self.keys[-1], f"ردیف تکراری؛ همین مورد در ردیف {first} آمده است.")]
+        if messages: bad.loc[list(messages)] = True
+
+        for mask, column, message in checks:
+            for row in frame.index[mask].tolist():
+                messages.setdefault(row, []).append((column, message))
+        for row in sorted(messages):
+            self.errors.extend(sheet_error(row, self.names.get(c, c), m) for c, m in messages[row])
+        if messages:
+            rows = sorted(messages)
+            self.rejected.append(df.loc[rows].assign(row=rows, error=["؛ ".join(m for _, m in messages[r]) for r in rows]))
+        return ~bad
+
+    def sheet(self):
+        """The rejected rows as .xlsx bytes (sheet columns plus "row" and "error"), or None."""
+        if not self.rejected:
+            return None
+        buffer = io.BytesIO()
+        pd.concat(self.rejected).to_excel(buffer, index=False, sheet_name="rejected")
+        return buffer.getvalue()
+
+
+def row_types(df):
+    """The normalized type column of a price sheet; a blank or missing type means car."""
+    if 'type' not in df.columns:
+        return pd.Series('car', index=df.index)
+    types = df['type'].astype(str).str.strip().str.lower().where(df['type'].notna(), '')
+    return types.replace('', 'car')
+
+
+def catalogs_from_frame(df, validator=None):
+    """
+    The bot's price sheet (type, brand, model, variant, factoryPrice,
+    marketPrice) -> (car catalog, mobile catalog); a catalog is None when
+    the sheet has no rows of that type. A blank type means car; rows of
+    any other type are skipped. With a validator (see sheet_validator),
+    rows it rejects are left out too.
+    """
+    types = row_types(df)
+    frame = pd.DataFrame({
+        "type": types,
+        "brand": text_column(df['brand']),
+        "model": text_column(df['model']),
+        "variant": text_column(df['variant']).replace('nan', ''),
+        "factoryPrice": clean_prices(df['factoryPrice']),
+        "marketPrice": clean_prices(df['marketPrice']),
+    }, index=df.index)
+    if validator is not None:
+        valid = validator.check(df, frame, [(~types.isin(ROW_TYPES), 'type', "نوع باید car یا mobile باشد.")])
+        frame, types = frame[valid], types[valid]
+    cars, mobiles = types == 'car', types == 'mobile'
+    return (build_catalog(frame[cars], CAR_PRICE_COLUMNS) if cars.any() else None,
+            build_catalog(frame[mobiles], MOBILE_PRICE_COLUMNS) if mobiles.any() else None)
+
+
+def sheet_validator():
+    """RowValidator for the bot's price sheet."""
+    return RowValidator(("type", "brand", "model", "variant"), ("factoryPrice", "marketPrice"))
+
+
+def catalogs_from_frames(frames, validator=None):
+    """
+    catalogs_from_frame over batches of one sheet, appended in order.
+    Returns (car catalog, mobile catalog, row count).
+    """
+    cars = mobiles = None
+    count = 0
+    for df in frames:
+        count += len(df)
+        batch_cars, batch_mobiles = catalogs_from_frame(df, validator)
+        if batch_cars is not None: cars = append_catalog(cars or {}, batch_cars)
+        if batch_mobiles is not None: mobiles = append_catalog(mobiles or {}, batch_mobiles)
+    return cars, mobiles, count
+
+
+def append_catalog(target, catalog):
+    """Appends a later batch's catalog: variants of an existing model go after the ones it has."""
+    for brand, b_data in catalog.items():
+        models = target.setdefault(brand, {"models": []})["models"]
+        by_name = {m['name']: m for m in models}
+        for model in b_data["models"]:
+            existing = by_name.get(model["name"])
+            if existing is None: models.append(model)
+            else: existing["variants"].extend(model["variants"])
+    return target
+
+
+def parse_price_sheet(data, filename):
+    """
+    Runs in a worker process: an uploaded price sheet (bytes) -> {"cars",
+    "mobiles" (normalized catalogs of the valid rows, or None), "rows",
+    "errors" (sheet_error dicts, at most MAX_SHEET_ERRORS), "error_count",
+    "rejected" (row count), "quarantine" (.xlsx bytes of the rejected rows,
+    or None), "upsert" (the upload is a corrected error sheet)}. Problems come back as errors rather than exceptions; a
+    file-level error leaves both catalogs None.
+    """
+    result = {"cars": None, "mobiles": None, "rows": 0, "errors": [], "error_count": 0, "rejected": 0, "quarantine": None, "upsert": False}
+    errors = []
+    validator = sheet_validator()
+    try:
+        columns, frames = open_sheet(io.BytesIO(data), filename)
+        missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+        result["upsert"] = "error" in columns # only the rows RowValidator.sheet() rejected earlier
+        if missing:
+            errors.extend(sheet_error(1, col, f"ستون «{col}» در سطر عنوان وجود ندارد.") for col in missing)
+        else:
+            cars, mobiles, result["rows"] = catalogs_from_frames(frames, validator)
+            result["cars"] = normalize_catalog(cars) if cars is not None else None
+            result["mobiles"] = normalize_catalog(mobiles) if mobiles is not None else None
+            errors.extend(validator.errors)
+            result["rejected"] = sum(len(r) for r in validator.rejected)
+            result["quarantine"] = validator.sheet()
+    except Exception as e:
+        result["cars"] = result["mobiles"] = None
+        errors.append(sheet_error(None, None, f"فایل قابل خواندن نیست: {e}"))
+    result["errors"], result["error_count"] = errors[:MAX_SHEET_ERRORS], len(errors)
+    return result
+
+
+_parse_pool = None
+
+
+def parse_pool():
+    global _parse_pool
+    if _parse_pool is None: _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+async def parse_price_sheet_async(data, filename, on_progress=None, interval=PROGRESS_INTERVAL):
+    """
+    parse_price_sheet in the worker pool. While it runs, `on_progress` (a
+    coroutine function) is awaited every `interval` seconds with the
+    seconds elapsed. A crashed worker is reported as a file-level error
+    and the pool is recreated on the next upload.
     """
-    Processes an Excel file to update prices.
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(parse_pool(), parse_price_sheet, data, filename)
+    start = loop.time()
+    while not future.done():
+        done, _ = await asyncio.wait({future}, timeout=interval)
+        if not done and on_progress:
+            try: await on_progress(loop.time() - start)
+            except Exception as e: logger.error(f"Excel progress update failed: {e}")
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        logger.error(f"Excel worker crashed: {e}")
+        shutdown_parse_pool()
+        return {"cars": None, "mobiles": None, "rows": 0, "errors": [sheet_error(None, None, "پردازشگر فایل متوقف شد؛ دوباره تلاش کنید.")],
+                "error_count": 1, "rejected": 0, "quarantine": None, "upsert": False}
+
+
+def merge_catalog(target, catalog):
+    """Merges a catalog into `target` in place: models and variants are matched by name, prices overwritten."""
+    for brand, b_data in catalog.items():
+        models = target.setdefault(brand, {"models": []})["models"]
+        by_name = {m['name']: m for m in models}
+        for model in b_data["models"]:
+            existing = by_name.get(model["name"])
+            if existing is None:
+                models.append(model)
+                by_name[model["name"]] = model
+                continue
+            variants = {v['name']: v for v in existing.setdefault('variants', [])}
+            for variant in model["variants"]:
+                if variant["name"] in variants: variants[variant["name"]].update(variant)
+                else:
+                    existing['variants'].append(variant)
+                    variants[variant["name"]] = variant
+
+
+UPDATE_COLUMNS = {
+    "cars": ("Brand", "Model", "Variant", "MarketPrice", "FactoryPrice"),
+    "mobile": ("Brand", "Model", "Storage", "Price"),
+}
+
+
+def read_update_sheet(file_bytes, niche, filename='update.xlsx'):
+    """
+    Runs in a worker process: an update sheet (.xlsx, .xls or .csv, read in
+    batches through open_sheet) -> {"upload" (the catalog of its valid rows
+    for `niche`, 'cars' or 'mobile'), "errors", "error_count", "rejected",
+    "quarantine"} like parse_price_sheet, or None for an unknown niche.
+    Missing columns raise ValueError.
+    """
+    if niche not in UPDATE_COLUMNS:
+        return None
+    columns, frames = open_sheet(io.BytesIO(file_bytes), filename)
+    missing = [col for col in UPDATE_COLUMNS[niche] if col not in columns]
+    if missing: raise ValueError(f"ستون‌های {'، '.join(missing)} در سطر عنوان وجود ندارد.")
+    if niche == 'cars':
+        validator = RowValidator(("brand", "model", "variant"), ("marketPrice", "factoryPrice"), keep_text=False,
+                                 names={"brand": "Brand", "model": "Model", "variant": "Variant", "marketPrice": "MarketPrice", "factoryPrice": "FactoryPrice"})
+    else:
+        validator = RowValidator(("brand", "model"), ("price",), keep_text=False,
+                                 names={"brand": "Brand", "model": "Model", "price": "Price"})
+    upload = {}
+    for df in frames:
+        if niche == 'cars':
+            frame = pd.DataFrame({
+                "brand": text_column(df['Brand'], strip=False),
+                "model": text_column(df['Model'], strip=False),
+                "variant": text_column(df['Variant'], strip=False),
+                "marketPrice": clean_prices(df['MarketPrice']),
+                "factoryPrice": clean_prices(df['FactoryPrice']),
+            })
+        else:
+            frame = pd.DataFrame({
+                "brand": text_column(df['Brand'], strip=False),
+                "model": text_column(df['Model'], strip=False),
+                "storage": text_column(df['Storage'], strip=False),
+                "price": clean_prices(df['Price']),
+            })
+        # A repeated key is rejected (across batches too), so each variant (or phone) is updated by its first row only
+        frame = frame[validator.check(df, frame)]
+        for field in validator.price_fields: frame[field] = frame[field].where(frame[field].notna(), 0)
+        if niche == 'cars':
+            append_catalog(upload, build_catalog(frame, {"marketPrice": "marketPrice", "factoryPrice": "factoryPrice"}))
+        else:
+            for brand, name, price, storage in zip(frame["brand"].tolist(), frame["model"].tolist(), frame["price"].tolist(), frame["storage"].tolist()):
+                upload.setdefault(brand, {"models": []})["models"].append({"name": name, "price": price, "storage": storage})
+    return {"upload": upload, "errors": validator.errors[:MAX_SHEET_ERRORS], "error_count": len(validator.errors),
+            "rejected": sum(len(r) for r in validator.rejected), "quarantine": validator.sheet()}
+
+
+async def process_excel_update(file_bytes, niche, on_rejected=None, store=None, filename='update.xlsx'):
+    """
+    Processes an update sheet (see read_update_sheet) to update prices.
     niche: 'cars' or 'mobile'
+    Valid rows are applied; when some are rejected, `on_rejected` (a
+    coroutine function) gets the error sheet as .xlsx bytes. `store` is the
+    bot's DatabaseManager (default: the process-wide one).
     """
     try:
-        df = pd.read_excel(io.BytesIO(file_bytes))
-        data = db.load_data()
-        
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(parse_pool(), read_update_sheet, file_bytes, niche, filename)
+        if result is None:
+            return False, "نوع فایل نامعتبر است."
+        upload = result["upload"]
+        if store is None:
+            from database_manager import get_db # not at module level: the pool's workers import this module
+            store = get_db()
+        data = store.load_data()
+
         if niche == 'cars':
-            # Expected columns: Brand, Model, Variant, MarketPrice, FactoryPrice
-            for _, row in df.iterrows():
-                brand = str(row['Brand'])
-                model = str(row['Model'])
-                variant = str(row['Variant'])
-                m_price = float(row['MarketPrice'])
-                f_price = float(row['FactoryPrice'])
-                
-                if brand not in data['car_db']:
-                    data['car_db'][brand] = {"models": []}
-                
-                # Find or create model
-                model_found = False
-                for m in data['car_db'][brand]['models']:
-                    if m['name'] == model:
-                        model_found = True
-                        # Find or create variant
-                        variant_found = False
-                        for v in m['variants']:
-                            if v['name'] == variant:
-                                v['marketPrice'] = m_price
-                                v['factoryPrice'] = f_price
-                                variant_found = True
-                                break
-                        if not variant_found:
-                            m['variants'].append({"name": variant, "marketPrice": m_price, "factoryPrice": f_price})
-                        break
-                
-                if not model_found:
-                    data['car_db'][brand]['models'].append({
-                        "name": model,
-                        "variants": [{"name": variant, "marketPrice": m_price, "factoryPrice": f_price}]
-                    })
-                    
-        elif niche == 'mobile':
-            # Expected columns: Brand, Model, Storage, Price
-            for _, row in df.iterrows():
-                brand = str(row['Brand'])
-                model = str(row['Model'])
-                storage = str(row['Storage'])
-                price = float(row['Price'])
-                
-                if brand not in data['mobile_db']:
-                    data['mobile_db'][brand] = {"models": []}
-                
-                model_found = False
-                for m in data['mobile_db'][brand]['models']:
-                    if m['name'] == model:
-                        m['price'] = price
-                        m['storage'] = storage
-                        model_found = True
-                        break
-                
-                if not model_found:
-                    data['mobile_db'][brand]['models'].append({
-                        "name": model,
-                        "price": price,
-                        "storage": storage
-                    })
-        
-        db.save_data(data)
-        return True, "بروزرسانی با موفقیت انجام شد."
+            delta = diff_catalogs(data['car_db'], upload, removals=False)
+            merge_catalog(data['car_db'], {b: upload[b] for b in delta.brands})
+        else:
+            delta = diff_catalogs(data['mobile_db'], upload, removals=False)
+            for brand in delta.brands:
+                models = data['mobile_db'].setdefault(brand, {"models": []})['models']
+                by_name = {m['name']: m for m in models}
+                for model in upload[brand]["models"]:
+                    if model["name"] in by_name: by_name[model["name"]].update(model)
+                    else: models.append(model)
+
+        if delta: store.save_data(data)
+        message = f"بروزرسانی با موفقیت انجام شد. {delta.summary()}"
+        if result["rejected"]:
+            message += f"\n{result['rejected']} ردیف به دلیل خطا رد شد."
+            if on_rejected: await on_rejected(result["quarantine"])
+        return True, message
+    except BrokenProcessPool as e:
+        logger.error(f"Excel worker crashed: {e}")
+        shutdown_parse_pool()
+        return False, "خطا در پردازش فایل: پردازشگر فایل متوقف شد؛ دوباره تلاش کنید."
     except Exception as e:
         logger.error(f"Excel processing error: {e}")
         return False, f"خطا در پردازش فایل: {str(e)}"
@@ -0,0 +1,142 @@
+"""
+Incremental HTML -> text extraction for the AI price sources.
+
+StreamingTextExtractor is fed the page chunk by chunk as it arrives and
+keeps only what the model needs: visible text outside script/style, and
+inside tables only the rows that carry a price. It sets `full` once the
+character budget is reached so the caller can stop reading the response.
+
+Only the tags that change what is kept (tr/table, script/style/..., and
+comments) are visited one by one; the text between them is cleaned of
+all other tags with a single regex substitution, and a skipped element's
+body with a single search for its end tag. A tag cut off at the end of a
+chunk is carried over to the next one.
+"""
+import re
+from html import unescape
+
+SKIP_TAGS = frozenset(("script", "style", "noscript", "svg", "template"))
+PRICE_RE = re.compile(r"\d[\d,٬.]{3,}|[۰-۹][۰-۹,٬.]{3,}|تومان|ریال")
+TAG_RE = re.compile(r"""<(?:/?[a-zA-Z][^\s/>]*[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*|!(?!--)[^>]*|\?[^>]*)>""")
+MARK_RE = re.compile(r"<!--.*?-->|<(/?)(tr|table|script|style|noscript|svg|template)(?![\w-])([^>]*)>", re.S | re.I)
+SKIP_END_RE = {tag: re.compile(rf"</{tag}[^>]*>", re.I) for tag in SKIP_TAGS}
+MAX_TAIL = 65536 # an unterminated "<x" longer than this is text, not a tag
+
+
+class StreamingTextExtractor:
+    def __init__(self, limit):
+        self.limit = limit
+        self.full = False
+        self._parts = []
+        self._size = 0
+        self._skip = None # end-tag regex of the open script/style/..., if any
+        self._tail = "" # unparsed end of the previous chunk
+        self._row = None # cells of the open <tr>, if any
+        self._text = [] # text since the last flush; a word may arrive split across chunks
+
+    def feed(self, data):
+        if self.full:
+            return
+        buf = self._tail + data
+        self._tail = ""
+        pos, end = 0, None
+        while not self.full:
+            if self._skip:
+                match = self._skip.search(buf, pos)
+                if not match:
+                    cut = buf.rfind("<", max(pos, len(buf) - 32)) # the end tag may be split across chunks
+                    if cut >= 0: self._tail = buf[cut:]
+                    return
+                self._skip = None
+                pos = match.end()
+            if end is None or end < pos: end = self._parse_end(buf, pos)
+            match = MARK_RE.search(buf, pos, end)
+            if not match:
+                break
+            if match.start() > pos: self.handle_data(buf[pos:match.start()])
+            pos = match.end()
+            if match.group(2):
+                tag = match.group(2).lower()
+                if match.group(1): self.handle_endtag(tag)
+                elif not match.group(3).endswith("/"): self.handle_starttag(tag)
+        if self.full:
+            return
+        if pos < end: self.handle_data(buf[pos:end])
+        self._tail = buf[end:]
+        if self._row is None: self._flush_text(partial=True)
+
+    @staticmethod
+    def _parse_end(buf, pos):
+        """Where the complete part of buf ends: before an unterminated tag or comment."""
+        end = len(buf)
+        cut = buf.rfind("<", pos)
+        if cut >= 0 and buf.find(">", cut) < 0: end = cut
+        cut = buf.rfind("<!--", pos)
+        if cut >= 0 and buf.find("-->", cut) < 0: end = min(end, cut)
+        return end if len(buf) - end <= MAX_TAIL else len(buf)
+
+    def handle_starttag(self, tag):
+        self._flush_text()
+        if tag in SKIP_TAGS:
+            self._skip = SKIP_END_RE[tag]
+        elif tag == "tr":
+            self._flush_row() # </tr> is optional in HTML
+            self._row = []
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag in ("tr", "table"): self._flush_row()
+
+    def handle_data(self, data):
+        if not self.full: self._text.append(TAG_RE.sub(" ", data))
+
+    def _flush_text(self, partial=False):
+        text = "".join(self._text)
+        self._text = []
+        if partial: # keep a trailing word or entity that may continue in the next chunk
+            cut = max(text.rfind(" "), text.rfind("\n"))
+            if cut < 0:
+                self._text = [text]
+                return
+            self._text = [text[cut + 1:]]
+            text = text[:cut]
+        if "&" in text: text = unescape(text)
+        text = " ".join(text.split())
+        if not text:
+            return
+        if self._row is not None: self._row.append(text)
+        else: self._emit(text)
+
+    def _flush_row(self):
+        if self._row:
+            row = " ".join(self._row)
+            if PRICE_RE.search(row): self._emit(row)
+        self._row = None
+
+    def _emit(self, text):
+        if self.full:
+            return
+        room = self.limit - self._size - (1 if self._parts else 0)
+        if len(text) >= room:
+            text = text[:max(room, 0)].rstrip()
+            self.full = True
+        if text:
+            self._parts.append(text)
+            self._size += len(text) + (1 if len(self._parts) > 1 else 0)
+
+    def close(self):
+        if self._tail and not self._skip: self.handle_data(self._tail)
+        self._tail = ""
+        self._flush_text()
+        self._flush_row()
+
+    def text(self):
+        return " ".join(self._parts)
+
+
+def extract_text(html, limit):
+    """Non-streaming helper: the extracted text of a whole document."""
+    extractor = StreamingTextExtractor(limit)
+    extractor.feed(html)
+    if not extractor.full: extractor.close()
+    return extractor.text()
@@ -9,6 +9,25 @@ INSTALL_DIR="$HOME/carbot"
 SERVICE_NAME="carbot"
 REPO_URL="https://github.com/ebaz7/iramcarbot" 
 DATA_FILE="bot_data.json"
+CATALOG_FILES="car_db_excel.json car_db_ai.json mobile_db_excel.json mobile_db_ai.json"
+
+# Server data files (all in $INSTALL_DIR):
+#   bot_data.json       settings, admins, menu; with the SQLite backend only an
+#                       import source (re-imported when it changes on disk)
+#   bot_data_users.log  the user registry of the JSON backend
+#   bot_data.db         the SQLite backend (STORAGE_BACKEND = 'sqlite' in bot.py)
+#   car_db_excel.json, car_db_ai.json, mobile_db_excel.json, mobile_db_ai.json
+#                       the price catalogs ($CATALOG_FILES); recent brand
+#                       changes sit in a journal next to each (car_db_excel.json.log,
+#                       ...) until the bot folds it in (on shutdown, before its
+#                       own backups)
+# Backups are backup_<time>.tar.gz archives holding bot_data.json as exported by
+# `python database_manager.py backup`, users included, whichever backend is in
+# use, plus the catalog files with their journals. Restore unpacks the archive
+# and puts each file back (a journal not in the archive is removed); the bot
+# folds the users into its registry (or re-imports into bot_data.db) on the
+# next start.
+# Single-file backup_<time>.json backups from older versions restore as before.
 
 # Colors
 GREEN='\033[0;32m'
@@ -78,7 +97,7 @@ function setup_environment() {
     
     source venv/bin/activate
     pip install --upgrade pip
-    pip install "python-telegram-bot[job-queue]" pandas openpyxl jdatetime google-generativeai requests
+    pip install "python-telegram-bot[job-queue]" pandas openpyxl xlrd jdatetime google-generativeai requests
 }
 
 function configure_bot() {
@@ -177,6 +196,24 @@ function create_shortcut() {
 
 # --- Backup/Restore ---
 
+function make_backup() {
+    # make_backup <archive.tar.gz>: exports the database (with its users) and packs it
+    local DEST="$1"
+    local STAGE BACKEND
+    STAGE=$(mktemp -d)
+    BACKEND=$(grep "^STORAGE_BACKEND =" "$INSTALL_DIR/bot.py" | cut -d "'" -f 2)
+    if ! (cd "$INSTALL_DIR" && "$INSTALL_DIR/venv/bin/python" database_manager.py backup "$STAGE/bot_data.json" "${BACKEND:-json}" > /dev/null); then
+        rm -rf "$STAGE"
+        return 1
+    fi
+    for FILE in $CATALOG_FILES; do
+        [ -f "$INSTALL_DIR/$FILE" ] && cp "$INSTALL_DIR/$FILE" "$STAGE/"
+        [ -f "$INSTALL_DIR/$FILE.log" ] && cp "$INSTALL_DIR/$FILE.log" "$STAGE/" # brands not yet folded into the file
+    done
+    tar -czf "$DEST" -C "$STAGE" .
+    rm -rf "$STAGE"
+}
+
 function setup_auto_backup() {
     echo -e "${BLUE}⏰ Configure Auto-Backup${NC}"
     
@@ -211,17 +248,26 @@ function setup_auto_backup() {
 #!/bin/bash
 cd "$INSTALL_DIR"
 TIMESTAMP=\$(date +"%Y%m%d_%H%M%S")
-BACKUP_FILE="backup_\$TIMESTAMP.json"
+BACKUP_FILE="backup_\$TIMESTAMP.tar.gz"
+STAGE=\$(mktemp -d)
+BACKEND=\$(grep "^STORAGE_BACKEND =" bot.py | cut -d "'" -f 2)
+
+# Exported through DatabaseManager.export_backup(), so the users and the SQLite backend are included
+if venv/bin/python database_manager.py backup "\$STAGE/bot_data.json" "\${BACKEND:-json}" > /dev/null; then
+    # Catalogs with their journals (brands not yet folded into the file)
+    for FILE in $CATALOG_FILES; do
+        [ -f "\$FILE" ] && cp "\$FILE" "\$STAGE/"
+        [ -f "\$FILE.log" ] && cp "\$FILE.log" "\$STAGE/"
+    done
+    tar -czf "\$BACKUP_FILE" -C "\$STAGE" .
 
-if [ -f "bot_data.json" ]; then
-    cp "bot_data.json" "\$BACKUP_FILE"
-    
     # Send to Telegram
     curl -s -F chat_id="$ADMIN_ID" -F document=@"\$BACKUP_FILE" -F caption="💾 Auto Backup (Every $INTERVAL hours)" "https://api.telegram.org/bot$TOKEN/sendDocument" > /dev/null
-    
+
     # Cleanup
     rm "\$BACKUP_FILE"
 fi
+rm -rf "\$STAGE"
 EOL
 
     chmod +x "$BACKUP_SCRIPT"
@@ -250,10 +296,9 @@ function do_backup() {
             BACKUP_DIR="$HOME/carbot_backups"
             mkdir -p "$BACKUP_DIR"
             TIMESTAMP=$(date +"%Y%m%d_%H%M%S")
-            DEST="$BACKUP_DIR/backup_$TIMESTAMP.json"
+            DEST="$BACKUP_DIR/backup_$TIMESTAMP.tar.gz"
             
-            if [ -f "$INSTALL_DIR/bot_data.json" ]; then
-                cp "$INSTALL_DIR/bot_data.json" "$DEST"
+            if make_backup "$DEST"; then
                 echo -e "${GREEN}✅ Backup saved to: $DEST${NC}"
                 
                 # Telegram Send
@@ -265,7 +310,7 @@ function do_backup() {
                     echo "Sent."
                 fi
             else
-                echo -e "${RED}No database found.${NC}"
+                echo -e "${RED}❌ Backup failed (is the bot installed?).${NC}"
             fi
             pause
             ;;
@@ -281,12 +326,22 @@ function do_backup() {
 function do_restore() {
     echo -e "${BLUE}📥 Restore Database (Secure)${NC}"
     echo -e "${YELLOW}⚠️  Overwrites current data!${NC}"
-    read -p "Full path to backup file: " BACKUP_PATH
+    read -p "Full path to backup file (.tar.gz or .json): " BACKUP_PATH
     
     if [ ! -f "$BACKUP_PATH" ]; then
         echo -e "${RED}❌ File not found.${NC}"
         pause; return
     fi
+
+    RESTORE_DIR=$(mktemp -d)
+    if [[ "$BACKUP_PATH" == *.tar.gz ]]; then
+        if ! tar -xzf "$BACKUP_PATH" -C "$RESTORE_DIR"; then
+            echo -e "${RED}❌ Invalid backup archive.${NC}"
+            rm -rf "$RESTORE_DIR"; pause; return
+        fi
+    else
+        cp "$BACKUP_PATH" "$RESTORE_DIR/bot_data.json" # single-file backup from an older version
+    fi
     
     # SECURITY CHECK
     echo -e "\n${YELLOW}🔐 This backup is protected. Enter credentials:${NC}"
@@ -297,7 +352,7 @@ function do_restore() {
     VERIFY=$(python3 -c "
 import json
 try:
-    with open('$BACKUP_PATH', 'r') as f:
+    with open('$RESTORE_DIR/bot_data.json', 'r') as f:
         d = json.load(f)
         if d.get('panel_user') == '$IN_USER' and d.get('panel_pass') == '$IN_PASS':
             print('OK')
@@ -309,7 +364,7 @@ except:
     
     if [ "$VERIFY" != "OK" ]; then
         echo -e "${RED}❌ ACCESS DENIED: Invalid Username or Password for this backup file.${NC}"
-        pause; return
+        rm -rf "$RESTORE_DIR"; pause; return
     fi
     
     echo -e "${GREEN}✅ Credentials Verified.${NC}"
@@ -317,15 +372,21 @@ except:
     echo "Stopping service..."
     sudo systemctl stop $SERVICE_NAME
     
-    echo "Restoring file..."
-    cp "$BACKUP_PATH" "$INSTALL_DIR/bot_data.json"
-    
-    # --- CRITICAL FIX FOR PERMISSIONS ---
-    echo "Fixing permissions..."
+    echo "Restoring files..."
     CURRENT_USER=$(whoami)
-    sudo chown $CURRENT_USER:$CURRENT_USER "$INSTALL_DIR/bot_data.json"
-    sudo chmod 644 "$INSTALL_DIR/bot_data.json"
-    # ------------------------------------
+    for FILE in $CATALOG_FILES; do
+        # A journal left from the current data would be replayed over the restored catalog
+        if [ -f "$RESTORE_DIR/$FILE" ] && [ ! -f "$RESTORE_DIR/$FILE.log" ]; then rm -f "$INSTALL_DIR/$FILE.log"; fi
+    done
+    for FILE in "$RESTORE_DIR"/*; do
+        NAME=$(basename "$FILE")
+        cp "$FILE" "$INSTALL_DIR/$NAME"
+        # --- CRITICAL FIX FOR PERMISSIONS ---
+        sudo chown $CURRENT_USER:$CURRENT_USER "$INSTALL_DIR/$NAME"
+        sudo chmod 644 "$INSTALL_DIR/$NAME"
+        echo "  $NAME"
+    done
+    rm -rf "$RESTORE_DIR"
     
     echo "Starting service..."
     sudo systemctl start $SERVICE_NAME
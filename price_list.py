@@ -0,0 +1,142 @@
+import logging
+import threading
+from prices import format_price, has_price
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_CHARS = 4000 # Telegram allows 4096 UTF-16 units per message
+MARKDOWN_ENTITIES = ("*", "_", "`")
+
+
+def render_car_list(effective_db, date):
+    """Yields the car list as blocks: the title, then one block per model."""
+    yield f"🚗 **لیست قیمت روز خودرو**\n📅 تاریخ: {date}\n"
+    for brand, b_data in effective_db.items():
+        lines = [f"\n🏢 **{brand}**", "-------------------"]
+        for model in b_data.get("models", []):
+            for variant in model.get("variants", []):
+                m_val, f_val = variant.get('marketPrice', 0), variant.get('factoryPrice', 0)
+                diff = m_val - f_val if f_val > 0 and m_val > 0 else 0
+
+                lines.append(f"🔹 **{model['name']} ({variant['name']})**")
+                lines.append(f"   🏠 کارخانه: {format_price(variant, 'factoryPrice')}")
+                lines.append(f"   🏪 بازار: {format_price(variant, 'marketPrice')}")
+                if diff > 0:
+                    lines.append(f"   📈 اختلاف: {diff:,} تومان")
+                elif diff < 0:
+                    lines.append(f"   📉 اختلاف: {diff:,} تومان")
+                lines.append("")
+            if lines: yield "\n".join(lines)
+            lines = []
+        lines.append("-------------------")
+        yield "\n".join(lines)
+
+
+def render_mobile_list(effective_db, date):
+    """Yields the mobile list as blocks: the title, then one block per model."""
+    yield f"📱 **لیست قیمت روز موبایل**\n📅 تاریخ: {date}\n"
+    for brand, b_data in effective_db.items():
+        lines = [f"\n🏷 **{brand}**", "-------------------"]
+        for model in b_data.get("models", []):
+            variants = model.get("variants", [])
+            if not variants and "price" in model:
+                # Legacy support
+                lines.append(f"🔹 {model['name']} ({model.get('storage', '-')}) ➔ {format_price(model, 'price')}")
+            for variant in variants:
+                lines.append(f"🔹 **{model['name']} ({variant['name']})**")
+                if variant.get('officialPrice', 0) > 0 or not has_price(variant, 'officialPrice'):
+                    lines.append(f"   🛡 گارانتی: {format_price(variant, 'officialPrice')}")
+                lines.append(f"   🏪 بازار: {format_price(variant, 'marketPrice')}")
+                lines.append("")
+            if lines: yield "\n".join(lines)
+            lines = []
+        lines.append("-------------------")
+        yield "\n".join(lines)
+
+
+def message_length(text):
+    """Length as Telegram counts it (UTF-16 code units)."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _split_line(line, limit):
+    """Hard-splits a line longer than `limit`, closing and reopening Markdown entities at the cut."""
+    pieces, reopen = [], ""
+    while line:
+        piece, cut = reopen + line, len(line)
+        while message_length(piece) > limit - len(MARKDOWN_ENTITIES):
+            cut = cut * 3 // 4 or 1
+            piece = reopen + line[:cut]
+            if cut == 1: break
+        line = line[cut:]
+        reopen = "".join(m for m in MARKDOWN_ENTITIES if piece.count(m) % 2)
+        pieces.append(piece + reopen[::-1])
+    return pieces
+
+
+def _balanced_pieces(block, limit):
+    """Splits an oversized block on line boundaries."""
+    for line in block.split("\n"):
+        if message_length(line) <= limit: yield line
+        else: yield from _split_line(line, limit)
+
+
+def iter_chunks(blocks, limit=MAX_MESSAGE_CHARS):
+    """
+    Packs blocks greedily into messages of at most `limit` UTF-16 units,
+    never cutting inside a block unless the block alone exceeds the limit
+    (then it is cut on lines, and long lines with Markdown balanced).
+    Blocks are joined with newlines; chunks are yielded as they fill up.
+    """
+    parts, size = [], 0
+    for block in blocks:
+        block_len = message_length(block)
+        pieces = [block] if block_len <= limit else list(_balanced_pieces(block, limit))
+        for piece in pieces:
+            piece_len = block_len if len(pieces) == 1 else message_length(piece)
+            if parts and size + 1 + piece_len > limit:
+                chunk = "\n".join(parts).strip("\n")
+                if chunk: yield chunk
+                parts, size = [], 0
+            size += piece_len + (1 if parts else 0)
+            parts.append(piece)
+    chunk = "\n".join(parts).strip("\n")
+    if chunk: yield chunk
+
+
+class RenderedList:
+    """Final message chunks of a price list, with their UTF-8 sizes in bytes."""
+    def __init__(self, chunks, version, date):
+        self.chunks = tuple(chunks)
+        self.sizes = tuple(len(c.encode('utf-8')) for c in self.chunks)
+        self.version = version
+        self.date = date
+
+
+class PriceListCache:
+    """
+    Renders a catalog's full price list into message chunks (iter_chunks)
+    once per (snapshot version, date) and serves them to every user. A new
+    snapshot (Excel upload, AI refresh, priority change) or a new day makes
+    the next get() render again.
+    """
+    def __init__(self, render):
+        self._render = render
+        self._current = None
+        self._lock = threading.Lock()
+
+    def get(self, snapshot, date):
+        current = self._current
+        if current and current.version == snapshot.version and current.date == date:
+            return current
+        with self._lock:
+            current = self._current
+            if current and current.version == snapshot.version and current.date == date:
+                return current
+            current = RenderedList(iter_chunks(self._render(snapshot, date)), snapshot.version, date)
+            self._current = current
+            logger.info(f"Price list rendered: v{snapshot.version} {date}, {len(current.chunks)} chunk(s), {sum(current.sizes)} bytes")
+            return current
+
+    def invalidate(self):
+        self._current = None
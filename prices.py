@@ -0,0 +1,87 @@
+"""
+Normalized price fields.
+
+Catalog records store every price field as an int (toman). When the source
+value isn't a number (e.g. "توافقی" or "تماس بگیرید"), the field is 0 and the
+original text is kept next to it under "<field>Text" for display. Sources are
+normalized once at ingest (Excel upload, AI refresh, loading the JSON files),
+so render paths only format integers.
+"""
+import math
+
+PRICE_FIELDS = ("marketPrice", "factoryPrice", "officialPrice", "price")
+TEXT_SUFFIX = "Text"
+
+_DIGITS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+_SEPARATORS = (",", "٬", "،", " ", "‌", "تومان")
+
+
+def parse_price(value):
+    """Returns the value as int toman, or None if it is not a number."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, str):
+        try:
+            value = float(value) # float, numpy scalars, Decimal
+        except (TypeError, ValueError):
+            return None
+        return int(value) if math.isfinite(value) else None
+    text = value.strip().translate(_DIGITS)
+    for sep in _SEPARATORS:
+        text = text.replace(sep, "")
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        num = float(text)
+    except ValueError:
+        return None
+    return int(num) if math.isfinite(num) else None
+
+
+def normalize_record(record):
+    """Normalizes the price fields of a model/variant dict in place."""
+    for field in PRICE_FIELDS:
+        if field not in record:
+            continue
+        raw = record[field]
+        value = parse_price(raw)
+        if value is not None:
+            record[field] = value
+            record.pop(field + TEXT_SUFFIX, None)
+            continue
+        record[field] = 0
+        text = "" if raw is None else str(raw).strip()
+        if text and text.lower() != "nan" and not isinstance(raw, float):
+            record[field + TEXT_SUFFIX] = text
+    return record
+
+
+def normalize_catalog(db, brands=None):
+    """Normalizes all models/variants of a catalog (brand -> {"models": [...]}) in place."""
+    for brand in (db if brands is None else brands):
+        b_data = db.get(brand)
+        if not b_data:
+            continue
+        for model in b_data.get("models", []):
+            normalize_record(model)
+            for variant in model.get("variants", []):
+                normalize_record(variant)
+    return db
+
+
+def has_price(record, field):
+    """True if the field holds a number (not display text)."""
+    return field + TEXT_SUFFIX not in record
+
+
+def format_price(record, field):
+    text = record.get(field + TEXT_SUFFIX)
+    if text is not None:
+        return text
+    return f"{record.get(field, 0):,} تومان"
@@ -0,0 +1,104 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+ANY_ADMIN = "*" # any admin role (full, editor, support)
+DENIED_TEXT = "❌ شما دسترسی ادمین ندارید."
+
+
+class Route:
+    def __init__(self, handler, roles=None, answer=True):
+        self.handler = handler
+        self.roles = roles
+        self.answer = answer
+
+    def allows(self, role):
+        if self.roles is None: return True
+        if role is None: return False
+        return self.roles == ANY_ADMIN or role == "full" or role in self.roles
+
+
+class CallbackRouter:
+    """
+    Dispatches callback_data to handlers: exact payloads via a dict, and
+    parameterized ones ("edit_menu_<key>", "paint_<idx>", ...) via a prefix
+    trie that picks the longest registered prefix. Each route declares the
+    admin roles it needs once; the user's role is resolved at most once per
+    update. Handlers are called as handler(query, context, arg), where arg is
+    the payload after the prefix ("" for exact routes).
+    Routes are answered (query.answer()) before the handler runs unless they
+    are registered with answer=False.
+    """
+    def __init__(self, role_resolver=None):
+        self.role_resolver = role_resolver
+        self._exact = {}
+        self._trie = {}
+
+    def add_exact(self, data, handler, roles=None, answer=True):
+        if data in self._exact:
+            raise ValueError(f"Duplicate callback route: {data}")
+        self._exact[data] = Route(handler, roles, answer)
+
+    def add_prefix(self, prefix, handler, roles=None, answer=True):
+        node = self._trie
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        if None in node:
+            raise ValueError(f"Duplicate callback prefix: {prefix}")
+        node[None] = Route(handler, roles, answer)
+
+    def exact(self, *payloads, roles=None, answer=True):
+        def decorator(handler):
+            for data in payloads: self.add_exact(data, handler, roles, answer)
+            return handler
+        return decorator
+
+    def prefix(self, *prefixes, roles=None, answer=True):
+        def decorator(handler):
+            for p in prefixes: self.add_prefix(p, handler, roles, answer)
+            return handler
+        return decorator
+
+    def include(self, other):
+        """Registers every route of another router (e.g. admin_panel.admin_router) here; duplicates raise."""
+        for data, route in other._exact.items():
+            self.add_exact(data, route.handler, route.roles, route.answer)
+        stack = [("", other._trie)]
+        while stack:
+            prefix, node = stack.pop()
+            for ch, child in node.items():
+                if ch is None:
+                    self.add_prefix(prefix, child.handler, child.roles, child.answer)
+                else:
+                    stack.append((prefix + ch, child))
+
+    def match(self, data):
+        """Returns (route, arg) or (None, None)."""
+        route = self._exact.get(data)
+        if route:
+            return route, ""
+        node, found, end = self._trie, None, 0
+        for i, ch in enumerate(data):
+            node = node.get(ch)
+            if node is None: break
+            if None in node: found, end = node[None], i + 1
+        if found:
+            return found, data[end:]
+        return None, None
+
+    async def dispatch(self, update, context, role_resolver=None):
+        query = update.callback_query
+        route, arg = self.match(query.data or "")
+        if route is None:
+            await query.answer()
+            return False
+        if route.roles is not None:
+            resolver = role_resolver or self.role_resolver
+            role = resolver(query.from_user.id) if resolver else None
+            if not route.allows(role):
+                await query.answer(DENIED_TEXT)
+                return False
+        if route.answer:
+            await query.answer()
+        await route.handler(query, context, arg)
+        return True
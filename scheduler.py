@@ -0,0 +1,48 @@
+import random
+import logging
+
+logger = logging.getLogger(__name__)
+
+JITTER_RATIO = 0.1 # each run lands within ±10% of the interval
+
+_generations = {} # job name -> current schedule generation
+
+
+def next_delay(hours, jitter=JITTER_RATIO):
+    return hours * 3600 * (1 + random.uniform(-jitter, jitter))
+
+
+def cancel(job_queue, name):
+    _generations[name] = _generations.get(name, 0) + 1
+    for job in job_queue.get_jobs_by_name(name):
+        job.schedule_removal()
+
+
+def schedule_periodic(job_queue, name, callback, hours, first=None, jitter=JITTER_RATIO):
+    """
+    (Re)schedules `callback(context)` on the job queue every `hours` hours,
+    replacing any earlier schedule with the same name; hours <= 0 only
+    cancels. Runs are chained with run_once so each gets a fresh jitter, and
+    a run that finishes after a reschedule doesn't revive the old chain.
+    """
+    if job_queue is None:
+        logger.error(f"No job queue; '{name}' can't be scheduled (install python-telegram-bot[job-queue])")
+        return None
+    cancel(job_queue, name)
+    if not hours or hours <= 0:
+        logger.info(f"Job '{name}' disabled")
+        return None
+    generation = _generations[name]
+
+    async def run(context):
+        try:
+            await callback(context)
+        except Exception as e:
+            logger.error(f"Scheduled job '{name}' failed: {e}")
+        finally:
+            if _generations.get(name) == generation:
+                job_queue.run_once(run, next_delay(hours, jitter), name=name)
+
+    delay = first if first is not None else next_delay(hours, jitter)
+    logger.info(f"Job '{name}' scheduled every {hours}h, first run in {delay:.0f}s")
+    return job_queue.run_once(run, delay, name=name)
@@ -0,0 +1,258 @@
+import re
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BRAND = 0
+MODEL = 1
+VARIANT = 2
+
+GRAM_SIZE = 3
+MAX_RESULTS = 15
+FUZZY_MIN_SIMILARITY = 0.3
+FUZZY_MAX_TOKENS = 10
+BK_MAX_TOKEN_LENGTH = 5
+FUZZY_MIN_QUERY_LENGTH = 3 # shorter query tokens are within one edit of most of the index
+QUERY_CACHE_SIZE = 1024
+
+# Arabic -> Persian letters, Persian/Arabic -> ASCII digits, ZWNJ/RTL marks -> space, diacritics/tatweel dropped
+_CHAR_MAP = str.maketrans({
+    "ي": "ی", "ى": "ی", "ئ": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه", "ؤ": "و",
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    "‌": " ", "‍": None, "‎": " ", "‏": " ", "ـ": None,
+    **{chr(c): None for c in range(0x064B, 0x0660)}, "ٰ": None,
+})
+_TOKEN_RE = re.compile(r"\d+|[^\W\d_]+")
+
+
+def tokenize(text):
+    """Normalized tokens; letters and digits are split ("پژو۲۰۶" -> ["پژو", "206"])."""
+    return _TOKEN_RE.findall(str(text).lower().translate(_CHAR_MAP))
+
+
+def normalize(text):
+    return " ".join(tokenize(text))
+
+
+def _grams(token):
+    return {token[i:i + GRAM_SIZE] for i in range(len(token) - GRAM_SIZE + 1)}
+
+
+def _padded_grams(token):
+    padded = f"  {token} "
+    return {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+
+
+def edit_distance(a, b, limit=None):
+    """Levenshtein distance; returns limit + 1 as soon as it must exceed `limit`."""
+    if abs(len(a) - len(b)) > (limit if limit is not None else len(a) + len(b)):
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if limit is not None and min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+class BKTree:
+    """Metric tree over words for edit-distance lookups; nodes are [word, {distance: child}]."""
+    def __init__(self, words=()):
+        self._root = None
+        for word in words: self.add(word)
+
+    def add(self, word):
+        if self._root is None:
+            self._root = [word, {}]
+            return
+        node = self._root
+        while True:
+            d = edit_distance(word, node[0])
+            if d == 0: return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = [word, {}]
+                return
+            node = child
+
+    def find(self, word, max_distance):
+        """Returns [(distance, word)] within max_distance, closest first."""
+        out, stack = [], [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            d = edit_distance(word, node[0])
+            if d <= max_distance: out.append((d, node[0]))
+            for dist, child in node[1].items():
+                if d - max_distance <= dist <= d + max_distance: stack.append(child)
+        return sorted(out)
+
+
+class SearchDoc:
+    __slots__ = ("kind", "catalog", "brand", "model", "variant", "record", "tokens")
+
+    def __init__(self, kind, catalog, brand, model, variant, record, tokens):
+        self.kind = kind
+        self.catalog = catalog
+        self.brand = brand
+        self.model = model
+        self.variant = variant
+        self.record = record
+        self.tokens = tokens # normalized tokens of brand + model + variant
+
+
+class SearchIndex:
+    """
+    Inverted index over brands, models and variants of one or more catalogs.
+    A document's text is its brand/model/variant path, so "پژو 206" finds the
+    206 model of پژو. Query tokens of GRAM_SIZE or more characters are
+    matched as substrings of index tokens through a trigram -> tokens index;
+    shorter ones as token prefixes. All query tokens must match (AND).
+    Results are ranked by match quality, then by a static rank (shorter
+    paths, brands before models before variants, catalog order) that is
+    also the doc id order, so broad queries can stop early.
+    A query token of FUZZY_MIN_QUERY_LENGTH or more characters that
+    matches nothing falls back to fuzzy matching:
+    padded-trigram similarity over the distinct tokens, then edit distance
+    through a BK-tree. Fuzzy matches score below 1, under any real match.
+    """
+    def __init__(self, catalogs):
+        """`catalogs` maps a catalog name ("cars", "mobile") to its effective DB."""
+        self.docs = []
+        for name, effective_db in catalogs.items():
+            self._collect(name, effective_db)
+        # sort is stable, so catalog order breaks ties
+        self.docs.sort(key=lambda d: (len(d.tokens), d.kind))
+        self._postings = {} # token -> [doc ids], ascending
+        self._grams = {} # trigram -> {tokens}
+        self._fuzzy_grams = {} # padded trigram -> {tokens}
+        for doc_id, doc in enumerate(self.docs):
+            for token in set(doc.tokens):
+                postings = self._postings.get(token)
+                if postings is None:
+                    self._postings[token] = postings = []
+                    for gram in _grams(token):
+                        self._grams.setdefault(gram, set()).add(token)
+                    for gram in _padded_grams(token):
+                        self._fuzzy_grams.setdefault(gram, set()).add(token)
+                postings.append(doc_id)
+        self._sorted_tokens = sorted(self._postings)
+        self._bktree = None # built on first use
+        self._cache = OrderedDict() # (query tokens, limit) -> results; dies with the index
+
+    def _collect(self, name, effective_db):
+        add = self.docs.append
+        for brand, b_data in effective_db.items():
+            brand_tokens = tuple(tokenize(brand))
+            add(SearchDoc(BRAND, name, brand, None, None, b_data, brand_tokens))
+            for model in b_data.get("models", ()):
+                model_tokens = brand_tokens + tuple(tokenize(model["name"]))
+                add(SearchDoc(MODEL, name, brand, model["name"], None, model, model_tokens))
+                for variant in model.get("variants", ()):
+                    add(SearchDoc(VARIANT, name, brand, model["name"], variant["name"], variant, model_tokens + tuple(tokenize(variant["name"]))))
+
+    def _matching_tokens(self, q):
+        """Index tokens containing q -> match quality (3 exact, 2 prefix, 1 substring)."""
+        if len(q) < GRAM_SIZE:
+            tokens, out = self._sorted_tokens, {}
+            i = bisect_left(tokens, q)
+            while i < len(tokens) and tokens[i].startswith(q):
+                out[tokens[i]] = 3 if tokens[i] == q else 2
+                i += 1
+            return out
+        sets = [self._grams.get(g) for g in _grams(q)]
+        if not all(sets):
+            return {}
+        sets.sort(key=len)
+        candidates = sets[0].intersection(*sets[1:])
+        return {t: 3 if t == q else (2 if t.startswith(q) else 1) for t in candidates if q in t}
+
+    def _fuzzy_tokens(self, q):
+        """Index tokens similar to q -> quality in (0, 1)."""
+        if len(q) < FUZZY_MIN_QUERY_LENGTH:
+            return {}
+        grams = _padded_grams(q)
+        shared = {}
+        for gram in grams:
+            for token in self._fuzzy_grams.get(gram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        scored = []
+        for token, n in shared.items():
+            similarity = n / (len(grams) + len(token) + 2 - n) # Jaccard; a token has len + 2 padded grams
+            if similarity >= FUZZY_MIN_SIMILARITY: scored.append((similarity, token))
+        if scored:
+            return {t: 0.9 * sim for sim, t in heapq.nlargest(FUZZY_MAX_TOKENS, scored)}
+        # Trigrams say little about short tokens ("سرتو" vs "سراتو"); try one edit
+        if len(q) > BK_MAX_TOKEN_LENGTH:
+            return {}
+        if self._bktree is None:
+            self._bktree = BKTree(self._sorted_tokens)
+        return {t: 0.5 * (1 - d / (len(q) + 1)) for d, t in self._bktree.find(q, 1)[:FUZZY_MAX_TOKENS]}
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Returns up to `limit` SearchDocs, best matches first. Recent queries are served from an LRU cache."""
+        key = (tuple(dict.fromkeys(tokenize(query))), limit)
+        results = self._cache.get(key)
+        if results is not None:
+            self._cache.move_to_end(key)
+            return results
+        results = self._search(key[0], limit)
+        self._cache[key] = results
+        if len(self._cache) > QUERY_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return results
+
+    def _search(self, q_tokens, limit):
+        matches = [self._matching_tokens(q) or self._fuzzy_tokens(q) for q in q_tokens]
+        if not matches or not all(matches):
+            return ()
+        # Walk the docs of the most selective query token in rank order; every
+        # other token is checked against the doc's own tokens.
+        postings = self._postings
+        matches.sort(key=lambda m: sum(len(postings[t]) for t in m))
+        driver = [postings[t] for t in matches[0]]
+        candidates = driver[0] if len(driver) == 1 else heapq.merge(*driver)
+        max_score = sum(max(m.values()) for m in matches)
+        results, perfect, last = [], 0, -1
+        for doc_id in candidates:
+            if doc_id == last:
+                continue
+            last = doc_id
+            tokens, score = self.docs[doc_id].tokens, 0
+            for m in matches:
+                quality = max(m.get(t, 0) for t in tokens)
+                if not quality: break
+                score += quality
+            else:
+                results.append((-score, doc_id))
+                if score == max_score:
+                    perfect += 1
+                    if perfect >= limit: break
+        return tuple(self.docs[doc_id] for _, doc_id in heapq.nsmallest(limit, results))
+
+
+class SearchCache:
+    """Keeps a SearchIndex for the current versions of the given catalogs, rebuilt when any of them changes."""
+    def __init__(self):
+        self._key = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self, **catalogs):
+        key = tuple((name, snap.version) for name, snap in catalogs.items())
+        if key == self._key:
+            return self._index
+        with self._lock:
+            if key != self._key:
+                index = SearchIndex(catalogs)
+                self._index, self._key = index, key
+                logger.info(f"Search index rebuilt: {len(index.docs)} docs")
+            return self._index
@@ -0,0 +1,230 @@
+"""
+Deterministic parsers for the known price pages.
+
+A parser is fed the same decoded chunks as the text extractor and turns
+the page's price tables straight into the catalog format
+({"brand": {"models": [{"name", "variants": [...]}]}}). result() returns
+None when the parse fails validation, and the refresh then falls back to
+the model. Parsers are registered per URL prefix; parser_for(url) returns
+a fresh one, or None for sites without a parser (e.g. script-rendered).
+"""
+import re
+import logging
+from html.parser import HTMLParser
+from prices import parse_price
+
+logger = logging.getLogger(__name__)
+
+MIN_VARIANTS = 5
+MIN_PRICE = 1_000_000 # toman; anything lower means the units were misread
+MAX_ROWS = 5000
+
+SKIP_TAGS = frozenset(("script", "style", "noscript", "svg", "template"))
+HEADING_TAGS = frozenset(("h1", "h2", "h3", "h4", "caption"))
+
+# Header keyword -> column role, checked in order (a "قیمت بازار" header is a price, not a name)
+PRICE_COLUMNS = {
+    "cars": (("بازار", "marketPrice"), ("کارخانه", "factoryPrice"), ("نمایندگی", "factoryPrice"), ("قیمت", "marketPrice")),
+    "mobile": (("بازار", "marketPrice"), ("رسمی", "officialPrice"), ("گارانتی", "officialPrice"), ("قیمت", "marketPrice")),
+}
+NAME_KEYWORDS = ("مدل", "نام", "خودرو", "محصول", "گوشی", "عنوان")
+BRAND_KEYWORDS = ("برند", "شرکت", "سازنده")
+UNIT_SCALES = (("میلیون", 1_000_000), ("هزار", 1000), ("ریال", 0.1))
+HEADING_STOPWORDS = frozenset(("قیمت", "روز", "امروز", "لیست", "جدید", "خودرو", "خودروهای", "محصولات",
+                               "گوشی", "گوشی‌های", "موبایل", "صفر", "بازار", "کارخانه"))
+
+_STORAGE_RE = re.compile(r"^\d+(gb|tb|گیگ)", re.IGNORECASE)
+
+
+def model_name(name, kind):
+    """
+    The model a full row name belongs to; the full name stays the variant.
+    Cars: up to the first token with a digit ("پژو 207 دنده ای" -> "پژو 207"),
+    else the first two tokens. Mobiles: everything before the storage size.
+    """
+    tokens = name.split()
+    if kind == "mobile":
+        for i, token in enumerate(tokens):
+            if i and _STORAGE_RE.match(token): return " ".join(tokens[:i])
+        return name
+    for i, token in enumerate(tokens[:3]):
+        if any(c.isdigit() for c in token): return " ".join(tokens[:i + 1])
+    return " ".join(tokens[:2])
+
+
+class PriceTableParser(HTMLParser):
+    """
+    Header-driven table parser. A row of keyword headers maps the columns
+    (name, brand, prices and their units); later rows with a name and a
+    price become variants. The brand is the brand column, else the last
+    single-cell group row of the table (ad slots, rows with a script, are
+    not groups), else the heading before it, else the first word of the
+    name.
+    """
+    def __init__(self, kind):
+        super().__init__(convert_charrefs=True)
+        self.kind = kind
+        self.rows = [] # (brand, name, {field: price})
+        self._skip = 0
+        self._heading = None # text parts of the open heading
+        self._section = None
+        self._group = None
+        self._columns = None # cell index -> (role, scale)
+        self._row = None
+        self._row_script = False # the open row holds a script (an ad slot)
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        self._separate()
+        if tag in SKIP_TAGS:
+            self._skip += 1
+            if self._row is not None: self._row_script = True
+        elif tag in HEADING_TAGS:
+            self._heading = []
+        elif tag == "table":
+            self._columns, self._group = None, None
+        elif tag == "tr":
+            self._end_row()
+            self._row, self._row_script = [], False
+        elif tag in ("td", "th") and self._row is not None:
+            self._end_cell()
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        self._separate()
+        if tag in SKIP_TAGS:
+            if self._skip: self._skip -= 1
+        elif tag in HEADING_TAGS and self._heading is not None:
+            words = "".join(self._heading).split()
+            while words and words[0] in HEADING_STOPWORDS: words.pop(0) # "قیمت خودروهای ایران خودرو"
+            if words: self._section = " ".join(words)
+            self._heading = None
+        elif tag in ("td", "th"):
+            self._end_cell()
+        elif tag in ("tr", "table"):
+            self._end_row()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._cell is not None: self._cell.append(data)
+        if self._heading is not None: self._heading.append(data)
+
+    def _separate(self):
+        # Data arrives split at chunk boundaries, so pieces are joined as-is and tags separate words
+        if self._cell is not None: self._cell.append(" ")
+        if self._heading is not None: self._heading.append(" ")
+
+    def _end_cell(self):
+        if self._cell is not None and self._row is not None:
+            self._row.append(" ".join("".join(self._cell).split()))
+        self._cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        row, self._row = self._row, None
+        if not row or len(self.rows) >= MAX_ROWS:
+            return
+        if self._columns is None or not any(parse_price(c) for c in row):
+            columns = self._header_columns(row)
+            if columns:
+                self._columns = columns
+            elif len([c for c in row if c]) == 1 and self._columns and not self._row_script:
+                self._group = next(c for c in row if c)
+            return
+        name, brand, prices = None, None, {}
+        for i, (role, scale) in self._columns.items():
+            if i >= len(row): continue
+            if role == "name": name = row[i]
+            elif role == "brand": brand = row[i]
+            else:
+                value = parse_price(row[i])
+                if value: prices[role] = int(value * scale)
+        if name and prices:
+            brand = brand or self._group or self._section or name.split()[0]
+            self.rows.append((brand, name, prices))
+
+    def _header_columns(self, row):
+        columns = {}
+        for i, cell in enumerate(row):
+            role = next((f for k, f in PRICE_COLUMNS[self.kind] if k in cell), None)
+            if role is None and any(k in cell for k in BRAND_KEYWORDS): role = "brand"
+            if role is None and any(k in cell for k in NAME_KEYWORDS): role = "name"
+            if role and role not in (r for r, _ in columns.values()):
+                scale = next((s for k, s in UNIT_SCALES if k in cell), 1)
+                columns[i] = (role, scale)
+        roles = {r for r, _ in columns.values()}
+        return columns if "name" in roles and len(roles - {"name", "brand"}) else None
+
+    def close(self):
+        super().close()
+        self._end_row()
+
+    def result(self):
+        """The parsed catalog, or None when it fails validation."""
+        if len(self.rows) < MIN_VARIANTS:
+            logger.info(f"Site parser ({self.kind}): only {len(self.rows)} rows")
+            return None
+        if any(p < MIN_PRICE for _, _, prices in self.rows for p in prices.values()):
+            logger.info(f"Site parser ({self.kind}): implausible prices")
+            return None
+        catalog, index = {}, {}
+        for brand, name, prices in self.rows:
+            add_variant(catalog, index, brand, model_name(name, self.kind), {"name": name, **prices})
+        return catalog
+
+
+def add_variant(catalog, index, brand, model, variant):
+    """
+    Adds a variant; an existing variant of the same name gets the average of
+    both prices. `index` is the caller's brand -> model name -> (model,
+    variant name -> variant) map of `catalog`, kept up to date here.
+    """
+    models = index.get(brand)
+    if models is None:
+        catalog.setdefault(brand, {"models": []})
+        models = index[brand] = {}
+    entry = models.get(model)
+    if entry is None:
+        m = {"name": model, "variants": [variant]}
+        catalog[brand]["models"].append(m)
+        models[model] = (m, {variant["name"]: variant})
+        return
+    m, variants = entry
+    v = variants.get(variant["name"])
+    if v is None:
+        m["variants"].append(variant)
+        variants[variant["name"]] = variant
+        return
+    for field, value in variant.items():
+        if field == "name": continue
+        v[field] = (v[field] + value) // 2 if v.get(field) else value
+
+
+def merge_catalogs(catalogs):
+    """Merges parsed catalogs of several sources for the same group."""
+    merged, index = {}, {}
+    for catalog in catalogs:
+        for brand, b_data in catalog.items():
+            for model in b_data["models"]:
+                for variant in model["variants"]:
+                    add_variant(merged, index, brand, model["name"], dict(variant))
+    return merged
+
+
+PARSERS = [] # (url prefix, factory returning a fresh parser)
+
+
+def register(prefix, factory):
+    PARSERS.append((prefix, factory))
+
+
+def parser_for(url):
+    for prefix, factory in PARSERS:
+        if url.startswith(prefix): return factory()
+    return None
+
+
+register("https://www.iranjib.ir/showgroup/45/", lambda: PriceTableParser("cars"))
+register("https://www.iranjib.ir/showgroup/28/", lambda: PriceTableParser("mobile"))
+register("https://www.mobile.ir/phones/prices.aspx", lambda: PriceTableParser("mobile"))
@@ -20,6 +20,7 @@ STATE_ADMIN_SET_SUPPORT = "ADM_SET_SUPPORT"
 STATE_ADMIN_SET_CHANNEL_URL = "ADM_SET_CHANNEL_URL"
 STATE_ADMIN_FJ_ID = "ADM_FJ_ID"
 STATE_ADMIN_FJ_LINK = "ADM_FJ_LINK"
+STATE_ADMIN_WAIT_EXCEL = "ADM_WAIT_EXCEL"
 STATE_ADMIN_UPLOAD_EXCEL_CARS = "ADM_UP_EXCEL_CARS"
 STATE_ADMIN_UPLOAD_EXCEL_MOBILE = "ADM_UP_EXCEL_MOBILE"
 STATE_ADMIN_ECONOMY_MENU = "ADM_ECONOMY_MENU"
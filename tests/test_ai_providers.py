@@ -0,0 +1,102 @@
+import json
+import asyncio
+import httpx
+import pytest
+from ai_providers import ChatCompletionsProvider, FakeProvider, HedgedDispatcher, ProviderError, ProviderStats
+
+
+def generate(dispatcher, prompt="prompt"):
+    return asyncio.run(dispatcher.generate(prompt))
+
+
+def test_fast_primary_is_not_hedged():
+    primary, backup = FakeProvider("a", "A"), FakeProvider("b", "B")
+    dispatcher = HedgedDispatcher([primary, backup], hedge_after=1)
+    assert generate(dispatcher) == "A"
+    assert backup.calls == 0
+    assert dispatcher.stats.hedges == 0
+    assert dispatcher.stats.counts["a"]["ok"] == 1
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    primary, backup = FakeProvider("a", "A", delay=2), FakeProvider("b", "B", delay=0.01)
+    dispatcher = HedgedDispatcher([primary, backup], hedge_after=0.05)
+    assert generate(dispatcher) == "B"
+    assert dispatcher.stats.hedges == 1
+    assert dispatcher.stats.counts["a"]["cancelled"] == 1
+    assert dispatcher.stats.counts["b"]["ok"] == 1
+
+
+def test_error_falls_back_at_once():
+    primary, backup = FakeProvider("a", error=RuntimeError("boom")), FakeProvider("b", "B")
+    dispatcher = HedgedDispatcher([primary, backup], hedge_after=60)
+    assert generate(dispatcher) == "B"
+    assert dispatcher.stats.hedges == 0
+    assert dispatcher.stats.counts["a"]["error"] == 1
+
+
+def test_timeout_counts_as_failure():
+    primary, backup = FakeProvider("a", "A", delay=2, timeout=0.05), FakeProvider("b", "B")
+    dispatcher = HedgedDispatcher([primary, backup], hedge_after=60)
+    assert generate(dispatcher) == "B"
+    assert dispatcher.stats.counts["a"]["timeout"] == 1
+
+
+def test_all_failures_raise_provider_error():
+    dispatcher = HedgedDispatcher([FakeProvider("a", error=RuntimeError("boom")), FakeProvider("b", delay=2, timeout=0.05)])
+    with pytest.raises(ProviderError) as e:
+        generate(dispatcher)
+    assert "a: boom" in str(e.value) and "b: timed out" in str(e.value)
+
+
+def test_dispatcher_needs_providers():
+    with pytest.raises(ValueError):
+        HedgedDispatcher([])
+
+
+def test_chat_completions_over_mock_transport():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        body = json.loads(request.content)
+        return httpx.Response(200, json={"choices": [{"message": {"content": body["messages"][0]["content"].upper()}}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    provider = ChatCompletionsProvider("deepseek", "https://api.example/chat", "key", "model-x", client=client)
+
+    async def go():
+        try:
+            return await HedgedDispatcher([provider]).generate("hello")
+        finally:
+            await provider.aclose()
+
+    assert asyncio.run(go()) == "HELLO"
+    assert seen[0].headers["Authorization"] == "Bearer key"
+    assert json.loads(seen[0].content)["model"] == "model-x"
+
+
+def test_http_error_falls_back():
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(503)))
+    failing = ChatCompletionsProvider("openai", "https://api.example/chat", "key", "m", client=client)
+    dispatcher = HedgedDispatcher([failing, FakeProvider("b", "B")], hedge_after=60)
+
+    async def go():
+        try:
+            return await dispatcher.generate("hello")
+        finally:
+            await dispatcher.aclose()
+
+    assert asyncio.run(go()) == "B"
+    assert dispatcher.stats.counts["openai"]["error"] == 1
+
+
+def test_stats_percentiles():
+    stats = ProviderStats(window=3)
+    for seconds in (5, 1, 2, 3):
+        stats.record("a", seconds, "ok")
+    stats.record("a", 9, "error")
+    summary = stats.summary()["a"]
+    assert (summary["ok"], summary["error"]) == (4, 1)
+    assert (summary["p50"], summary["p95"]) == (2, 3) # only the last 3 latencies are kept
+    assert stats.percentile("missing", 0.5) is None
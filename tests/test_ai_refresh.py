@@ -0,0 +1,198 @@
+import json
+import asyncio
+import httpx
+import pytest
+import ai_refresh
+from ai_refresh import SourceCache, fetch_text, run_refresh, extract_chunk, validate_catalog, split_chunks
+from ai_providers import FakeProvider
+
+CAR_URL = "https://cars.example/prices"
+MOBILE_URL = "https://mobile.example/prices"
+FIELDS = ("factoryPrice", "marketPrice")
+PAGE = "<html><body><script>var x = 1;</script><h1>قیمت</h1><p>پژو 207 دنده ای 950,000,000 تومان</p></body></html>"
+CAR_ANSWER = json.dumps({"ایران خودرو": {"models": [{"name": "پژو 207", "variants": [{"name": "دنده ای", "marketPrice": 950000000}]}]}})
+MOBILE_ANSWER = json.dumps({"Samsung": {"models": [{"name": "Galaxy A55", "variants": [{"name": "256GB", "marketPrice": 25000000}]}]}})
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(ai_refresh, "RETRY_DELAY", 0)
+
+
+class Site:
+    """MockTransport handler serving pages with ETags and answering conditional requests with 304."""
+    def __init__(self, pages):
+        self.pages = dict(pages)
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        url = str(request.url)
+        if url not in self.pages:
+            return httpx.Response(500)
+        etag = f'"{hash(self.pages[url]) & 0xffff}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, text=self.pages[url], headers={"ETag": etag})
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self))
+
+
+def answer_by_group(prompt):
+    return MOBILE_ANSWER if "موبایل" in prompt or "گوشی" in prompt else CAR_ANSWER
+
+
+def refresh(site, model, cache):
+    async def go():
+        async with site.client() as client:
+            return await run_refresh(model, "1404/01/01", client=client, cache=cache, car_url=CAR_URL, mobile_urls=(MOBILE_URL,))
+    return asyncio.run(go())
+
+
+def test_fetch_text_extracts_and_uses_validators(tmp_path):
+    site = Site({CAR_URL: PAGE})
+    cache = SourceCache(str(tmp_path / "cache.json"))
+
+    async def go():
+        async with site.client() as client:
+            first = await fetch_text(client, CAR_URL, 1000, cache)
+            second = await fetch_text(client, CAR_URL, 1000, cache)
+        return first, second
+
+    first, second = asyncio.run(go())
+    assert "پژو 207" in first[0] and "var x" not in first[0]
+    assert second == first
+    assert "If-None-Match" not in site.requests[0].headers
+    assert site.requests[1].headers["If-None-Match"]
+
+
+def test_failed_fetch_falls_back_to_cache(tmp_path):
+    site = Site({CAR_URL: PAGE})
+    cache = SourceCache(str(tmp_path / "cache.json"))
+
+    async def go():
+        async with site.client() as client:
+            first = await fetch_text(client, CAR_URL, 1000, cache)
+            del site.pages[CAR_URL]
+            return first, await fetch_text(client, CAR_URL, 1000, cache)
+
+    first, second = asyncio.run(go())
+    assert second == first
+    text, digest, parsed = asyncio.run(fetch_text(Site({}).client(), CAR_URL, 1000))
+    assert (text, digest, parsed) == (ai_refresh.FETCH_ERROR_TEXT, None, None)
+
+
+def test_unchanged_sources_skip_extraction(tmp_path):
+    site = Site({CAR_URL: PAGE, MOBILE_URL: PAGE.replace("پژو 207 دنده ای", "گوشی Galaxy A55")})
+    path = str(tmp_path / "cache.json")
+    model = FakeProvider("fake", answer_by_group)
+
+    cars, mobiles = refresh(site, model, SourceCache(path))
+    assert cars["ایران خودرو"]["models"][0]["variants"][0]["marketPrice"] == 950000000
+    assert mobiles["Samsung"]["models"][0]["name"] == "Galaxy A55"
+    calls = model.calls
+
+    # Second run against a reloaded cache: both pages answer 304, nothing is extracted again
+    assert refresh(site, model, SourceCache(path)) == (None, None)
+    assert model.calls == calls
+    assert [r.headers.get("If-None-Match") is not None for r in site.requests[-2:]] == [True, True]
+
+    # A changed page re-extracts only its group
+    site.pages[CAR_URL] = PAGE.replace("950,000,000", "990,000,000")
+    cars, mobiles = refresh(site, model, SourceCache(path))
+    assert cars is not None and mobiles is None
+    assert model.calls == calls + 1
+
+
+def test_failed_apply_is_not_marked_extracted(tmp_path):
+    site = Site({CAR_URL: PAGE, MOBILE_URL: PAGE.replace("پژو 207 دنده ای", "گوشی Galaxy A55")})
+    cache = SourceCache(str(tmp_path / "cache.json"))
+    model = FakeProvider("fake", answer_by_group)
+
+    def failing_apply(cars, mobiles): raise OSError("disk full")
+
+    async def go(apply):
+        async with site.client() as client:
+            return await run_refresh(model, "1404/01/01", client=client, cache=cache, car_url=CAR_URL, mobile_urls=(MOBILE_URL,), apply=apply)
+
+    with pytest.raises(OSError):
+        asyncio.run(go(failing_apply))
+    assert cache.extracted == {}
+    assert SourceCache(cache.path).extracted == {}
+
+    applied = []
+    cars, mobiles = asyncio.run(go(lambda cars, mobiles: applied.append((cars, mobiles))))
+    assert cars is not None and mobiles is not None and applied == [(cars, mobiles)]
+    assert set(SourceCache(cache.path).extracted) == {"cars", "mobile"}
+
+
+def test_failed_chunk_is_not_marked_extracted(tmp_path):
+    site = Site({CAR_URL: PAGE, MOBILE_URL: PAGE})
+    cache = SourceCache(str(tmp_path / "cache.json"))
+    model = FakeProvider("fake", "not json")
+    assert refresh(site, model, cache) == (None, None)
+    assert cache.extracted == {}
+    assert model.calls == 2 * ai_refresh.CHUNK_ATTEMPTS
+
+
+def test_validate_catalog_keeps_valid_part():
+    data = {
+        "B": {"models": [
+            {"name": " M ", "variants": [
+                {"name": "V1", "marketPrice": "۱,۲۰۰,۰۰۰,۰۰۰", "factoryPrice": 500},
+                {"name": "V2", "marketPrice": "توافقی"},
+                {"marketPrice": 2000000000},
+            ]},
+            {"name": "no variants"},
+        ]},
+        "C": "garbage",
+    }
+    assert validate_catalog(data, FIELDS) == {"B": {"models": [{"name": "M", "variants": [{"name": "V1", "marketPrice": 1200000000}]}]}}
+    assert validate_catalog({}, FIELDS) == {}
+    assert validate_catalog({"B": {"models": []}}, FIELDS) is None
+    assert validate_catalog(["not", "a", "catalog"], FIELDS) is None
+
+
+def test_extract_chunk_retries_invalid_answers():
+    answers = iter(["oops", "```json\n{\"B\": 1}\n```", CAR_ANSWER])
+    model = FakeProvider("fake", lambda prompt: next(answers))
+    result = asyncio.run(extract_chunk(model, "prompt", FIELDS, asyncio.Semaphore(1)))
+    assert result["ایران خودرو"]["models"][0]["name"] == "پژو 207"
+    assert model.calls == 3
+
+
+def test_extract_chunk_gives_up_after_attempts():
+    model = FakeProvider("fake", error=RuntimeError("down"))
+    assert asyncio.run(extract_chunk(model, "prompt", FIELDS, asyncio.Semaphore(1))) is None
+    assert model.calls == ai_refresh.CHUNK_ATTEMPTS
+
+
+def test_chunks_run_in_parallel_up_to_limit(monkeypatch):
+    monkeypatch.setattr(ai_refresh, "CHUNK_CHARS", 40)
+    running, peak = 0, 0
+
+    class Tracking(FakeProvider):
+        async def generate(self, prompt):
+            nonlocal running, peak
+            self.calls += 1
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return CAR_ANSWER
+
+    page = "<p>" + " ".join(f"خودرو {i} قیمت {i + 1},000,000,000" for i in range(40)) + "</p>"
+    site = Site({CAR_URL: page, MOBILE_URL: "<p></p>"})
+    model = Tracking("fake")
+    cars, _ = refresh(site, model, None)
+    assert cars is not None
+    assert model.calls > ai_refresh.MAX_PARALLEL_CHUNKS
+    assert peak == ai_refresh.MAX_PARALLEL_CHUNKS
+
+
+def test_split_chunks_prefers_brand_markers():
+    text = "سایپا " + "x " * 30 + "ایران خودرو " + "y " * 10
+    chunks = split_chunks(text, 80, ("سایپا", "ایران خودرو"))
+    assert chunks[0].startswith("سایپا") and chunks[1].startswith("ایران خودرو")
+    assert all(len(c) <= 80 for c in chunks)
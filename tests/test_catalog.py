@@ -0,0 +1,19 @@
+import json
+from catalog import CatalogFile
+
+
+def test_compact_folds_the_journal_into_the_file(tmp_path):
+    catalog_file = CatalogFile(str(tmp_path / "car_db_excel.json"))
+    db = {"سایپا": {"models": []}, "ایران خودرو": {"models": []}}
+    catalog_file.save(db)
+    db["کرمان موتور"] = {"models": [{"name": "جک J4", "variants": []}]}
+    del db["سایپا"]
+    catalog_file.save_brands(db, ["کرمان موتور", "سایپا"])
+    assert json.loads((tmp_path / "car_db_excel.json").read_text(encoding="utf-8")) != db # the change is only in the journal
+    assert catalog_file.load() == db
+
+    catalog_file.compact()
+    assert not (tmp_path / "car_db_excel.json.log").exists()
+    assert json.loads((tmp_path / "car_db_excel.json").read_text(encoding="utf-8")) == db
+    catalog_file.compact() # nothing to fold
+    assert catalog_file.load() == db
@@ -0,0 +1,74 @@
+import json
+import sqlite3
+import pytest
+from database_manager import DatabaseManager, SQLiteDatabaseManager
+
+
+@pytest.fixture
+def json_store(tmp_path):
+    """A JSON store whose users went from bot_data.json's legacy list into bot_data_users.log."""
+    data_file = tmp_path / "bot_data.json"
+    data_file.write_text(json.dumps({"users": [1, 2], "admins": [7], "roles": {"7": "support"}}), encoding="utf-8")
+    store = DatabaseManager(str(data_file))
+    data = store.load_data()
+    store.users.touch(3, now=1_700_000_000)
+    store.save_data(data)
+    assert "users" not in json.loads(data_file.read_text(encoding="utf-8"))
+    return data_file
+
+
+def test_sqlite_import_reads_the_users_log(json_store, tmp_path):
+    store = SQLiteDatabaseManager(str(tmp_path / "bot_data.db"), json_file=str(json_store))
+    data = store.load_data()
+    assert sorted(store.users) == [1, 2, 3]
+    assert store.users.seen(3) == (1_700_000_000, 1_700_000_000)
+    assert data["admins"] == [7] and data["roles"] == {"7": "support"}
+
+
+def test_import_keeps_sqlite_timestamps_and_adds_legacy_users(json_store, tmp_path):
+    store = SQLiteDatabaseManager(str(tmp_path / "bot_data.db"), json_file=str(json_store))
+    store.load_data()
+    store.users.touch(4, now=1_800_000_000)
+    json_store.write_text(json.dumps({"users": [5]}), encoding="utf-8") # e.g. a restored older file
+    store.import_json()
+    assert sorted(store.users) == [1, 2, 3, 4, 5]
+    assert store.users.seen(3) == (1_700_000_000, 1_700_000_000)
+
+
+def test_one_shot_migrator(json_store, tmp_path):
+    db_file = tmp_path / "migrated.db"
+    SQLiteDatabaseManager(str(db_file), json_file=str(json_store)).import_json(str(json_store))
+    with sqlite3.connect(db_file) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 3
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_backup_restores_users(json_store, tmp_path, backend):
+    if backend == "sqlite": store = SQLiteDatabaseManager(str(tmp_path / "bot_data.db"), json_file=str(json_store))
+    else: store = DatabaseManager(str(json_store))
+    store.load_data()
+    backup = json.loads(open(store.export_backup(str(tmp_path / "backup.json")), encoding="utf-8").read())
+    assert sorted(backup["users"]) == [1, 2, 3]
+    restored = tmp_path / "restored"
+    restored.mkdir()
+    (restored / "bot_data.json").write_text(json.dumps(backup), encoding="utf-8")
+    fresh = DatabaseManager(str(restored / "bot_data.json"))
+    fresh.load_data()
+    assert sorted(fresh.users) == [1, 2, 3]
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_admin_roles_are_cached_until_admins_change(json_store, tmp_path, backend):
+    store = DatabaseManager(str(json_store)) if backend == "json" else SQLiteDatabaseManager(str(tmp_path / "bot_data.db"), json_file=str(json_store))
+    assert store.get_admin_role(7, owner_id=1) == "support"
+    assert store.get_admin_role(1, owner_id=1) == "full"
+    store.load_data = None # a cached role must not touch the store
+    assert store.get_admin_role(7, owner_id=1) == "support" and store.get_admin_role(8, owner_id=1) is None
+    del store.load_data
+    store.add_admin(8, "editor")
+    store.add_admin(7, "full")
+    assert store.get_admin_role(8, owner_id=1) == "editor" and store.get_admin_role(7, owner_id=1) == "full"
+    store.remove_admin(7)
+    assert store.get_admin_role(7, owner_id=1) is None
+    store.invalidate()
+    assert store.get_admin_role(8, owner_id=1) == "editor"
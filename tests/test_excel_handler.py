@@ -0,0 +1,96 @@
+import io
+import os
+import sys
+import asyncio
+import subprocess
+import pandas as pd
+import pytest
+import excel_handler
+from excel_handler import read_update_sheet, process_excel_update
+
+
+def xlsx(rows, columns):
+    buffer = io.BytesIO()
+    pd.DataFrame(rows, columns=columns).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    open_sheet = excel_handler.open_sheet
+    monkeypatch.setattr(excel_handler, "open_sheet", lambda buffer, filename: open_sheet(buffer, filename, batch=2))
+
+
+def test_cars_update_across_batches(small_batches):
+    data = xlsx([["ایران خودرو", "پژو 207", "دنده ای", "935,000,000", 752000000],
+                 ["ایران خودرو", "دنا پلاس", "توربو", 1195000000, None],
+                 ["سایپا", "ساینا", "S", "۵۶۰٬۰۰۰٬۰۰۰", 478000000],
+                 ["ایران خودرو", "پژو 207", "اتوماتیک", 1290000000, 1046000000],
+                 ["ایران خودرو", "پژو 207", "دنده ای", 1, 1],
+                 [None, "تارا", "V4", 890000000, None],
+                 ["سایپا", "شاهین", "G", "نامشخص", None]],
+                ["Brand", "Model", "Variant", "MarketPrice", "FactoryPrice"])
+    result = read_update_sheet(data, "cars")
+    peugeot = result["upload"]["ایران خودرو"]["models"][0]
+    assert peugeot["name"] == "پژو 207"
+    assert peugeot["variants"] == [{"name": "دنده ای", "marketPrice": 935000000, "factoryPrice": 752000000},
+                                   {"name": "اتوماتیک", "marketPrice": 1290000000, "factoryPrice": 1046000000}]
+    assert result["upload"]["سایپا"]["models"][0]["variants"] == [{"name": "S", "marketPrice": 560000000, "factoryPrice": 478000000}]
+    assert result["rejected"] == 3
+    assert [(e["row"], e["column"]) for e in result["errors"]] == [(6, "Variant"), (7, "Brand"), (8, "MarketPrice")]
+    rejected = pd.read_excel(io.BytesIO(result["quarantine"]))
+    assert rejected["row"].tolist() == [6, 7, 8]
+
+
+def test_mobile_update_from_csv():
+    data = "Brand,Model,Storage,Price\nSamsung,Galaxy A55,256GB,\"24,990,000\"\nApple,iPhone 15,128GB,\nSamsung,Galaxy A55,128GB,1\n".encode()
+    result = read_update_sheet(data, "mobile", "update.csv")
+    assert result["upload"] == {"Samsung": {"models": [{"name": "Galaxy A55", "price": 24990000, "storage": "256GB"}]}}
+    assert [(e["row"], e["column"]) for e in result["errors"]] == [(3, "Price"), (4, "Model")]
+
+
+def test_prices_beyond_int64_are_rejected_not_wrapped():
+    prices = excel_handler.clean_prices(pd.Series([1e20, "100,000,000,000,000,000,000", 950000000, -5e19], dtype=object))
+    assert prices.tolist() == [1e20, 1e20, 950000000, -5e19]
+    data = xlsx([["Samsung", "Galaxy A55", "256GB", 1e20], ["Apple", "iPhone 15", "128GB", 64990000]],
+                ["Brand", "Model", "Storage", "Price"])
+    result = read_update_sheet(data, "mobile")
+    assert result["upload"] == {"Apple": {"models": [{"name": "iPhone 15", "price": 64990000, "storage": "128GB"}]}}
+    assert [(e["row"], e["column"], e["message"]) for e in result["errors"]] == [(2, "Price", "قیمت خارج از محدوده است.")]
+
+
+def test_unknown_niche_and_missing_columns():
+    assert read_update_sheet(b"", "bikes") is None
+    with pytest.raises(ValueError, match="Storage"):
+        read_update_sheet(xlsx([["Samsung", "A55", 1]], ["Brand", "Model", "Price"]), "mobile")
+
+
+def test_workers_do_not_import_the_database():
+    code = "import sys, excel_handler; sys.exit('database_manager' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(excel_handler.__file__))).returncode == 0
+
+
+class Store:
+    def __init__(self, data):
+        self.data, self.saved = data, 0
+
+    def load_data(self):
+        return self.data
+
+    def save_data(self, data):
+        self.saved += 1
+
+
+def test_process_excel_update_applies_valid_rows():
+    store = Store({"car_db": {"سایپا": {"models": [{"name": "ساینا", "variants": [{"name": "S", "marketPrice": 500000000}]}]}}, "mobile_db": {}})
+    data = xlsx([["سایپا", "ساینا", "S", 560000000, 478000000], [None, "تارا", "V4", 890000000, None]],
+                ["Brand", "Model", "Variant", "MarketPrice", "FactoryPrice"])
+    sheets = []
+    async def on_rejected(sheet): sheets.append(sheet)
+    try:
+        ok, message = asyncio.run(process_excel_update(data, "cars", on_rejected, store))
+    finally:
+        excel_handler.shutdown_parse_pool()
+    assert ok and "1 ردیف" in message
+    assert store.saved == 1 and len(sheets) == 1
+    assert store.data["car_db"]["سایپا"]["models"][0]["variants"] == [{"name": "S", "marketPrice": 560000000, "factoryPrice": 478000000}]
@@ -0,0 +1,40 @@
+import os
+import pytest
+from html_text import StreamingTextExtractor, extract_text
+
+# Synthetic stand-ins for the source pages (see benchmarks/bench_html.py)
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+
+
+def stream(html, limit, chunk_size):
+    extractor = StreamingTextExtractor(limit)
+    for i in range(0, len(html), chunk_size):
+        extractor.feed(html[i:i + chunk_size])
+        if extractor.full: break
+    if not extractor.full: extractor.close()
+    return extractor
+
+
+def test_skips_scripts_and_keeps_price_rows():
+    html = ("<head><style>.a>b{color:red}</style><SCRIPT>if (a<b) load('</div>');</SCRIPT></head>"
+            "<h1>قیمت&nbsp;روز</h1><!-- <tr><td>9,999,999</td></tr> --><table>"
+            "<tr><th>مدل</th><th>قیمت</th></tr><tr><td><a href='/p?a=1&b=2' title='a>b'>پژو 207</a></td><td>950,000,000</td></tr>"
+            "<tr><td>بدون قیمت</td></tr></table><svg><text>icon</text></svg><p>پایان</p>")
+    assert extract_text(html, 1000) == "قیمت روز پژو 207 950,000,000 پایان"
+
+
+@pytest.mark.parametrize("name", ["cars.html", "mobile.html"])
+def test_chunking_does_not_change_the_text(name):
+    html = open(os.path.join(FIXTURES, name), encoding="utf-8").read()
+    whole = extract_text(html, 10**7)
+    assert "window.__STATE__" not in whole and "googletag" not in whole
+    for chunk_size in (7, 1000, 16384):
+        assert stream(html, 10**7, chunk_size).text() == whole
+
+
+def test_budget_sets_full_and_stops():
+    html = "<p>" + "کلمه " * 10000 + "</p>"
+    extractor = stream(html, 100, 1000)
+    assert extractor.full
+    assert len(extractor.text()) <= 100
+    assert not extractor.text().endswith(" ")
@@ -0,0 +1,87 @@
+import pytest
+from catalog import CatalogSnapshot
+from price_list import MAX_MESSAGE_CHARS, MARKDOWN_ENTITIES, PriceListCache, iter_chunks, message_length, render_car_list
+
+TELEGRAM_LIMIT = 4096
+
+
+def car_catalog(brands=3, models=40):
+    return {f"برند {b}": {"models": [
+        {"name": f"مدل {m}", "variants": [{"name": "دنده ای", "marketPrice": 950_000_000 + m, "factoryPrice": 752_000_000},
+                                         {"name": "اتوماتیک", "marketPrice": 1_290_000_000}]}
+        for m in range(models)]} for b in range(brands)}
+
+
+def balanced(chunk):
+    return all(chunk.count(mark) % 2 == 0 for mark in MARKDOWN_ENTITIES)
+
+
+def test_blocks_are_packed_whole():
+    blocks = [f"block {i}" + "\nخط قیمت" * (i % 7) for i in range(200)]
+    chunks = list(iter_chunks(blocks, limit=300))
+    assert all(message_length(c) <= 300 for c in chunks)
+    assert "\n".join(chunks) == "\n".join(blocks).strip("\n")
+    # every chunk starts at a block
+    assert all(c.startswith("block ") for c in chunks)
+
+
+@pytest.mark.parametrize("limit", [MAX_MESSAGE_CHARS, TELEGRAM_LIMIT])
+def test_messages_at_the_limit(limit):
+    # "🚗" is two UTF-16 units, as Telegram counts it
+    exact = "🚗" * (limit // 2)
+    assert message_length(exact) == limit
+    assert list(iter_chunks([exact], limit)) == [exact]
+
+    half = "x" * ((limit - 1) // 2)
+    pair = [half, "y" * (limit - 1 - len(half))]
+    assert list(iter_chunks(pair, limit)) == ["\n".join(pair)] # joined with the newline: exactly `limit`
+    assert list(iter_chunks(pair + ["z"], limit)) == ["\n".join(pair), "z"]
+
+    over = "🚗" * (limit // 4) + "\n" + "🚗" * (limit // 4 + 1)
+    assert message_length(over) == limit + 3
+    chunks = list(iter_chunks([over], limit))
+    assert chunks == over.split("\n")
+
+
+def test_long_lines_keep_markdown_entities_balanced():
+    line = "🔹 *" + "پژو 207 " * 600 + "* `کد` _یادداشت_"
+    chunks = list(iter_chunks(["عنوان", line], limit=500))
+    assert len(chunks) > 5
+    assert all(message_length(c) <= 500 and balanced(c) for c in chunks)
+    assert all(c.startswith("*") and c.endswith("*") for c in chunks[2:-1]) # bold closed and reopened at each cut
+
+
+def test_rendered_car_list_splits_between_entries():
+    chunks = list(iter_chunks(render_car_list(car_catalog(), "1404/01/01")))
+    assert len(chunks) > 1
+    assert all(message_length(c) <= MAX_MESSAGE_CHARS and balanced(c) for c in chunks)
+    # an entry (name, factory, market, diff) never straddles two messages
+    for chunk in chunks:
+        lines = chunk.split("\n")
+        starts = [i for i, l in enumerate(lines) if l.startswith("🔹")]
+        assert all(lines[i + 2].startswith("   🏪") for i in starts)
+        assert not lines[0].startswith("   ")
+
+
+def test_cache_renders_once_per_version_and_date():
+    calls = []
+
+    def render(snapshot, date):
+        calls.append((snapshot.version, date))
+        return render_car_list(snapshot, date)
+
+    cache = PriceListCache(render)
+    v1 = CatalogSnapshot(car_catalog(1, 2), version=1)
+    first = cache.get(v1, "1404/01/01")
+    assert cache.get(v1, "1404/01/01") is first
+    assert cache.get(CatalogSnapshot(car_catalog(1, 2), version=1), "1404/01/01") is first
+    assert calls == [(1, "1404/01/01")]
+
+    v2 = CatalogSnapshot(car_catalog(1, 3), version=2)
+    second = cache.get(v2, "1404/01/01")
+    assert second is not first and second.version == 2 and "مدل 2" in "".join(second.chunks)
+    assert cache.get(v2, "1404/01/02").date == "1404/01/02"
+    cache.invalidate()
+    cache.get(v2, "1404/01/02")
+    assert calls == [(1, "1404/01/01"), (2, "1404/01/01"), (2, "1404/01/02"), (2, "1404/01/02")]
+    assert second.sizes == tuple(len(c.encode("utf-8")) for c in second.chunks)
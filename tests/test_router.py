@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from router import CallbackRouter, ANY_ADMIN, DENIED_TEXT
+
+
+class Query:
+    def __init__(self, data, user_id=1):
+        self.data = data
+        self.from_user = type("User", (), {"id": user_id})()
+        self.answers = []
+
+    async def answer(self, text=None):
+        self.answers.append(text)
+
+
+def dispatch(router, data, user_id=1):
+    query = Query(data, user_id)
+    update = type("Update", (), {"callback_query": query})()
+    handled = asyncio.run(router.dispatch(update, None))
+    return handled, query
+
+
+def test_included_routes_use_the_including_router_roles():
+    calls = []
+    panel = CallbackRouter()
+
+    @panel.exact("admin_economy_menu", roles=("full",))
+    async def economy(query, context, arg): calls.append(("economy", arg))
+
+    @panel.prefix("eco_set_", "admin_remove_", roles=ANY_ADMIN)
+    async def eco_set(query, context, arg): calls.append(("set", arg))
+
+    roles = {1: "full", 2: "editor"}
+    resolved = []
+    router = CallbackRouter(role_resolver=lambda user_id: resolved.append(user_id) or roles.get(user_id))
+    router.include(panel)
+
+    assert dispatch(router, "admin_economy_menu")[0]
+    assert dispatch(router, "eco_set_gold_18k", user_id=2)[0]
+    assert dispatch(router, "admin_remove_42", user_id=2)[0]
+    handled, query = dispatch(router, "admin_economy_menu", user_id=2)
+    assert not handled and query.answers == [DENIED_TEXT]
+    assert calls == [("economy", ""), ("set", "gold_18k"), ("set", "42")]
+    assert resolved == [1, 2, 2, 2]
+
+
+def test_include_rejects_duplicate_routes():
+    async def handler(query, context, arg): pass
+    panel = CallbackRouter()
+    panel.add_exact("admin_home", handler)
+    panel.add_prefix("menu_toggle_", handler)
+    router = CallbackRouter()
+    router.add_prefix("menu_toggle_", handler)
+    with pytest.raises(ValueError):
+        router.include(panel)
@@ -0,0 +1,24 @@
+from search import SearchIndex
+
+CARS = {
+    "پژو": {"models": [{"name": "206", "variants": [{"name": "تیپ 2"}]}, {"name": "پارس"}]},
+    "کیا": {"models": [{"name": "سراتو"}, {"name": "ریو"}]},
+    "ام وی ام": {"models": [{"name": "X22"}]},
+}
+
+
+def paths(index, query):
+    return [(d.brand, d.model, d.variant) for d in index.search(query)]
+
+
+def test_short_queries_return_only_exact_or_prefix_hits():
+    index = SearchIndex({"cars": CARS})
+    assert paths(index, "وی") == [("ام وی ام", None, None), ("ام وی ام", "X22", None)]
+    assert paths(index, "پژ")[0] == ("پژو", None, None)
+    assert paths(index, "رو") == [] # one edit from "ریو" and "ام", but too short to guess
+    assert paths(index, "ای") == []
+
+
+def test_longer_typos_still_fall_back_to_fuzzy_matching():
+    index = SearchIndex({"cars": CARS})
+    assert paths(index, "سرتو") == [("کیا", "سراتو", None)]
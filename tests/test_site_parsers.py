@@ -0,0 +1,88 @@
+import os
+import pytest
+import site_parsers
+from site_parsers import add_variant, merge_catalogs, model_name
+
+# Synthetic stand-ins for the sites' price tables, not saved copies of the live pages
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+IRANJIB_CARS = "https://www.iranjib.ir/showgroup/45/"
+IRANJIB_MOBILE = "https://www.iranjib.ir/showgroup/28/"
+MOBILE_IR = "https://www.mobile.ir/phones/prices.aspx"
+
+
+def parse(url, name, chunk_size=50):
+    """Feeds a fixture page in small chunks, as the refresh does off the socket."""
+    parser = site_parsers.parser_for(url)
+    html = open(os.path.join(FIXTURES, name), encoding="utf-8").read()
+    for i in range(0, len(html), chunk_size): parser.feed(html[i:i + chunk_size])
+    parser.close()
+    return parser.result()
+
+
+def variants(catalog, brand):
+    return {v["name"]: {k: p for k, p in v.items() if k != "name"}
+            for m in catalog[brand]["models"] for v in m["variants"]}
+
+
+def test_iranjib_cars():
+    catalog = parse(IRANJIB_CARS, "iranjib_cars.html")
+    assert list(catalog) == ["ایران خودرو", "سایپا"]
+    assert [m["name"] for m in catalog["ایران خودرو"]["models"]] == ["پژو 207", "دنا پلاس", "تارا V4"]
+    assert variants(catalog, "ایران خودرو") == {
+        "پژو 207 دنده ای": {"factoryPrice": 752_000_000, "marketPrice": 935_000_000},
+        "پژو 207 اتوماتیک پانوراما": {"factoryPrice": 1_046_000_000, "marketPrice": 1_290_000_000},
+        "دنا پلاس توربو": {"factoryPrice": 1_010_000_000, "marketPrice": 1_195_000_000},
+        "تارا V4 دنده ای": {"marketPrice": 890_000_000},
+    }
+    # "میلیون تومان" columns are scaled; the repeated ساینا S row is averaged
+    assert variants(catalog, "سایپا") == {
+        "شاهین G CVT": {"factoryPrice": 845_000_000, "marketPrice": 1_020_000_000},
+        "ساینا S": {"factoryPrice": 480_000_000, "marketPrice": 565_000_000},
+    }
+
+
+def test_iranjib_mobile():
+    catalog = parse(IRANJIB_MOBILE, "iranjib_mobile.html")
+    assert list(catalog) == ["سامسونگ", "شیائومی"]
+    assert [m["name"] for m in catalog["سامسونگ"]["models"]] == ["Galaxy A55", "Galaxy S24 Ultra"]
+    assert variants(catalog, "سامسونگ")["Galaxy A55 256GB"] == {"officialPrice": 24_300_000, "marketPrice": 24_990_000}
+    assert variants(catalog, "شیائومی") == {
+        "Redmi Note 13 128GB": {"officialPrice": 11_250_000, "marketPrice": 11_600_000},
+        "Redmi Note 13 256GB": {"officialPrice": 12_900_000, "marketPrice": 13_350_000},
+    }
+
+
+def test_mobile_ir_brand_column_and_rial():
+    catalog = parse(MOBILE_IR, "mobileir_prices.html")
+    assert list(catalog) == ["Apple", "Nokia", "Huawei"] # the "ناموجود" Xiaomi row has no price
+    assert variants(catalog, "Apple") == {"iPhone 15 128GB": {"marketPrice": 72_000_000}, "iPhone 15 256GB": {"marketPrice": 81_000_000}}
+    assert variants(catalog, "Nokia") == {"Nokia 105": {"marketPrice": 1_350_000}}
+    assert variants(catalog, "Huawei") == {"Nova 11 256GB": {"marketPrice": 18_000_000}}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100000])
+def test_chunking_does_not_change_the_catalog(chunk_size):
+    assert parse(IRANJIB_CARS, "iranjib_cars.html", chunk_size) == parse(IRANJIB_CARS, "iranjib_cars.html")
+
+
+def test_too_few_rows_fail_validation():
+    parser = site_parsers.parser_for(IRANJIB_CARS)
+    parser.feed("<table><tr><th>نام خودرو</th><th>قیمت بازار</th></tr><tr><td>پژو 207</td><td>935,000,000</td></tr></table>")
+    parser.close()
+    assert parser.result() is None
+
+
+def test_model_name():
+    assert model_name("پژو 207 دنده ای", "cars") == "پژو 207"
+    assert model_name("ساینا S", "cars") == "ساینا S"
+    assert model_name("Galaxy S24 Ultra 256GB 12GB RAM", "mobile") == "Galaxy S24 Ultra"
+
+
+def test_add_variant_and_merge():
+    catalog, index = {}, {}
+    add_variant(catalog, index, "سایپا", "ساینا S", {"name": "ساینا S", "marketPrice": 560})
+    add_variant(catalog, index, "سایپا", "ساینا S", {"name": "ساینا S", "marketPrice": 570, "factoryPrice": 480})
+    add_variant(catalog, index, "سایپا", "ساینا S", {"name": "ساینا S پلاس", "marketPrice": 600})
+    assert catalog == {"سایپا": {"models": [{"name": "ساینا S", "variants": [
+        {"name": "ساینا S", "marketPrice": 565, "factoryPrice": 480}, {"name": "ساینا S پلاس", "marketPrice": 600}]}]}}
+    assert merge_catalogs([catalog, catalog])["سایپا"] == catalog["سایپا"]
@@ -0,0 +1,228 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from array import array
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+LAST_SEEN_RESOLUTION = 3600 # seconds; last_seen is only re-persisted after this much time
+COMPACT_MIN_LINES = 10000
+
+
+class UserRegistry:
+    """
+    Append-only user registry with O(1) membership.
+    The log holds one "user_id first_seen last_seen" line per event (epoch
+    seconds); replaying it rebuilds the registry and it is compacted to one
+    line per user once it grows past twice the number of users.
+    IDs and timestamps live in compact arrays indexed by a dict, and
+    iter_chunks() walks them by position so new registrations during a long
+    broadcast are safe.
+    """
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self._index = None
+        self._ids = array('q')
+        self._first = array('q')
+        self._last = array('q')
+        self._log_lines = 0
+        self._fh = None
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        if self._index is not None:
+            return
+        with self._lock:
+            if self._index is not None:
+                return
+            self._index = {}
+            if os.path.exists(self.log_file):
+                with open(self.log_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        parts = line.split()
+                        if len(parts) != 3:
+                            continue
+                        try:
+                            uid, first, last = int(parts[0]), int(parts[1]), int(parts[2])
+                        except ValueError:
+                            continue
+                        self._log_lines += 1
+                        idx = self._index.get(uid)
+                        if idx is None:
+                            self._add(uid, first, last)
+                        elif last > self._last[idx]:
+                            self._last[idx] = last
+            if self._log_lines > max(COMPACT_MIN_LINES, 2 * len(self._ids)):
+                self.compact()
+
+    def _add(self, uid, first, last):
+        self._index[uid] = len(self._ids)
+        self._ids.append(uid)
+        self._first.append(first)
+        self._last.append(last)
+
+    def _append(self, lines):
+        if self._fh is None:
+            self._fh = open(self.log_file, 'a', encoding='utf-8')
+        self._fh.write("".join(lines))
+        self._fh.flush()
+        self._log_lines += len(lines)
+        if self._log_lines > max(COMPACT_MIN_LINES, 2 * len(self._ids)):
+            self.compact()
+
+    def touch(self, user_id, now=None):
+        """Registers a user or refreshes their last_seen. Returns True for new users."""
+        self._ensure_loaded()
+        now = int(now if now is not None else time.time())
+        with self._lock:
+            idx = self._index.get(user_id)
+            if idx is None:
+                self._add(user_id, now, now)
+                self._append([f"{user_id} {now} {now}\n"])
+                return True
+            if now - self._last[idx] >= LAST_SEEN_RESOLUTION:
+                self._last[idx] = now
+                self._append([f"{user_id} {self._first[idx]} {now}\n"])
+            return False
+
+    def add_many(self, user_ids, now=None):
+        """Bulk-imports IDs (e.g. a legacy "users" list); existing IDs are left untouched."""
+        self._ensure_loaded()
+        now = int(now if now is not None else time.time())
+        with self._lock:
+            lines = []
+            for value in user_ids:
+                try:
+                    uid = int(value)
+                except (TypeError, ValueError):
+                    continue
+                if uid not in self._index:
+                    self._add(uid, now, now)
+                    lines.append(f"{uid} {now} {now}\n")
+            if lines:
+                self._append(lines)
+            return len(lines)
+
+    def compact(self):
+        """Rewrites the log with a single line per user."""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            temp_file = f"{self.log_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                for i in range(len(self._ids)):
+                    f.write(f"{self._ids[i]} {self._first[i]} {self._last[i]}\n")
+            shutil.move(temp_file, self.log_file)
+            self._log_lines = len(self._ids)
+            logger.info(f"User registry compacted: {self._log_lines} users")
+
+    def seen(self, user_id):
+        """Returns (first_seen, last_seen) epoch seconds, or None for unknown users."""
+        self._ensure_loaded()
+        idx = self._index.get(user_id)
+        return None if idx is None else (self._first[idx], self._last[idx])
+
+    def __contains__(self, user_id):
+        self._ensure_loaded()
+        return user_id in self._index
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._ids)
+
+    def iter_chunks(self, size=CHUNK_SIZE):
+        """Yields user IDs in lists of at most `size` items."""
+        self._ensure_loaded()
+        pos = 0
+        while pos < len(self._ids):
+            yield self._ids[pos:pos + size].tolist()
+            pos += size
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            yield from chunk
+
+    def records(self):
+        """Yields (user_id, first_seen, last_seen) for every user, e.g. to move the registry to another backend."""
+        self._ensure_loaded()
+        for i in range(len(self._ids)):
+            yield self._ids[i], self._first[i], self._last[i]
+
+
+class SQLiteUserRegistry:
+    """Same API as UserRegistry, backed by the `users` table of the SQLite backend."""
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+        self._count = None
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def touch(self, user_id, now=None):
+        now = int(now if now is not None else time.time())
+        with self._lock:
+            cur = self._conn.execute("INSERT OR IGNORE INTO users(user_id, first_seen, last_seen) VALUES (?, ?, ?)", (user_id, now, now))
+            if cur.rowcount:
+                if self._count is not None: self._count += 1
+                return True
+            self._conn.execute("UPDATE users SET last_seen = ? WHERE user_id = ? AND last_seen <= ?", (now, user_id, now - LAST_SEEN_RESOLUTION))
+            return False
+
+    def add_many(self, user_ids, now=None):
+        now = int(now if now is not None else time.time())
+        rows = []
+        for value in user_ids:
+            try:
+                rows.append((int(value), now, now))
+            except (TypeError, ValueError):
+                continue
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO users(user_id, first_seen, last_seen) VALUES (?, ?, ?)", rows)
+            added = self._conn.total_changes - before
+            self._count = None
+            return added
+
+    def add_records(self, records):
+        """Imports (user_id, first_seen, last_seen) rows; a known user keeps the earliest first_seen and latest last_seen."""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT INTO users(user_id, first_seen, last_seen) VALUES (?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                                   "first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)", records)
+            self._count = None
+            return self._conn.total_changes - before
+
+    def seen(self, user_id):
+        row = self._execute("SELECT first_seen, last_seen FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def __contains__(self, user_id):
+        return self._execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self._execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        return self._count
+
+    def iter_chunks(self, size=CHUNK_SIZE):
+        last_id = None
+        while True:
+            if last_id is None:
+                rows = self._execute("SELECT user_id FROM users ORDER BY user_id LIMIT ?", (size,)).fetchall()
+            else:
+                rows = self._execute("SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (last_id, size)).fetchall()
+            if not rows:
+                return
+            chunk = [row[0] for row in rows]
+            yield chunk
+            last_id = chunk[-1]
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            yield from chunk